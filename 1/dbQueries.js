@@ -1,4 +1,5 @@
 import Database from 'better-sqlite3';
+import { existsSync } from 'fs';
 import { fileURLToPath } from 'url';
 import { dirname, join } from 'path';
 
@@ -6,10 +7,19 @@ const __filename = fileURLToPath(import.meta.url);
 const __dirname = dirname(__filename);
 
 const DB_PATH = process.env.DB_PATH || join(__dirname, '../Database/my_records.db');
+// Read-only copy published by the Python tools after every ingest
+// (DatabaseManager.publish_snapshot); reading it never contends with writers
+const SNAPSHOT_PATH = process.env.DB_SNAPSHOT_PATH || DB_PATH.replace(/\.db$/, '') + '.snapshot.db';
 
-// Initialize database connection
+// Initialize database connection (the snapshot if one has been published)
 function getDb() {
-    return new Database(DB_PATH, { readonly: true });
+    if (!existsSync(SNAPSHOT_PATH)) {
+        return new Database(DB_PATH, { readonly: true });
+    }
+    const db = new Database(SNAPSHOT_PATH, { readonly: true, fileMustExist: true });
+    db.pragma('query_only = ON');
+    db.pragma('mmap_size = 268435456');
+    return db;
 }
 
 /**
@@ -18,6 +28,28 @@ function getDb() {
 export function searchByLocation(city, state) {
     const db = getDb();
     try {
+        // Databases migrated by the Python tools have indexed city/state columns
+        const hasCityColumns = db.prepare('PRAGMA table_info(records)').all()
+            .some(column => column.name === 'city_key');
+
+        if (hasCityColumns) {
+            // Same folding as city_key() in database_manager.py
+            const cityKey = (city || '')
+                .normalize('NFKD')
+                .replace(/[\u0300-\u036f]/g, '')
+                .toLowerCase()
+                .replace(/[^\p{L}\p{N}\s]|_/gu, ' ')
+                .trim()
+                .split(/\s+/)
+                .join(' ');
+            const query = `
+                SELECT * FROM records
+                WHERE city_key = ? OR state = ?
+                ORDER BY name
+            `;
+            return db.prepare(query).all(cityKey, (state || '').trim().toUpperCase());
+        }
+
         const query = `
             SELECT * FROM records
             WHERE location LIKE ? OR location LIKE ?
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Batch Crawl
+Finds food opportunities for many cities concurrently and saves them through a single database writer
+
+Usage: python batch_crawl.py [cities_file] [--concurrency N] [--count N] [--no-cache]
+"""
+
+import asyncio
+import sys
+import time
+from typing import Dict, Iterable, List, Optional
+
+from database_manager import city_key
+from food_opportunities_finder import FoodOpportunitiesFinder
+
+
+def read_city_list(filename: str) -> List[str]:
+    """
+    Read a city list file: one city per line, blank lines and '#' comments ignored
+
+    Args:
+        filename: Path to the city list file
+
+    Returns:
+        Cities in file order, with duplicates (by normalized name) removed
+    """
+    cities = []
+    seen = set()
+    with open(filename, 'r', encoding='utf-8') as f:
+        for line in f:
+            city = line.split('#', 1)[0].strip()
+            if city and city_key(city) not in seen:
+                seen.add(city_key(city))
+                cities.append(city)
+    return cities
+
+
+async def crawl_cities(finder: FoodOpportunitiesFinder, cities: Iterable[str], num_opportunities: int = 10,
+                       concurrency: int = 8, use_cache: bool = None) -> Dict[str, Optional[int]]:
+    """
+    Query Claude for many cities concurrently and save the results
+
+    At most `concurrency` API requests are in flight at once. Each response
+    is parsed as soon as it arrives and handed to one writer task, so the
+    database only ever sees a single writer. A city whose query, parsing or
+    save fails is logged and reported as failed; the others carry on.
+
+    Args:
+        finder: Finder providing the API key, cache, parser and database
+        cities: Cities to crawl
+        num_opportunities: Number of opportunities to request per city
+        concurrency: Maximum number of simultaneous API requests
+        use_cache: Override the finder's use_cache setting
+
+    Returns:
+        City -> number of saved records (None if the query or parsing failed)
+
+    Raises:
+        ValueError: If concurrency is below 1 (nothing could ever run)
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+    cities = list(cities)
+    semaphore = asyncio.Semaphore(concurrency)
+    parsed = asyncio.Queue()
+    results = {}
+    start = time.perf_counter()
+
+    async def fetch(city):
+        # Every city hands the writer exactly one entry, so one failure can
+        # neither abort the crawl nor leave the writer waiting
+        opportunities = []
+        try:
+            async with semaphore:
+                response = await finder.query_claude_for_food_opportunities_async(
+                    city, num_opportunities, use_cache
+                )
+            opportunities = finder.parse_opportunities_from_response(response) if response else []
+        except Exception as e:
+            print(f"❌ {city}: {type(e).__name__}: {e}")
+        finally:
+            await parsed.put((city, opportunities))
+
+    async def writer():
+        for done in range(1, len(cities) + 1):
+            city, opportunities = await parsed.get()
+            saved = None
+            if opportunities:
+                try:
+                    # The sqlite calls block, so run them off the event loop
+                    record_ids = await asyncio.to_thread(finder.save_opportunities_to_database,
+                                                         opportunities, city)
+                    saved = len(record_ids)
+                except Exception as e:
+                    print(f"❌ {city}: could not save: {e}")
+            results[city] = saved
+
+            status = f"{saved} saved" if saved is not None else "failed"
+            print(f"[{done}/{len(cities)}] {city}: {status} ({time.perf_counter() - start:.1f}s)")
+
+    await asyncio.gather(writer(), *(fetch(city) for city in cities))
+    return results
+
+
+def main():
+    """Command line entry point"""
+    args = sys.argv[1:]
+    if not args or args[0].startswith('--'):
+        print(__doc__)
+        return
+
+    filename = args[0]
+    concurrency = 8
+    num_opportunities = 10
+    try:
+        if "--concurrency" in args:
+            concurrency = int(args[args.index("--concurrency") + 1])
+        if "--count" in args:
+            num_opportunities = int(args[args.index("--count") + 1])
+        if concurrency < 1 or num_opportunities < 1:
+            raise ValueError
+    except (IndexError, ValueError):
+        print("❌ Error: --concurrency and --count need a number of at least 1")
+        return
+
+    try:
+        cities = read_city_list(filename)
+    except FileNotFoundError:
+        print(f"❌ File not found: {filename}")
+        return
+
+    finder = FoodOpportunitiesFinder(use_cache="--no-cache" not in args)
+
+    print(f"Crawling {len(cities)} cities with up to {concurrency} concurrent requests...")
+    start = time.perf_counter()
+    results = asyncio.run(crawl_cities(finder, cities, num_opportunities, concurrency))
+
+    failed = [city for city, saved in results.items() if saved is None]
+    saved = sum(count for count in results.values() if count)
+    print(f"\n✅ Saved {saved} opportunities for {len(cities) - len(failed)} cities "
+          f"in {time.perf_counter() - start:.1f}s")
+    if failed:
+        print(f"❌ {len(failed)} cities failed: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
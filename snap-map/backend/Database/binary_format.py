@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Binary Format
+Compact, versioned binary encoding of records for the map client, plus a
+reader used to check round trips (the browser decoder is src/snapBinary.js)
+
+Layout (all integers little-endian; "varint" is unsigned LEB128):
+
+    header      magic b"SNAP", version u8, flags u8, reserved u16,
+                record count u32, string count u32 (entries, not bytes)
+    strings     interned city/state/ZIP/tag values, each a varint byte
+                length followed by UTF-8 bytes
+    columns     one column after another, `count` entries each:
+                  id                       zigzag varint delta from the previous id
+                  name, link, location,
+                  description              `count` varint (byte length + 1), 0 = NULL,
+                                           then the column's UTF-8 bytes back to back
+                  created_at, updated_at   varint 0 = NULL, otherwise zigzag delta of
+                                           Unix seconds from the previous value, + 1
+                  city, state, zip_code    varint (string index + 1), 0 = NULL
+                  tags                     varint tag count, then a varint string index per tag
+                  latitude, longitude      only with FLAG_COORDINATES: i32 microdegrees,
+                                           -2^31 = NULL
+
+Strings are length-prefixed, so nothing is quoted or escaped, and repeated
+city/state/tag values are stored once. Each text column's bytes are kept
+together so HTTP compression sees similar text side by side. Timestamps keep SQLite's
+"YYYY-MM-DD HH:MM:SS" (UTC) form at one-second resolution; a timestamp that
+cannot be parsed in that form is encoded as NULL rather than passed through.
+Coordinates are rounded to 6 decimal places (about 0.1 m).
+"""
+
+import struct
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+MAGIC = b"SNAP"
+FORMAT_VERSION = 1
+
+# Header flag bits
+FLAG_COORDINATES = 1
+
+HEADER = struct.Struct('<4sBBHII')
+
+# Order of the values in each encoded / decoded record
+BINARY_COLUMNS = ('id', 'name', 'link', 'location', 'description', 'created_at', 'updated_at',
+                  'city', 'state', 'zip_code', 'tags', 'latitude', 'longitude')
+
+TEXT_COLUMNS = 4       # name, link, location, description
+INTERNED_COLUMNS = 3   # city, state, zip_code
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+COORDINATE_SCALE = 1_000_000
+MISSING_COORDINATE = -2 ** 31
+COORDINATES = struct.Struct('<i')
+
+
+def _varint(value: int, out: bytearray):
+    """Append an unsigned LEB128 integer"""
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, position: int) -> Tuple[int, int]:
+    """Read an unsigned LEB128 integer, returning (value, next position)"""
+    value = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+def _zigzag(value: int) -> int:
+    """Map a signed integer to an unsigned one (0, -1, 1, -2 -> 0, 1, 2, 3)"""
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+
+def _unzigzag(value: int) -> int:
+    """Inverse of _zigzag"""
+    return -((value + 1) >> 1) if value & 1 else value >> 1
+
+
+def _timestamp_seconds(value: Optional[str]) -> Optional[int]:
+    """Unix seconds of a SQLite timestamp (None for NULL or unparsable values)"""
+    if not value:
+        return None
+    try:
+        moment = datetime.strptime(value[:19], TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+    return int(moment.timestamp())
+
+
+def _timestamp_text(value: int) -> str:
+    """Inverse of _timestamp_seconds"""
+    return datetime.fromtimestamp(value, timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+
+def _coordinate(value: Optional[float]) -> int:
+    """Microdegrees of a coordinate (MISSING_COORDINATE for NULL)"""
+    return MISSING_COORDINATE if value is None else int(round(value * COORDINATE_SCALE))
+
+
+def encode_records(rows: Iterable[Tuple], coordinates: bool = True) -> bytes:
+    """
+    Encode records in the binary format
+
+    Args:
+        rows: Tuples in BINARY_COLUMNS order; tags are a space-separated
+              string (as TAGS_SQL returns). Latitude and longitude may be
+              left out when coordinates is False.
+        coordinates: Include the latitude/longitude columns (they are left
+                     out anyway when every record lacks them)
+
+    Returns:
+        The encoded bytes
+    """
+    return b''.join(encode_parts(rows, coordinates)[1])
+
+
+def encode_parts(rows: Iterable[Tuple], coordinates: bool = True) -> Tuple[int, List[bytes]]:
+    """
+    Encode records in the binary format as a list of pieces to write in order
+
+    Rows are consumed one at a time (an iterator is never materialized),
+    and the pieces are the encoded columns themselves, so writing them with
+    file.writelines() never holds a second copy of the whole file.
+
+    Args:
+        rows: Same as encode_records
+        coordinates: Same as encode_records
+
+    Returns:
+        (number of records, pieces whose concatenation is the file)
+    """
+    strings = {}
+    ids = bytearray()
+    lengths = [bytearray() for _ in range(TEXT_COLUMNS)]
+    texts = [bytearray() for _ in range(TEXT_COLUMNS)]
+    stamps = [bytearray() for _ in range(2)]
+    interned = [bytearray() for _ in range(INTERNED_COLUMNS)]
+    tag_column = bytearray()
+    latitudes, longitudes = bytearray(), bytearray()
+    has_coordinates = False
+    # Records imported together share timestamps, so parse each text once
+    seconds_of = {}
+
+    def intern(value: str) -> int:
+        index = strings.get(value)
+        if index is None:
+            index = strings[value] = len(strings)
+        return index
+
+    count = 0
+    previous_id = 0
+    previous_stamps = [0, 0]
+    for row in rows:
+        count += 1
+        record_id = row[0]
+        _varint(_zigzag(record_id - previous_id), ids)
+        previous_id = record_id
+
+        for column_lengths, column, value in zip(lengths, texts, row[1:5]):
+            if value is None:
+                column_lengths.append(0)
+            else:
+                encoded = value.encode('utf-8')
+                _varint(len(encoded) + 1, column_lengths)
+                column += encoded
+
+        for index, value in enumerate(row[5:7]):
+            if value in seconds_of:
+                seconds = seconds_of[value]
+            else:
+                seconds = seconds_of[value] = _timestamp_seconds(value)
+            if seconds is None:
+                stamps[index].append(0)
+            else:
+                _varint(_zigzag(seconds - previous_stamps[index]) + 1, stamps[index])
+                previous_stamps[index] = seconds
+
+        for column, value in zip(interned, row[7:10]):
+            _varint(0 if value is None else intern(value) + 1, column)
+
+        tags = row[10].split() if row[10] else []
+        _varint(len(tags), tag_column)
+        for tag in tags:
+            _varint(intern(tag), tag_column)
+
+        if coordinates:
+            has_coordinates = has_coordinates or row[11] is not None or row[12] is not None
+            latitudes += COORDINATES.pack(_coordinate(row[11]))
+            longitudes += COORDINATES.pack(_coordinate(row[12]))
+
+    # Coordinates are left out entirely when no record has any
+    out = bytearray(HEADER.pack(MAGIC, FORMAT_VERSION, FLAG_COORDINATES if has_coordinates else 0,
+                                0, count, len(strings)))
+    for value in strings:
+        encoded = value.encode('utf-8')
+        _varint(len(encoded), out)
+        out += encoded
+    parts = [out, ids]
+    for column_lengths, column in zip(lengths, texts):
+        parts += [column_lengths, column]
+    parts += stamps + interned + [tag_column]
+    if has_coordinates:
+        parts += [latitudes, longitudes]
+    return count, parts
+
+
+def decode_records(data: bytes) -> Dict:
+    """
+    Decode bytes written by encode_records
+
+    Args:
+        data: Encoded records
+
+    Returns:
+        {'version': ..., 'coordinates': bool, 'records': [tuples in
+        BINARY_COLUMNS order]}; latitude/longitude are None when the file
+        has no coordinates
+
+    Raises:
+        ValueError: If the data is not in this format or is a newer version
+    """
+    if len(data) < HEADER.size:
+        raise ValueError("Not a binary records file (too short)")
+    magic, version, flags, _, count, string_count = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a binary records file (bad magic)")
+    if version > FORMAT_VERSION:
+        raise ValueError(f"Binary records version {version} is newer than supported ({FORMAT_VERSION})")
+
+    position = HEADER.size
+    strings = []
+    for _ in range(string_count):
+        length, position = _read_varint(data, position)
+        strings.append(data[position:position + length].decode('utf-8'))
+        position += length
+
+    ids = []
+    record_id = 0
+    for _ in range(count):
+        value, position = _read_varint(data, position)
+        record_id += _unzigzag(value)
+        ids.append(record_id)
+
+    texts = []
+    for _ in range(TEXT_COLUMNS):
+        lengths = []
+        for _ in range(count):
+            length, position = _read_varint(data, position)
+            lengths.append(length)
+        column = []
+        for length in lengths:
+            if length:
+                column.append(data[position:position + length - 1].decode('utf-8'))
+                position += length - 1
+            else:
+                column.append(None)
+        texts.append(column)
+
+    stamps = []
+    for _ in range(2):
+        column = []
+        seconds = 0
+        last_seconds = last_text = None
+        for _ in range(count):
+            value, position = _read_varint(data, position)
+            if value:
+                seconds += _unzigzag(value - 1)
+                if seconds != last_seconds:
+                    last_seconds, last_text = seconds, _timestamp_text(seconds)
+                column.append(last_text)
+            else:
+                column.append(None)
+        stamps.append(column)
+
+    interned = []
+    for _ in range(INTERNED_COLUMNS):
+        column = []
+        for _ in range(count):
+            index, position = _read_varint(data, position)
+            column.append(strings[index - 1] if index else None)
+        interned.append(column)
+
+    tags = []
+    for _ in range(count):
+        tag_count, position = _read_varint(data, position)
+        names = []
+        for _ in range(tag_count):
+            index, position = _read_varint(data, position)
+            names.append(strings[index])
+        tags.append(' '.join(names) if names else None)
+
+    has_coordinates = bool(flags & FLAG_COORDINATES)
+    latitudes = longitudes = [None] * count
+    if has_coordinates:
+        values = struct.unpack_from(f'<{2 * count}i', data, position)
+        latitudes, longitudes = [
+            [None if value == MISSING_COORDINATE else value / COORDINATE_SCALE for value in part]
+            for part in (values[:count], values[count:])
+        ]
+
+    records = list(zip(ids, *texts, *stamps, *interned, tags, latitudes, longitudes))
+    return {'version': version, 'coordinates': has_coordinates, 'records': records}
+
+
+def read_binary(path: str) -> List[Tuple]:
+    """
+    Read a binary records file
+
+    Args:
+        path: File written by DatabaseManager.export_to_binary (or a .bin shard)
+
+    Returns:
+        Record tuples in BINARY_COLUMNS order
+    """
+    with open(path, 'rb') as f:
+        return decode_records(f.read())['records']
@@ -6,62 +6,1206 @@ Creates and manages a database with records containing: Name, Link, Location, De
 
 import sqlite3
 import os
+import atexit
+import itertools
+import json
+import math
+import queue
+import re
+import threading
+import unicodedata
+import weakref
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Tuple, Optional
+from typing import Iterable, Iterator, List, Tuple, Optional
+
+from db_metrics import (DEFAULT_SLOW_QUERY_MS, Metrics, TimedConnection, clear_metrics,
+                        default_metrics_path, instrumented, load_metrics, merge_snapshots,
+                        open_metrics_db, save_metrics)
+
+
+# Stored in PRAGMA user_version once create_database() has set up the schema.
+# Bump it whenever create_database() changes, so existing files are upgraded.
+SCHEMA_VERSION = 6
+
+# PRAGMAs applied to every pooled connection when it is opened
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",        # readers don't block the writer (and vice versa)
+    "synchronous": "NORMAL",      # safe with WAL, avoids an fsync per commit
+    "temp_store": "MEMORY",
+    "cache_size": -16000,         # ~16 MB page cache per connection
+    "mmap_size": 134217728,       # 128 MB memory-mapped I/O
+    "busy_timeout": 5000,         # wait up to 5s on a locked database
+}
+
+# PRAGMAs for read-only snapshot connections: the file never changes once
+# published, so pages can be mapped (and shared) straight from the OS cache
+SNAPSHOT_PRAGMAS = {
+    "query_only": "ON",
+    "temp_store": "MEMORY",
+    "cache_size": -16000,
+    "mmap_size": 1073741824,      # 1 GB memory-mapped I/O
+}
+
+# Snapshot file published next to a database (my_records.db -> my_records.snapshot.db)
+SNAPSHOT_SUFFIX = ".snapshot.db"
+
+# Number of compiled statements kept per connection
+STATEMENT_CACHE_SIZE = 256
+
+# Words extracted from a search term for full-text queries
+SEARCH_WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# US state / territory abbreviations recognized when parsing addresses
+US_STATES = {
+    'AL', 'AK', 'AZ', 'AR', 'CA', 'CO', 'CT', 'DE', 'DC', 'FL', 'GA', 'HI', 'ID', 'IL',
+    'IN', 'IA', 'KS', 'KY', 'LA', 'ME', 'MD', 'MA', 'MI', 'MN', 'MS', 'MO', 'MT', 'NE',
+    'NV', 'NH', 'NJ', 'NM', 'NY', 'NC', 'ND', 'OH', 'OK', 'OR', 'PA', 'RI', 'SC', 'SD',
+    'TN', 'TX', 'UT', 'VT', 'VA', 'WA', 'WV', 'WI', 'WY', 'PR', 'GU', 'VI', 'AS', 'MP',
+}
+
+# "..., City, ST 12345" / "..., City, ST" at the end of an address (optional ", USA")
+ADDRESS_TAIL_PATTERN = re.compile(
+    r",\s*([A-Za-z]{2})\.?(?:\s+(\d{5})(?:-\d{4})?)?\s*(?:,\s*(?:USA|US|United States))?\s*$"
+)
+
+# Columns of the record tuples returned by the query methods
+RECORD_COLUMNS = ('id', 'name', 'link', 'location', 'description', 'created_at', 'updated_at')
+
+# Columns computed from name/location on every insert, in insert order
+DERIVED_COLUMNS = ('dedupe_key', 'city', 'city_key', 'state', 'zip_code')
+
+# Columns written by add_record / add_records_many / upserts
+INSERT_COLUMNS = ('name', 'link', 'location', 'description', 'latitude', 'longitude') + DERIVED_COLUMNS
+
+# Resource tags, in display order; records matching no rule get DEFAULT_TAG
+TAGS = ('snap', 'free_meal', 'free')
+DEFAULT_TAG = 'free'
+
+# field -> phrase -> tag; a phrase anywhere in the lower-cased field adds the tag
+TAG_RULES = {
+    'name': {
+        'snap': 'snap', 'just harvest': 'snap',
+        'soup kitchen': 'free_meal', 'community kitchen': 'free_meal',
+        'food bank': 'free',
+    },
+    'description': {
+        'snap': 'snap', 'ebt': 'snap',
+        'hot meal': 'free_meal', 'serves meal': 'free_meal',
+        'food pantry': 'free', 'produce': 'free', 'groceries': 'free',
+    },
+}
+
+# One alternation per field, wrapped in a lookahead so a single scan
+# reports every phrase, including overlapping ones
+TAG_PATTERNS = {
+    field: re.compile('(?=(' + '|'.join(re.escape(phrase) for phrase in phrases) + '))')
+    for field, phrases in TAG_RULES.items()
+}
+
+# Space-separated tags of a record, for SELECTs over records
+TAGS_SQL = ("(SELECT group_concat(tag, ' ') FROM "
+            "(SELECT tag FROM record_tags WHERE record_id = records.id ORDER BY tag))")
+
+# Mean Earth radius, used for great-circle distances
+EARTH_RADIUS_KM = 6371.0088
+
+# Anything that is not a letter, digit or space is dropped from dedupe keys
+DEDUPE_PUNCTUATION_PATTERN = re.compile(r"[^\w\s]|_", re.UNICODE)
+
+# Address words folded to a single spelling in dedupe keys
+ADDRESS_ABBREVIATIONS = {
+    'street': 'st', 'avenue': 'ave', 'av': 'ave', 'road': 'rd', 'boulevard': 'blvd',
+    'drive': 'dr', 'lane': 'ln', 'place': 'pl', 'court': 'ct', 'highway': 'hwy',
+    'parkway': 'pkwy', 'square': 'sq', 'terrace': 'ter', 'suite': 'ste', 'floor': 'fl',
+    'north': 'n', 'south': 's', 'east': 'e', 'west': 'w',
+    'northeast': 'ne', 'northwest': 'nw', 'southeast': 'se', 'southwest': 'sw',
+}
+
+
+def _fold_text(text: Optional[str]) -> List[str]:
+    """Case-fold, strip accents and punctuation, and split into words"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return DEDUPE_PUNCTUATION_PATTERN.sub(' ', text.casefold()).split()
+
+
+def dedupe_key(name: Optional[str], location: Optional[str]) -> str:
+    """
+    Build the normalized key used to detect duplicate records
+
+    Two records are duplicates when their names match after folding case,
+    accents, whitespace and punctuation, and their locations match after the
+    same folding plus common address abbreviations (Street -> st, ...).
+
+    Args:
+        name: Record name
+        location: Record location / address
+
+    Returns:
+        The dedupe key, e.g. "city harvest|150 52nd st brooklyn ny"
+    """
+    address = [ADDRESS_ABBREVIATIONS.get(word, word) for word in _fold_text(location)]
+    return f"{' '.join(_fold_text(name))}|{' '.join(address)}"
+
+
+def city_key(city: Optional[str]) -> Optional[str]:
+    """Normalized form of a city name used for indexed lookups (None if empty)"""
+    return ' '.join(_fold_text(city)) or None
+
+
+def parse_location(location: Optional[str]) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """
+    Pull the city, state and ZIP code out of a US street address
+
+    Args:
+        location: Address such as "39 Broadway, 10th Floor, New York, NY 10006"
+
+    Returns:
+        (city, state, zip_code); each is None when it cannot be found
+    """
+    match = ADDRESS_TAIL_PATTERN.search(location or '')
+    if not match or match.group(1).upper() not in US_STATES:
+        return None, None, None
+
+    state, zip_code = match.group(1).upper(), match.group(2)
+    # The city is the comma-separated part just before the state
+    parts = [part.strip() for part in location[:match.start()].split(',') if part.strip()]
+    city = parts[-1] if parts and not parts[-1][0].isdigit() else None
+    return city, state, zip_code
+
+
+def derived_columns(name: Optional[str], location: Optional[str], city: str = None) -> Tuple:
+    """
+    Compute the DERIVED_COLUMNS values for a record
+
+    Args:
+        name: Record name
+        location: Record location / address
+        city: City the record was requested for, e.g. "Austin" or "Austin, TX";
+              when None the city is parsed from the address
+
+    Returns:
+        (dedupe_key, city, city_key, state, zip_code)
+    """
+    parsed_city, state, zip_code = parse_location(location)
+    if city:
+        city, _, requested_state = (part.strip() for part in city.partition(','))
+        if not state and requested_state.upper() in US_STATES:
+            state = requested_state.upper()
+    else:
+        city = parsed_city
+    return (dedupe_key(name, location), city or None, city_key(city), state, zip_code)
+
+
+def classify_tags(name: Optional[str], description: Optional[str]) -> List[str]:
+    """
+    Work out the resource tags of a record from its name and description
+
+    Args:
+        name: Record name
+        description: Record description
+
+    Returns:
+        Tags in TAGS order; [DEFAULT_TAG] when no rule matches
+    """
+    found = set()
+    for field, text in (('name', name), ('description', description)):
+        if text:
+            phrases = TAG_RULES[field]
+            found.update(phrases[match.group(1)] for match in TAG_PATTERNS[field].finditer(text.lower()))
+    return [tag for tag in TAGS if tag in found] or [DEFAULT_TAG]
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance between two points in kilometers"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def snapshot_path_for(db_path: str) -> str:
+    """Default snapshot file of a database, e.g. my_records.db -> my_records.snapshot.db"""
+    root, ext = os.path.splitext(db_path)
+    return (root if ext == '.db' else db_path) + SNAPSHOT_SUFFIX
+
+
+def _snapshot_uri(path: str) -> str:
+    """URI opening a snapshot file read-only without locking (immutable=1)"""
+    from urllib.parse import quote
+    
+    path = os.path.abspath(path).replace(os.sep, '/')
+    if not path.startswith('/'):
+        path = '/' + path  # Windows drive letter
+    return f"file:{quote(path)}?immutable=1"
+
+
+def _register_functions(connection: sqlite3.Connection):
+    """Make the Python helpers used in SQL statements available on a connection"""
+    connection.create_function('dedupe_key', 2, dedupe_key, deterministic=True)
+
+
+# records column -> CSV header written by export_to_csv
+CSV_IMPORT_COLUMNS = {
+    'id': 'ID',
+    'name': 'Name',
+    'link': 'Link',
+    'location': 'Location',
+    'description': 'Description',
+    'created_at': 'Created At',
+    'updated_at': 'Updated At',
+}
+
+
+def _csv_row_values(row: List[str], indexes: List[Optional[int]], key_positions: Tuple[int, int, int]) -> Tuple:
+    """
+    Pick the values at the given column indexes ('' for missing columns)
+    and append the DERIVED_COLUMNS
+
+    key_positions holds the positions of name and location among the picked
+    values, and the index of the City column in the row (None if absent).
+    """
+    values = tuple(
+        row[index] if index is not None and index < len(row) else ''
+        for index in indexes
+    )
+    name_position, location_position, city_index = key_positions
+    city = row[city_index] if city_index is not None and city_index < len(row) else None
+    return values + derived_columns(values[name_position], values[location_position], city)
+
+
+def _parse_csv_block(lines: List[str], indexes: List[Optional[int]],
+                     key_positions: Tuple[int, int, int]) -> List[Tuple]:
+    """Parse a block of complete CSV records (runs in a worker process)"""
+    import csv
+    return [_csv_row_values(row, indexes, key_positions) for row in csv.reader(lines) if row]
+
+
+def _csv_record_blocks(csvfile, block_size: int) -> Iterator[List[str]]:
+    """
+    Split an open CSV file into blocks of whole records without parsing it
+
+    A quoted field may contain newlines, so a line only ends a record when
+    the number of quote characters seen so far is even.
+    """
+    block = []
+    quotes = 0
+    for line in csvfile:
+        block.append(line)
+        quotes += line.count('"')
+        if quotes % 2 == 0 and len(block) >= block_size:
+            yield block
+            block = []
+            quotes = 0
+    if block:
+        yield block
+
+
+def _parse_csv_parallel(csvfile, indexes: List[Optional[int]], key_positions: Tuple[int, int, int],
+                        batch_size: int, workers: int) -> Iterator[List[Tuple]]:
+    """
+    Parse CSV blocks in a process pool, yielding parsed batches in file order
+
+    At most two blocks per worker are in flight, so memory stays bounded
+    however large the file is.
+    """
+    import collections
+    import multiprocessing
+
+    with multiprocessing.Pool(workers) as pool:
+        pending = collections.deque()
+        for block in _csv_record_blocks(csvfile, batch_size):
+            pending.append(pool.apply_async(_parse_csv_block, (block, indexes, key_positions)))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+
+class ConnectionPool:
+    """Small thread-safe pool of long-lived SQLite connections"""
+
+    def __init__(self, db_path: str, size: int = 4, pragmas: dict = None, read_only: bool = False):
+        """
+        Initialize the pool (connections are opened lazily)
+
+        Args:
+            db_path: Path to the SQLite database file
+            size: Maximum number of open connections
+            pragmas: PRAGMA name -> value applied to each new connection
+            read_only: Open db_path as an immutable snapshot; when a new
+                       snapshot is swapped in, connections to the old file
+                       are closed and reopened on their next checkout
+        """
+        self.db_path = db_path
+        self.size = size
+        self.read_only = read_only
+        self.pragmas = (SNAPSHOT_PRAGMAS if read_only else DEFAULT_PRAGMAS) if pragmas is None else pragmas
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        # Snapshot file identity and the connections opened on it (read-only pools)
+        self._file_id = None
+        self._current = set()
+
+    def _open(self) -> sqlite3.Connection:
+        """Open and tune a new connection"""
+        if self.read_only:
+            connection = sqlite3.connect(
+                _snapshot_uri(self.db_path),
+                uri=True,
+                cached_statements=STATEMENT_CACHE_SIZE,
+                check_same_thread=False,
+                factory=TimedConnection,
+            )
+        else:
+            connection = sqlite3.connect(
+                self.db_path,
+                cached_statements=STATEMENT_CACHE_SIZE,
+                check_same_thread=False,
+                factory=TimedConnection,
+            )
+        for name, value in self.pragmas.items():
+            connection.execute(f"PRAGMA {name} = {value}")
+        _register_functions(connection)
+        if self.read_only:
+            # Called with self._lock held
+            self._current.add(connection)
+        return connection
+
+    def _check_snapshot(self):
+        """Retire every connection if a new snapshot file was swapped in"""
+        try:
+            stat = os.stat(self.db_path)
+            file_id = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            file_id = None
+        if file_id == self._file_id:
+            return
+        with self._lock:
+            self._file_id = file_id
+            self._current.clear()
+
+    def _discard(self, connection: sqlite3.Connection):
+        """Close a connection that will not be reused"""
+        connection.close()
+        with self._lock:
+            self._opened -= 1
+
+    def acquire(self, timeout: float = None) -> sqlite3.Connection:
+        """
+        Check a connection out of the pool, opening one if below the size limit
+
+        Args:
+            timeout: Seconds to wait for a free connection (None waits forever)
+
+        Returns:
+            An open sqlite3 connection
+        """
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+        if self.read_only:
+            self._check_snapshot()
+
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if not self.read_only or connection in self._current:
+                return connection
+            self._discard(connection)
+
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                try:
+                    return self._open()
+                except Exception:
+                    self._opened -= 1
+                    raise
+
+        connection = self._idle.get(timeout=timeout)
+        if self.read_only and connection not in self._current:
+            self._discard(connection)
+            return self.acquire(timeout)
+        return connection
+
+    def release(self, connection: sqlite3.Connection):
+        """
+        Return a connection to the pool
+
+        Args:
+            connection: Connection previously obtained from acquire()
+        """
+        # Never hand out a connection with a half-finished transaction
+        if connection.in_transaction:
+            connection.rollback()
+
+        if self._closed or (self.read_only and connection not in self._current):
+            self._discard(connection)
+            return
+
+        self._idle.put(connection)
+
+    def close(self):
+        """Close all idle connections and refuse new checkouts"""
+        self._closed = True
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            connection.close()
+            with self._lock:
+                self._opened -= 1
 
 
 class DatabaseManager:
     """Manages SQLite database operations for storing records with Name, Link, Location, Description"""
     
-    def __init__(self, db_path: str = "my_records.db"):
+    def __init__(self, db_path: str = "my_records.db", persistent: bool = True, pool_size: int = 4,
+                 instrument: bool = True, slow_query_ms: float = DEFAULT_SLOW_QUERY_MS,
+                 read_only: bool = False, snapshot_path: str = None, metrics_path: str = None):
         """
         Initialize the database manager
         
         Args:
             db_path: Path to the SQLite database file
+            persistent: If True, reuse warm pooled connections across calls;
+                        if False, open and close a connection on every call
+            pool_size: Maximum number of pooled connections (persistent mode only)
+            instrument: Collect per-operation timings and query counts (see db_metrics.py)
+            slow_query_ms: Log queries taking at least this long, with their
+                           query plan (None disables the slow-query log)
+            read_only: db_path is a snapshot written by publish_snapshot();
+                       open it immutable, memory-mapped and query-only
+            snapshot_path: Where publish_snapshot() writes; when set, CSV
+                           imports publish a new snapshot once they finish
+            metrics_path: File that flush_metrics() adds the collected metrics
+                          to (defaults to $SNAPMAP_METRICS_DB; unset keeps
+                          them in memory only)
         """
         self.db_path = db_path
-        self.connection = None
-        self.cursor = None
-        
+        self.persistent = persistent
+        self.read_only = read_only
+        self.snapshot_path = snapshot_path
+        self._snapshot_lock = threading.Lock()
+        self.pool = ConnectionPool(db_path, pool_size, read_only=read_only) if persistent else None
+        # Timings are flushed into the metrics file (if any) by close() or at exit
+        self.metrics = Metrics(slow_query_ms) if instrument else None
+        self.metrics_path = metrics_path or default_metrics_path()
+        if self.metrics is not None and self.metrics_path:
+            atexit.register(_flush_metrics_at_exit, weakref.ref(self))
+        # Connection state is per thread so one manager can be shared safely
+        self._local = threading.local()
+        # Whether the FTS5 search index exists (None until first checked)
+        self._fts_available = None
+        # Whether the unique dedupe_key index exists (None until first checked)
+        self._dedupe_index_available = None
+        # Whether the R*Tree spatial index exists (None until first checked)
+        self._rtree_available = None
+        # Whether the materialized stats tables exist (None until first checked)
+        self._stats_available = None
+
+    @property
+    def connection(self) -> Optional[sqlite3.Connection]:
+        """Connection held by the current thread (None when not connected)"""
+        return getattr(self._local, "connection", None)
+
+    @connection.setter
+    def connection(self, value):
+        self._local.connection = value
+
+    @property
+    def cursor(self) -> Optional[sqlite3.Cursor]:
+        """Cursor held by the current thread (None when not connected)"""
+        return getattr(self._local, "cursor", None)
+
+    @cursor.setter
+    def cursor(self, value):
+        self._local.cursor = value
+
     def connect(self):
-        """Establish connection to the database"""
-        
-        self.connection = sqlite3.connect(self.db_path)
+        """Establish connection to the database (re-entrant per thread)"""
+        depth = getattr(self._local, "depth", 0)
+        self._local.depth = depth + 1
+        if depth > 0:
+            return
+
+        if self.persistent:
+            self.connection = self.pool.acquire()
+        else:
+            if self.read_only:
+                self.connection = sqlite3.connect(_snapshot_uri(self.db_path), uri=True,
+                                                  factory=TimedConnection)
+                for name, value in SNAPSHOT_PRAGMAS.items():
+                    self.connection.execute(f"PRAGMA {name} = {value}")
+            else:
+                self.connection = sqlite3.connect(self.db_path, factory=TimedConnection)
+            _register_functions(self.connection)
+        # Every statement on the connection is timed, not only those on self.cursor
+        self.connection.metrics = self.metrics
         self.cursor = self.connection.cursor()
         
     def disconnect(self):
-        """Close the database connection"""
+        """Release the database connection (back to the pool in persistent mode)"""
+        depth = getattr(self._local, "depth", 0)
+        if depth > 1:
+            self._local.depth = depth - 1
+            return
+        self._local.depth = 0
+
         if self.connection:
-            self.connection.close()
+            self.cursor.close()
+            if self.persistent:
+                self.pool.release(self.connection)
+            else:
+                self.connection.close()
+        self.connection = None
+        self.cursor = None
+
+    def close(self):
+        """Flush collected metrics, then close every pooled connection held by this manager"""
+        self.flush_metrics()
+        if self.persistent:
+            self.pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
             
-    def create_database(self):
-        """Create the database table if it doesn't exist"""
+    @contextmanager
+    def session(self):
+        """
+        Hold one connection for the duration of a with-block
+
+        Nested sessions (and connect() calls) on the same thread share the
+        connection. On an exception any open transaction is rolled back
+        when the connection is released.
+
+        Yields:
+            The cursor of the held connection
+        """
         self.connect()
-        
-        # Create the main table
+        try:
+            yield self.cursor
+        finally:
+            self.disconnect()
+            
+    @instrumented()
+    def create_database(self):
+        """
+        Create the database table if it doesn't exist
+
+        Returns immediately when the file's schema version already matches
+        SCHEMA_VERSION, so constructing a finder or running a command on an
+        up-to-date database costs a single PRAGMA read.
+        """
+        with self.session():
+            self.cursor.execute('PRAGMA user_version')
+            if self.cursor.fetchone()[0] == SCHEMA_VERSION:
+                return
+            
+            # Create the main table
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS records (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    link TEXT,
+                    location TEXT,
+                    description TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    dedupe_key TEXT,
+                    latitude REAL,
+                    longitude REAL,
+                    city TEXT,
+                    city_key TEXT,
+                    state TEXT,
+                    zip_code TEXT
+                )
+            ''')
+            
+            # Columns added after the original schema
+            self._ensure_columns({
+                'dedupe_key': 'TEXT',
+                'latitude': 'REAL',
+                'longitude': 'REAL',
+                'city': 'TEXT',
+                'city_key': 'TEXT',
+                'state': 'TEXT',
+                'zip_code': 'TEXT',
+            })
+            
+            # Create an index on name for faster searches
+            self.cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_name ON records(name)
+            ''')
+            
+            # Per-city / per-state lookups (get_by_city)
+            self.cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_city ON records(city_key, state)
+            ''')
+            self.cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_state ON records(state)
+            ''')
+            
+            # Keyset index for newest-first iteration and paging
+            self.cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_created_at ON records(created_at, id)
+            ''')
+            
+            # Full-text index used by search_records
+            self._create_search_index()
+            
+            # Unique normalized key so re-crawled records update in place
+            self._create_dedupe_index()
+            
+            # Spatial index used by within_bbox / within_radius / nearest
+            self._create_spatial_index()
+            
+            # Resource tags used by search_by_tags
+            self._create_tag_table()
+            
+            # Counters read by get_database_stats
+            self._create_stats_tables()
+            
+            # Results of link_checker.py
+            self._create_link_table()
+            
+            # Metrics and lookup jobs used to be kept in the records database
+            # (and so in every snapshot); they live in their own files now
+            self.cursor.execute('DROP TABLE IF EXISTS op_metrics')
+            self.cursor.execute('DROP TABLE IF EXISTS slow_queries')
+            self.cursor.execute('DROP TABLE IF EXISTS jobs')
+            
+            # Only mark the schema current once everything is in place; while
+            # duplicates block the dedupe index, setup is retried on each run
+            if self._dedupe_index_available:
+                self.cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            
+            self.connection.commit()
+        print(f"Database '{self.db_path}' initialized successfully!")
+
+    def _ensure_columns(self, columns: dict):
+        """
+        Add any missing columns to an existing records table
+
+        Args:
+            columns: Column name -> SQL type/constraint
+        """
+        self.cursor.execute('PRAGMA table_info(records)')
+        existing = {row[1] for row in self.cursor.fetchall()}
+        for column, declaration in columns.items():
+            if column not in existing:
+                self.cursor.execute(f'ALTER TABLE records ADD COLUMN {column} {declaration}')
+
+    def _create_tag_table(self):
+        """
+        Create the record_tags table and tag any records that have no tags yet
+
+        Tags are computed in Python at ingest; only deletes are handled by a
+        trigger, so other SQLite clients can still write to records.
+        Must be called inside a session.
+        """
         self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS records (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                link TEXT,
-                location TEXT,
-                description TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            CREATE TABLE IF NOT EXISTS record_tags (
+                tag TEXT NOT NULL,
+                record_id INTEGER NOT NULL,
+                PRIMARY KEY (tag, record_id)
+            ) WITHOUT ROWID
+        ''')
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_record_tags_record ON record_tags(record_id)
+        ''')
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS records_tags_ad AFTER DELETE ON records BEGIN
+                DELETE FROM record_tags WHERE record_id = old.id;
+            END
+        ''')
+        self._retag('''
+            SELECT id, name, description FROM records
+            WHERE id NOT IN (SELECT record_id FROM record_tags)
+        ''')
+
+    def _create_stats_tables(self):
+        """
+        Create the tables behind get_database_stats and the triggers that maintain them
+
+        record_stats is a single row of counters and location_counts holds
+        one row per distinct location, so reading the stats never scans
+        records. Both are filled from scratch the first time.
+        Must be called inside a session.
+        """
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS record_stats (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                total_records INTEGER NOT NULL,
+                records_with_links INTEGER NOT NULL
             )
         ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS location_counts (
+                location TEXT PRIMARY KEY NOT NULL,
+                count INTEGER NOT NULL
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_location_counts_count ON location_counts(count)
+        ''')
         
-        # Create an index on name for faster searches
+        # A missing location is counted under ''
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS records_stats_ai AFTER INSERT ON records BEGIN
+                UPDATE record_stats SET
+                    total_records = total_records + 1,
+                    records_with_links = records_with_links + (IFNULL(new.link, '') != '')
+                WHERE id = 1;
+                INSERT INTO location_counts (location, count) VALUES (IFNULL(new.location, ''), 1)
+                    ON CONFLICT(location) DO UPDATE SET count = count + 1;
+            END
+        ''')
         self.cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_name ON records(name)
+            CREATE TRIGGER IF NOT EXISTS records_stats_ad AFTER DELETE ON records BEGIN
+                UPDATE record_stats SET
+                    total_records = total_records - 1,
+                    records_with_links = records_with_links - (IFNULL(old.link, '') != '')
+                WHERE id = 1;
+                UPDATE location_counts SET count = count - 1 WHERE location = IFNULL(old.location, '');
+                DELETE FROM location_counts WHERE location = IFNULL(old.location, '') AND count <= 0;
+            END
+        ''')
+        self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS records_stats_au AFTER UPDATE OF link, location ON records BEGIN
+                UPDATE record_stats SET
+                    records_with_links = records_with_links
+                        - (IFNULL(old.link, '') != '') + (IFNULL(new.link, '') != '')
+                WHERE id = 1;
+                UPDATE location_counts SET count = count - 1 WHERE location = IFNULL(old.location, '');
+                DELETE FROM location_counts WHERE location = IFNULL(old.location, '') AND count <= 0;
+                INSERT INTO location_counts (location, count) VALUES (IFNULL(new.location, ''), 1)
+                    ON CONFLICT(location) DO UPDATE SET count = count + 1;
+            END
         ''')
         
-        self.connection.commit()
-        print(f"Database '{self.db_path}' initialized successfully!")
-        self.disconnect()
+        self.cursor.execute('SELECT 1 FROM record_stats WHERE id = 1')
+        if self.cursor.fetchone() is None:
+            self._rebuild_stats()
+        self._stats_available = True
+
+    def _rebuild_stats(self):
+        """
+        Recompute the stats tables from the records table
+
+        Must be called inside a session.
+        """
+        self.cursor.execute('DELETE FROM record_stats')
+        self.cursor.execute('DELETE FROM location_counts')
+        self.cursor.execute('''
+            INSERT INTO record_stats (id, total_records, records_with_links)
+            SELECT 1, COUNT(*), TOTAL(IFNULL(link, '') != '') FROM records
+        ''')
+        self.cursor.execute('''
+            INSERT INTO location_counts (location, count)
+            SELECT IFNULL(location, ''), COUNT(*) FROM records GROUP BY IFNULL(location, '')
+        ''')
+
+    def _stats_tables_ready(self) -> bool:
+        """True if the stats tables exist (checked once, then cached)"""
+        if self._stats_available is None:
+            with self.session():
+                self.cursor.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'record_stats'"
+                )
+                self._stats_available = self.cursor.fetchone() is not None
+        return self._stats_available
+
+    def _retag(self, query: str, params: Tuple = ()):
+        """
+        Recompute and store the tags of the records selected by query
+
+        Must be called inside a session.
+
+        Args:
+            query: SELECT returning (id, name, description) rows
+            params: Query parameters
+        """
+        rows = self.connection.execute(query, params).fetchall()
+        self._store_tags((record_id, classify_tags(name, description))
+                         for record_id, name, description in rows)
+
+    def _store_tags(self, tagged: Iterable[Tuple[int, List[str]]]):
+        """
+        Replace the tags of each record
+
+        Must be called inside a session.
+
+        Args:
+            tagged: (record_id, tags) pairs
+        """
+        tagged = list(tagged)
+        if not tagged:
+            return
+        self.cursor.executemany('DELETE FROM record_tags WHERE record_id = ?',
+                                [(record_id,) for record_id, _ in tagged])
+        self.cursor.executemany('INSERT OR IGNORE INTO record_tags (tag, record_id) VALUES (?, ?)',
+                                [(tag, record_id) for record_id, tags in tagged for tag in tags])
+
+    def _create_link_table(self):
+        """
+        Create the link_checks table holding the latest check of each distinct link
+
+        Rows are keyed by the link text rather than the record, since many
+        records share a link; records are joined to them on records.link.
+        Must be called inside a session.
+        """
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS link_checks (
+                link TEXT PRIMARY KEY,
+                outcome TEXT NOT NULL,
+                status INTEGER,
+                final_url TEXT,
+                error TEXT,
+                elapsed_ms REAL,
+                checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_link_checks_checked_at ON link_checks(checked_at)
+        ''')
+
+    def _create_dedupe_index(self):
+        """
+        Fill in missing dedupe keys and create the unique index on them
+
+        If legacy duplicates prevent the unique index, a warning is printed
+        and inserts keep appending until remove_duplicates() is run.
+        Must be called inside a session.
+        """
+        self.cursor.execute(
+            'UPDATE records SET dedupe_key = dedupe_key(name, location) WHERE dedupe_key IS NULL'
+        )
+        try:
+            self.cursor.execute(
+                'CREATE UNIQUE INDEX IF NOT EXISTS idx_dedupe_key ON records(dedupe_key)'
+            )
+            self._dedupe_index_available = True
+        except sqlite3.IntegrityError:
+            print("⚠️  Duplicate records found; run 'python db_utils.py clean' to enable upserts")
+            self._dedupe_index_available = False
+
+    def _dedupe_index_ready(self) -> bool:
+        """Check (once per manager) whether the unique dedupe_key index exists"""
+        if self._dedupe_index_available is None:
+            with self.session():
+                self.cursor.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_dedupe_key'"
+                )
+                self._dedupe_index_available = self.cursor.fetchone() is not None
+        return self._dedupe_index_available
+
+    def _upsert_clause(self) -> str:
+        """
+        ON CONFLICT clause that turns an insert of a known record into an update
+
+        Returns an empty string when the unique dedupe index does not exist yet.
+        """
+        if not self._dedupe_index_ready():
+            return ''
+        return '''
+            ON CONFLICT(dedupe_key) DO UPDATE SET
+                name = excluded.name,
+                link = CASE WHEN excluded.link != '' THEN excluded.link ELSE link END,
+                location = excluded.location,
+                description = excluded.description,
+                latitude = COALESCE(excluded.latitude, latitude),
+                longitude = COALESCE(excluded.longitude, longitude),
+                city = COALESCE(excluded.city, city),
+                city_key = COALESCE(excluded.city_key, city_key),
+                state = COALESCE(excluded.state, state),
+                zip_code = COALESCE(excluded.zip_code, zip_code),
+                updated_at = CURRENT_TIMESTAMP
+        '''
+
+    @instrumented(rows=int)
+    def remove_duplicates(self) -> int:
+        """
+        Delete records sharing a dedupe key, keeping the newest (highest ID) of each
+
+        Runs as one set-based statement, then creates the unique dedupe index
+        so later inserts of the same resource update it instead of appending.
+
+        Returns:
+            Number of records removed
+        """
+        with self.session():
+            self._ensure_columns({'dedupe_key': 'TEXT'})
+            self.cursor.execute(
+                'UPDATE records SET dedupe_key = dedupe_key(name, location) WHERE dedupe_key IS NULL'
+            )
+            self.cursor.execute('''
+                DELETE FROM records
+                WHERE id NOT IN (SELECT MAX(id) FROM records GROUP BY dedupe_key)
+            ''')
+            removed = self.cursor.rowcount
+            self._create_dedupe_index()
+            self.connection.commit()
         
-    def add_record(self, name: str, link: str = "", location: str = "", description: str = "") -> int:
+        return removed
+
+    @instrumented(rows=len)
+    def find_near_duplicates(self, threshold: float = None, batch_size: int = 10000) -> List[List[int]]:
+        """
+        Find groups of records that are probably the same place under different wording
+
+        Unlike remove_duplicates, which needs the dedupe keys to match
+        exactly, this compares MinHash signatures of the keys with LSH (see
+        near_duplicates.py), so its cost grows linearly with the table.
+
+        Args:
+            threshold: Minimum Jaccard similarity (default near_duplicates.DEFAULT_THRESHOLD)
+            batch_size: Number of rows fetched per query
+
+        Returns:
+            Groups of record IDs, each sorted oldest first, largest groups first
+        """
+        from near_duplicates import DEFAULT_THRESHOLD, find_near_duplicates
+
+        def keys():
+            with self.session():
+                cursor = self.connection.execute(
+                    'SELECT id, COALESCE(dedupe_key, dedupe_key(name, location)) FROM records'
+                )
+                while True:
+                    batch = cursor.fetchmany(batch_size)
+                    if not batch:
+                        return
+                    yield from batch
+
+        return find_near_duplicates(keys(), DEFAULT_THRESHOLD if threshold is None else threshold)
+
+    @instrumented(rows=len)
+    def near_duplicates_of(self, records: Iterable, default_location: str = "", city: str = None,
+                           threshold: float = None, indexes: dict = None) -> List[Tuple[int, int, float]]:
+        """
+        Check records about to be added for near-duplicates already in the database
+
+        Each record is compared with the stored records of its city (an index
+        lookup on city_key), so the check stays cheap however large the table
+        grows. Exact matches are left out, since add_records_many updates
+        those in place, as are records whose city is unknown.
+
+        Args:
+            records: Records in any form add_records_many accepts
+            default_location: Location used when a record has none
+            city: City all the records belong to (parsed from each location if None)
+            threshold: Minimum Jaccard similarity (default near_duplicates.DEFAULT_THRESHOLD);
+                       ignored for cities already in indexes
+            indexes: City indexes (city_key -> NearDuplicateIndex) kept between
+                     calls; cities missing from it are loaded and added to it.
+                     Keep it up to date with index_saved_records.
+
+        Returns:
+            (position in records, existing record ID, similarity) for every match,
+            most similar first for each record
+        """
+        from near_duplicates import DEFAULT_THRESHOLD, NearDuplicateIndex
+
+        threshold = DEFAULT_THRESHOLD if threshold is None else threshold
+        incoming = []
+        for record in records:
+            if isinstance(record, dict):
+                name, location = record['name'], record.get('location') or default_location
+            else:
+                name, location = record[0], record[2] or default_location
+            key, _, record_city_key, _, _ = derived_columns(name, location, city)
+            incoming.append((key, record_city_key))
+
+        matches = []
+        indexes = {} if indexes is None else indexes
+        with self.session():
+            for position, (key, record_city_key) in enumerate(incoming):
+                if record_city_key is None:
+                    continue
+                index = indexes.get(record_city_key)
+                if index is None:
+                    index = indexes[record_city_key] = NearDuplicateIndex(threshold)
+                    for record_id, existing_key in self.connection.execute(
+                        'SELECT id, dedupe_key FROM records WHERE city_key = ? AND dedupe_key IS NOT NULL',
+                        (record_city_key,)
+                    ):
+                        index.add(record_id, existing_key)
+                matches.extend((position, record_id, score) for record_id, score in index.matches(key))
+        return matches
+
+    @instrumented()
+    def index_saved_records(self, indexes: dict, record_ids: Iterable[int]):
+        """
+        Add records just saved to the city indexes from near_duplicates_of
+
+        Only cities that are already indexed are updated; the others are
+        loaded with the new records when near_duplicates_of first needs them.
+
+        Args:
+            indexes: City indexes passed to near_duplicates_of
+            record_ids: IDs returned by add_records_many
+        """
+        if not indexes:
+            return
+        with self.session():
+            for record_id, key, record_city_key in self.connection.execute(
+                'SELECT id, dedupe_key, city_key FROM records '
+                'WHERE id IN (SELECT value FROM json_each(?)) AND dedupe_key IS NOT NULL',
+                (json.dumps(list(record_ids)),)
+            ):
+                if record_city_key in indexes:
+                    indexes[record_city_key].add(record_id, key)
+
+    def _create_search_index(self):
+        """
+        Create the FTS5 index over records and the triggers that keep it in sync
+
+        Does nothing (and search_records keeps using LIKE) when this SQLite
+        build has no FTS5 support. Must be called inside a session.
+        """
+        self.cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'records_fts'"
+        )
+        if self.cursor.fetchone():
+            self._fts_available = True
+            return
+
+        try:
+            self.cursor.execute('''
+                CREATE VIRTUAL TABLE records_fts USING fts5(
+                    name, description, location,
+                    content='records', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
+                )
+            ''')
+        except sqlite3.OperationalError as e:
+            print(f"Full-text search unavailable ({e}), falling back to LIKE searches")
+            self._fts_available = False
+            return
+
+        self.cursor.executescript('''
+            CREATE TRIGGER IF NOT EXISTS records_fts_insert AFTER INSERT ON records BEGIN
+                INSERT INTO records_fts (rowid, name, description, location)
+                VALUES (new.id, new.name, new.description, new.location);
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS records_fts_delete AFTER DELETE ON records BEGIN
+                INSERT INTO records_fts (records_fts, rowid, name, description, location)
+                VALUES ('delete', old.id, old.name, old.description, old.location);
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS records_fts_update
+            AFTER UPDATE OF name, description, location ON records BEGIN
+                INSERT INTO records_fts (records_fts, rowid, name, description, location)
+                VALUES ('delete', old.id, old.name, old.description, old.location);
+                INSERT INTO records_fts (rowid, name, description, location)
+                VALUES (new.id, new.name, new.description, new.location);
+            END;
+
+            -- Index any rows that existed before the search index was added
+            INSERT INTO records_fts (records_fts) VALUES ('rebuild');
+        ''')
+        self._fts_available = True
+
+    def _create_spatial_index(self):
+        """
+        Create the R*Tree index over record coordinates and its sync triggers
+
+        Records without coordinates are left out of the index. Without R*Tree
+        support, a plain (latitude, longitude) index is used instead.
+        Must be called inside a session.
+        """
+        self.cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'records_rtree'"
+        )
+        if self.cursor.fetchone():
+            self._rtree_available = True
+            return
+
+        try:
+            self.cursor.execute('''
+                CREATE VIRTUAL TABLE records_rtree USING rtree(
+                    id, min_lat, max_lat, min_lng, max_lng
+                )
+            ''')
+        except sqlite3.OperationalError as e:
+            print(f"R*Tree unavailable ({e}), using a plain coordinate index")
+            self.cursor.execute(
+                'CREATE INDEX IF NOT EXISTS idx_coordinates ON records(latitude, longitude)'
+            )
+            self._rtree_available = False
+            return
+
+        self.cursor.executescript('''
+            CREATE TRIGGER IF NOT EXISTS records_rtree_insert AFTER INSERT ON records
+            WHEN new.latitude IS NOT NULL AND new.longitude IS NOT NULL BEGIN
+                INSERT INTO records_rtree VALUES
+                    (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS records_rtree_delete AFTER DELETE ON records BEGIN
+                DELETE FROM records_rtree WHERE id = old.id;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS records_rtree_update
+            AFTER UPDATE OF latitude, longitude ON records BEGIN
+                DELETE FROM records_rtree WHERE id = old.id;
+                INSERT INTO records_rtree
+                    SELECT new.id, new.latitude, new.latitude, new.longitude, new.longitude
+                    WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL;
+            END;
+
+            -- Index any records that already have coordinates
+            INSERT INTO records_rtree
+                SELECT id, latitude, latitude, longitude, longitude
+                FROM records
+                WHERE latitude IS NOT NULL AND longitude IS NOT NULL;
+        ''')
+        self._rtree_available = True
+
+    def _spatial_index_available(self) -> bool:
+        """Check (once per manager) whether the R*Tree spatial index exists"""
+        if self._rtree_available is None:
+            with self.session():
+                self.cursor.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'records_rtree'"
+                )
+                self._rtree_available = self.cursor.fetchone() is not None
+        return self._rtree_available
+
+    def _search_index_available(self) -> bool:
+        """Check (once per manager) whether the FTS5 search index exists"""
+        if self._fts_available is None:
+            with self.session():
+                self.cursor.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'records_fts'"
+                )
+                self._fts_available = self.cursor.fetchone() is not None
+        return self._fts_available
+        
+    def _insert_sql(self, upsert: str = '', returning: bool = True) -> str:
+        """INSERT statement for INSERT_COLUMNS, optionally with an upsert clause (and RETURNING id)"""
+        placeholders = ', '.join('?' for _ in INSERT_COLUMNS)
+        sql = f"INSERT INTO records ({', '.join(INSERT_COLUMNS)}) VALUES ({placeholders})"
+        if upsert:
+            sql += f" {upsert}"
+            if returning:
+                sql += " RETURNING id"
+        return sql
+
+    @instrumented(rows=bool)
+    def add_record(self, name: str, link: str = "", location: str = "", description: str = "",
+                   latitude: float = None, longitude: float = None, city: str = None) -> int:
         """
         Add a new record to the database
         
@@ -70,92 +1214,540 @@ class DatabaseManager:
             link: URL or link associated with the record
             location: Physical or virtual location
             description: Description of the record
+            latitude: Latitude in decimal degrees (optional)
+            longitude: Longitude in decimal degrees (optional)
+            city: City the record belongs to (parsed from location if None)
+            
+        Returns:
+            The ID of the inserted record
+        """
+        row = (name, link, location, description, latitude, longitude) + \
+            derived_columns(name, location, city)
+        
+        with self.session():
+            # An existing record with the same dedupe key is updated instead
+            upsert = self._upsert_clause()
+            self.cursor.execute(self._insert_sql(upsert), row)
+            
+            record_id = self.cursor.fetchone()[0] if upsert else self.cursor.lastrowid
+            self._store_tags([(record_id, classify_tags(name, description))])
+            self.connection.commit()
+        
+        print(f"Record '{name}' added successfully with ID: {record_id}")
+        return record_id
+
+    @instrumented(rows=len)
+    def add_records_many(self, records: Iterable, default_location: str = "", city: str = None) -> List[int]:
+        """
+        Add many records in a single transaction
+
+        Once the unique dedupe index exists, a record matching an existing
+        one (same normalized name and address) updates it instead of adding
+        a copy, so re-crawling a city does not duplicate its rows.
+
+        Args:
+            records: Iterable of dicts with name/link/location/description keys
+                     (and optionally latitude/longitude), or of
+                     (name, link, location, description[, latitude, longitude]) tuples
+            default_location: Location used when a record has none
+            city: City all the records belong to (parsed from each location if None)
+
+        Returns:
+            IDs of the inserted or updated records, in input order (empty if nothing was written)
+        """
+        tags = []
+        keys = []
+
+        def rows():
+            for record in records:
+                if isinstance(record, dict):
+                    name = record['name']
+                    link = record.get('link', '')
+                    location = record.get('location') or default_location
+                    description = record.get('description', '')
+                    latitude = record.get('latitude')
+                    longitude = record.get('longitude')
+                else:
+                    name, link, location, description, *coordinates = record
+                    location = location or default_location
+                    latitude, longitude = coordinates or (None, None)
+                tags.append(classify_tags(name, description))
+                derived = derived_columns(name, location, city)
+                keys.append(derived[0])
+                yield (name, link, location, description, latitude, longitude) + derived
+
+        upsert = self._upsert_clause()
+
+        with self.session():
+            # Inside a caller's transaction, work in a savepoint so only this
+            # method's writes are undone and the caller still decides when to commit
+            own_transaction = not self.connection.in_transaction
+            if own_transaction:
+                # Take the write lock up front so the new IDs are contiguous
+                self.cursor.execute('BEGIN IMMEDIATE')
+            else:
+                self.cursor.execute('SAVEPOINT add_records_many')
+
+            try:
+                if upsert:
+                    # Upserted rows keep their old IDs, so look them all up by
+                    # dedupe key in one query afterwards
+                    self.cursor.executemany(self._insert_sql(upsert, returning=False), rows())
+                    self.cursor.execute(
+                        'SELECT dedupe_key, id FROM records WHERE dedupe_key IN (SELECT value FROM json_each(?))',
+                        (json.dumps(keys),))
+                    ids_by_key = dict(self.cursor.fetchall())
+                    record_ids = [ids_by_key[key] for key in keys]
+                else:
+                    self.cursor.executemany(self._insert_sql(), rows())
+                    count = self.cursor.rowcount
+                    last_id = self.cursor.execute('SELECT last_insert_rowid()').fetchone()[0]
+                    record_ids = list(range(last_id - count + 1, last_id + 1)) if count > 0 else []
+
+                if record_ids:
+                    self._store_tags(zip(record_ids, tags))
+            except Exception:
+                if not own_transaction:
+                    self.cursor.execute('ROLLBACK TO add_records_many')
+                    self.cursor.execute('RELEASE add_records_many')
+                raise
+
+            if own_transaction:
+                if record_ids:
+                    self.connection.commit()
+                else:
+                    self.connection.rollback()
+            else:
+                if not record_ids:
+                    self.cursor.execute('ROLLBACK TO add_records_many')
+                self.cursor.execute('RELEASE add_records_many')
+
+            if not record_ids:
+                return []
+
+        print(f"{len(record_ids)} records saved successfully")
+        return record_ids
+
+    @instrumented(rows=len)
+    def get_all_records(self) -> List[Tuple]:
+        """
+        Retrieve all records from the database
+        
+        Prefer iter_records() for large tables; this loads every row into memory.
+        
+        Returns:
+            List of tuples containing all records
+        """
+        return list(self.iter_records())
+
+    def iter_records(self, batch_size: int = 500, after: Tuple = None,
+                     extra_columns: Tuple[str, ...] = ()) -> Iterator[Tuple]:
+        """
+        Stream records newest first without loading the whole table
+        
+        Rows are fetched in batches using keyset pagination on
+        (created_at, id), so each batch is an index range scan and memory
+        stays bounded by batch_size. The connection is only held while a
+        batch is being fetched.
+        
+        Args:
+            batch_size: Number of rows fetched per query
+            after: (created_at, id) of the last row already seen; iteration
+                   resumes with the row that follows it
+            extra_columns: Additional records columns (or SQL expressions such
+                           as TAGS_SQL) appended to each tuple
+            
+        Yields:
+            Record tuples in the same order as get_all_records()
+        """
+        select = ', '.join(RECORD_COLUMNS + tuple(extra_columns))
+        while True:
+            with self.session():
+                if after is None:
+                    self.cursor.execute(f'''
+                        SELECT {select}
+                        FROM records
+                        ORDER BY created_at DESC, id DESC
+                        LIMIT ?
+                    ''', (batch_size,))
+                else:
+                    self.cursor.execute(f'''
+                        SELECT {select}
+                        FROM records
+                        WHERE (created_at, id) < (?, ?)
+                        ORDER BY created_at DESC, id DESC
+                        LIMIT ?
+                    ''', (after[0], after[1], batch_size))
+                
+                batch = self.cursor.fetchmany(batch_size)
+            
+            yield from batch
+            
+            if len(batch) < batch_size:
+                return
+            after = (batch[-1][5], batch[-1][0])
+
+    @instrumented(rows=lambda page: len(page['records']))
+    def get_records_page(self, page: int = 1, page_size: int = 50) -> dict:
+        """
+        Get one page of records, newest first
+        
+        Args:
+            page: 1-based page number
+            page_size: Number of records per page
+            
+        Returns:
+            Dictionary with the page's records, paging info, and 'next_after',
+            the key to pass to iter_records(after=...) to continue from this page
+        """
+        page = max(page, 1)
+        with self.session():
+            self.cursor.execute('SELECT COUNT(*) FROM records')
+            total_records = self.cursor.fetchone()[0]
+            
+            self.cursor.execute('''
+                SELECT id, name, link, location, description, created_at, updated_at
+                FROM records
+                ORDER BY created_at DESC, id DESC
+                LIMIT ? OFFSET ?
+            ''', (page_size, (page - 1) * page_size))
+            records = self.cursor.fetchall()
+        
+        return {
+            'records': records,
+            'page': page,
+            'page_size': page_size,
+            'total_records': total_records,
+            'total_pages': (total_records + page_size - 1) // page_size,
+            'next_after': (records[-1][5], records[-1][0]) if records else None
+        }
+        
+    @instrumented(rows=bool)
+    def get_record_by_id(self, record_id: int) -> Optional[Tuple]:
+        """
+        Get a specific record by its ID
+        
+        Args:
+            record_id: The ID of the record to retrieve
+            
+        Returns:
+            Tuple containing the record data, or None if not found
+        """
+        with self.session():
+            self.cursor.execute('''
+                SELECT id, name, link, location, description, created_at, updated_at
+                FROM records
+                WHERE id = ?
+            ''', (record_id,))
+            
+            record = self.cursor.fetchone()
+        
+        return record
+        
+    @instrumented(rows=len)
+    def search_records(self, search_term: str, limit: int = None) -> List[Tuple]:
+        """
+        Search for records by name, description or location
+        
+        Uses the FTS5 index when available: every word in the search term
+        must match the start of a word in the record, and results are ranked
+        by relevance (bm25, name matches weighted highest). Otherwise falls
+        back to a substring LIKE scan ordered by name.
+        
+        Args:
+            search_term: Term to search for
+            limit: Maximum number of results (None for all)
+            
+        Returns:
+            List of matching records
+        """
+        words = SEARCH_WORD_PATTERN.findall(search_term)
+        if words and self._search_index_available():
+            # Quote each word so FTS5 syntax characters are taken literally,
+            # and make it a prefix query
+            match_query = ' '.join(f'"{word}"*' for word in words)
+            with self.session():
+                self.cursor.execute('''
+                    SELECT r.id, r.name, r.link, r.location, r.description, r.created_at, r.updated_at
+                    FROM records_fts
+                    JOIN records r ON r.id = records_fts.rowid
+                    WHERE records_fts MATCH ?
+                    ORDER BY bm25(records_fts, 10.0, 1.0, 5.0)
+                    LIMIT ?
+                ''', (match_query, -1 if limit is None else limit))
+                
+                return self.cursor.fetchall()
+        
+        search_pattern = f"%{search_term}%"
+        with self.session():
+            self.cursor.execute('''
+                SELECT id, name, link, location, description, created_at, updated_at
+                FROM records
+                WHERE name LIKE ? OR description LIKE ? OR location LIKE ?
+                ORDER BY name
+                LIMIT ?
+            ''', (search_pattern, search_pattern, search_pattern, -1 if limit is None else limit))
+            
+            records = self.cursor.fetchall()
+        
+        return records
+        
+    @instrumented(rows=len)
+    def get_by_city(self, city: str, state: str = None) -> List[Tuple]:
+        """
+        Get all records for a city (an index lookup on the normalized city)
+        
+        Args:
+            city: City name, in any case/spacing ("new york", "New  York", "Austin, TX")
+            state: Two-letter state code to narrow the match (optional)
+            
+        Returns:
+            List of matching records ordered by name
+        """
+        city, _, requested_state = city.partition(',')
+        state = state or requested_state
+        with self.session():
+            if state:
+                self.cursor.execute('''
+                    SELECT id, name, link, location, description, created_at, updated_at
+                    FROM records
+                    WHERE city_key = ? AND state = ?
+                    ORDER BY name
+                ''', (city_key(city), state.strip().upper()))
+            else:
+                self.cursor.execute('''
+                    SELECT id, name, link, location, description, created_at, updated_at
+                    FROM records
+                    WHERE city_key = ?
+                    ORDER BY name
+                ''', (city_key(city),))
+            
+            return self.cursor.fetchall()
+
+    @instrumented(rows=len)
+    def search_by_tags(self, tags: Iterable[str], match_all: bool = False, city: str = None,
+                       limit: int = None) -> List[Tuple]:
+        """
+        Get records by resource tag (an index lookup on record_tags)
+        
+        Args:
+            tags: Tags to look for, e.g. ['snap', 'free_meal'] (see TAGS)
+            match_all: Require every tag instead of any of them
+            city: Only return records in this city ("Austin" or "Austin, TX")
+            limit: Maximum number of records to return (all if None)
             
         Returns:
-            The ID of the inserted record
+            List of matching records, newest first
         """
-        self.connect()
+        tags = sorted({tag.strip().lower() for tag in tags if tag and tag.strip()})
+        if not tags:
+            return []
         
-        self.cursor.execute('''
-            INSERT INTO records (name, link, location, description)
-            VALUES (?, ?, ?, ?)
-        ''', (name, link, location, description))
+        placeholders = ', '.join('?' for _ in tags)
+        matching = f'SELECT record_id FROM record_tags WHERE tag IN ({placeholders})'
+        params = list(tags)
+        if match_all:
+            matching += ' GROUP BY record_id HAVING COUNT(*) = ?'
+            params.append(len(tags))
         
-        record_id = self.cursor.lastrowid
-        self.connection.commit()
-        self.disconnect()
+        conditions = [f'id IN ({matching})']
+        if city:
+            city, _, state = city.partition(',')
+            conditions.append('city_key = ?')
+            params.append(city_key(city))
+            if state.strip():
+                conditions.append('state = ?')
+                params.append(state.strip().upper())
         
-        print(f"Record '{name}' added successfully with ID: {record_id}")
-        return record_id
+        query = f'''
+            SELECT {', '.join(RECORD_COLUMNS)}
+            FROM records
+            WHERE {' AND '.join(conditions)}
+            ORDER BY created_at DESC, id DESC
+        '''
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
         
-    def get_all_records(self) -> List[Tuple]:
+        with self.session():
+            self.cursor.execute(query, params)
+            return self.cursor.fetchall()
+
+    @instrumented(rows=int)
+    def backfill_locations(self, batch_size: int = 1000, overwrite: bool = False) -> int:
         """
-        Retrieve all records from the database
+        Fill in city/state/ZIP columns for records that predate them
         
+        Args:
+            batch_size: Number of records updated per transaction
+            overwrite: Recompute every record, not only those without a city
+            
         Returns:
-            List of tuples containing all records
+            Number of records that got a city, state or ZIP code
         """
-        self.connect()
+        updated = 0
+        last_id = 0
+        condition = '' if overwrite else 'AND city_key IS NULL'
         
-        self.cursor.execute('''
-            SELECT id, name, link, location, description, created_at, updated_at
-            FROM records
-            ORDER BY created_at DESC
-        ''')
+        while True:
+            with self.session():
+                self.cursor.execute(f'''
+                    SELECT id, name, location FROM records
+                    WHERE id > ? {condition}
+                    ORDER BY id
+                    LIMIT ?
+                ''', (last_id, batch_size))
+                batch = self.cursor.fetchall()
+                if not batch:
+                    break
+                
+                changes = []
+                for record_id, name, location in batch:
+                    _, city, key, state, zip_code = derived_columns(name, location)
+                    if key or state or zip_code:
+                        changes.append((city, key, state, zip_code, record_id))
+                
+                self.cursor.executemany('''
+                    UPDATE records SET city = ?, city_key = ?, state = ?, zip_code = ?
+                    WHERE id = ?
+                ''', changes)
+                self.connection.commit()
+            
+            updated += len(changes)
+            last_id = batch[-1][0]
         
-        records = self.cursor.fetchall()
-        self.disconnect()
+        return updated
+
+    @instrumented(rows=int)
+    def set_coordinates(self, record_id: int, latitude: float, longitude: float) -> bool:
+        """
+        Set (or clear, with None) the coordinates of a record
         
-        return records
+        Args:
+            record_id: ID of the record
+            latitude: Latitude in decimal degrees
+            longitude: Longitude in decimal degrees
+            
+        Returns:
+            True if the record exists, False otherwise
+        """
+        with self.session():
+            self.cursor.execute('''
+                UPDATE records SET latitude = ?, longitude = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (latitude, longitude, record_id))
+            rows_affected = self.cursor.rowcount
+            self.connection.commit()
         
-    def get_record_by_id(self, record_id: int) -> Optional[Tuple]:
+        return rows_affected > 0
+
+    @instrumented(rows=len)
+    def within_bbox(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> List[Tuple]:
         """
-        Get a specific record by its ID
+        Get records whose coordinates fall inside a bounding box
         
         Args:
-            record_id: The ID of the record to retrieve
+            min_lat: Southern edge
+            min_lng: Western edge
+            max_lat: Northern edge
+            max_lng: Eastern edge
             
         Returns:
-            Tuple containing the record data, or None if not found
+            List of matching records (records without coordinates are never included)
         """
-        self.connect()
+        with self.session():
+            if self._spatial_index_available():
+                self.cursor.execute('''
+                    SELECT r.id, r.name, r.link, r.location, r.description, r.created_at, r.updated_at
+                    FROM records_rtree t
+                    JOIN records r ON r.id = t.id
+                    WHERE t.max_lat >= ? AND t.min_lat <= ?
+                      AND t.max_lng >= ? AND t.min_lng <= ?
+                ''', (min_lat, max_lat, min_lng, max_lng))
+            else:
+                self.cursor.execute('''
+                    SELECT id, name, link, location, description, created_at, updated_at
+                    FROM records
+                    WHERE latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?
+                ''', (min_lat, max_lat, min_lng, max_lng))
+            
+            return self.cursor.fetchall()
+
+    @instrumented(rows=len)
+    def within_radius(self, latitude: float, longitude: float, radius_km: float) -> List[Tuple[Tuple, float]]:
+        """
+        Get records within a distance of a point, nearest first
         
-        self.cursor.execute('''
-            SELECT id, name, link, location, description, created_at, updated_at
-            FROM records
-            WHERE id = ?
-        ''', (record_id,))
+        The spatial index narrows the search to the circle's bounding box;
+        only those candidates get an exact great-circle distance check.
         
-        record = self.cursor.fetchone()
-        self.disconnect()
+        Args:
+            latitude: Latitude of the center point
+            longitude: Longitude of the center point
+            radius_km: Search radius in kilometers
+            
+        Returns:
+            List of (record, distance_km) pairs sorted by distance
+        """
+        lat_delta = math.degrees(radius_km / EARTH_RADIUS_KM)
+        cos_lat = math.cos(math.radians(latitude))
+        # Near the poles the box has to span every longitude
+        lng_delta = 180.0 if cos_lat < 1e-6 else min(180.0, lat_delta / cos_lat)
         
-        return record
+        with self.session():
+            if self._spatial_index_available():
+                self.cursor.execute('''
+                    SELECT r.id, r.name, r.link, r.location, r.description, r.created_at, r.updated_at,
+                           r.latitude, r.longitude
+                    FROM records_rtree t
+                    JOIN records r ON r.id = t.id
+                    WHERE t.max_lat >= ? AND t.min_lat <= ?
+                      AND t.max_lng >= ? AND t.min_lng <= ?
+                ''', (latitude - lat_delta, latitude + lat_delta,
+                      longitude - lng_delta, longitude + lng_delta))
+            else:
+                self.cursor.execute('''
+                    SELECT id, name, link, location, description, created_at, updated_at,
+                           latitude, longitude
+                    FROM records
+                    WHERE latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?
+                ''', (latitude - lat_delta, latitude + lat_delta,
+                      longitude - lng_delta, longitude + lng_delta))
+            candidates = self.cursor.fetchall()
         
-    def search_records(self, search_term: str) -> List[Tuple]:
+        results = []
+        for row in candidates:
+            distance = haversine_km(latitude, longitude, row[7], row[8])
+            if distance <= radius_km:
+                results.append((row[:7], distance))
+        results.sort(key=lambda result: result[1])
+        return results
+
+    @instrumented(rows=len)
+    def nearest(self, latitude: float, longitude: float, k: int = 10) -> List[Tuple[Tuple, float]]:
         """
-        Search for records by name or description
+        Get the k records closest to a point
+        
+        Searches a small radius first and widens it until k records are
+        found, so only nearby index pages are read.
         
         Args:
-            search_term: Term to search for
+            latitude: Latitude of the point
+            longitude: Longitude of the point
+            k: Number of records to return
             
         Returns:
-            List of matching records
+            Up to k (record, distance_km) pairs sorted by distance
         """
-        self.connect()
-        
-        search_pattern = f"%{search_term}%"
-        self.cursor.execute('''
-            SELECT id, name, link, location, description, created_at, updated_at
-            FROM records
-            WHERE name LIKE ? OR description LIKE ? OR location LIKE ?
-            ORDER BY name
-        ''', (search_pattern, search_pattern, search_pattern))
-        
-        records = self.cursor.fetchall()
-        self.disconnect()
-        
-        return records
+        radius_km = 2.0
+        while True:
+            results = self.within_radius(latitude, longitude, radius_km)
+            # Anything outside the circle is farther than everything inside it
+            if len(results) >= k or radius_km >= math.pi * EARTH_RADIUS_KM:
+                return results[:k]
+            radius_km *= 4
         
+    @instrumented(rows=int)
     def update_record(self, record_id: int, name: str = None, link: str = None, 
                      location: str = None, description: str = None) -> bool:
         """
@@ -171,8 +1763,6 @@ class DatabaseManager:
         Returns:
             True if update was successful, False otherwise
         """
-        self.connect()
-        
         # Build dynamic update query based on provided fields
         update_fields = []
         update_values = []
@@ -195,14 +1785,28 @@ class DatabaseManager:
             return False
             
         update_fields.append("updated_at = CURRENT_TIMESTAMP")
+        if name is not None or location is not None:
+            # SET expressions see the old row, so pass the new values explicitly
+            update_fields.append("dedupe_key = dedupe_key(COALESCE(?, name), COALESCE(?, location))")
+            update_values.extend([name, location])
+        if location is not None:
+            # Keep the current city/state/ZIP for parts the new address doesn't have
+            city, state, zip_code = parse_location(location)
+            update_fields.append("city = COALESCE(?, city)")
+            update_fields.append("city_key = COALESCE(?, city_key)")
+            update_fields.append("state = COALESCE(?, state)")
+            update_fields.append("zip_code = COALESCE(?, zip_code)")
+            update_values.extend([city, city_key(city), state, zip_code])
         update_values.append(record_id)
         
         query = f"UPDATE records SET {', '.join(update_fields)} WHERE id = ?"
-        self.cursor.execute(query, update_values)
-        
-        rows_affected = self.cursor.rowcount
-        self.connection.commit()
-        self.disconnect()
+        with self.session():
+            self.cursor.execute(query, update_values)
+            
+            rows_affected = self.cursor.rowcount
+            if rows_affected and (name is not None or description is not None):
+                self._retag('SELECT id, name, description FROM records WHERE id = ?', (record_id,))
+            self.connection.commit()
         
         if rows_affected > 0:
             print(f"Record ID {record_id} updated successfully")
@@ -211,6 +1815,7 @@ class DatabaseManager:
             print(f"No record found with ID {record_id}")
             return False
             
+    @instrumented(rows=int)
     def delete_record(self, record_id: int) -> bool:
         """
         Delete a record from the database
@@ -221,13 +1826,11 @@ class DatabaseManager:
         Returns:
             True if deletion was successful, False otherwise
         """
-        self.connect()
-        
-        self.cursor.execute('DELETE FROM records WHERE id = ?', (record_id,))
-        
-        rows_affected = self.cursor.rowcount
-        self.connection.commit()
-        self.disconnect()
+        with self.session():
+            self.cursor.execute('DELETE FROM records WHERE id = ?', (record_id,))
+            
+            rows_affected = self.cursor.rowcount
+            self.connection.commit()
         
         if rows_affected > 0:
             print(f"Record ID {record_id} deleted successfully")
@@ -236,14 +1839,143 @@ class DatabaseManager:
             print(f"No record found with ID {record_id}")
             return False
             
-    def display_records(self, records: List[Tuple]):
+    @instrumented(rows=int)
+    def delete_records(self, record_ids: Iterable[int]) -> int:
+        """
+        Delete many records in a single transaction
+
+        Args:
+            record_ids: IDs of the records to delete
+
+        Returns:
+            Number of records deleted
+        """
+        with self.session():
+            self.cursor.executemany('DELETE FROM records WHERE id = ?',
+                                    [(record_id,) for record_id in record_ids])
+            deleted = self.cursor.rowcount
+            self.connection.commit()
+
+        return deleted
+
+    @instrumented(rows=len)
+    def links_to_check(self, max_age: float = None, limit: int = None) -> List[str]:
+        """
+        Get the distinct record links that are due for checking
+
+        A link is due if it has never been checked, its last check is at
+        least max_age seconds old, or it was throttled last time.
+
+        Args:
+            max_age: Seconds after which a check goes stale (None: every link is due)
+            limit: Maximum number of links to return
+
+        Returns:
+            Links, never-checked ones first, then the longest unchecked
+        """
+        query = '''
+            SELECT r.link FROM records r
+            LEFT JOIN link_checks c ON c.link = r.link
+            WHERE IFNULL(r.link, '') != ''
+        '''
+        params = []
+        if max_age is not None:
+            query += " AND (c.link IS NULL OR c.checked_at <= datetime('now', ?) OR c.outcome = 'throttled')"
+            params.append(f'-{float(max_age)} seconds')
+        query += ' GROUP BY r.link ORDER BY MAX(c.checked_at) IS NOT NULL, MAX(c.checked_at)'
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+        
+        with self.session():
+            self.cursor.execute(query, params)
+            return [row[0] for row in self.cursor.fetchall()]
+
+    @instrumented(rows=int)
+    def save_link_checks(self, results: Iterable[Tuple]) -> int:
+        """
+        Store link check results, replacing each link's previous result
+
+        Args:
+            results: Tuples in link_checker.LINK_CHECK_COLUMNS order
+
+        Returns:
+            Number of results stored
+        """
+        results = list(results)
+        with self.session():
+            self.cursor.executemany('''
+                INSERT INTO link_checks (link, outcome, status, final_url, error, elapsed_ms, checked_at)
+                VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(link) DO UPDATE SET
+                    outcome = excluded.outcome,
+                    status = excluded.status,
+                    final_url = excluded.final_url,
+                    error = excluded.error,
+                    elapsed_ms = excluded.elapsed_ms,
+                    checked_at = excluded.checked_at
+            ''', results)
+            self.connection.commit()
+        return len(results)
+
+    @instrumented(rows=len)
+    def get_link_problems(self, outcomes: Iterable[str] = ('broken', 'unreachable', 'invalid'),
+                          limit: int = None) -> List[Tuple]:
+        """
+        Get records whose link failed its last check
+
+        Args:
+            outcomes: Check outcomes to report
+            limit: Maximum number of records to return
+
+        Returns:
+            (id, name, link, outcome, status, error, checked_at) tuples,
+            most recently checked first
+        """
+        outcomes = list(outcomes)
+        query = f'''
+            SELECT r.id, r.name, r.link, c.outcome, c.status, c.error, c.checked_at
+            FROM link_checks c
+            JOIN records r ON r.link = c.link
+            WHERE c.outcome IN ({', '.join('?' * len(outcomes))})
+            ORDER BY c.checked_at DESC, r.id
+        '''
+        params = outcomes
+        if limit is not None:
+            query += ' LIMIT ?'
+            params = outcomes + [limit]
+        
+        with self.session():
+            self.cursor.execute(query, params)
+            return self.cursor.fetchall()
+
+    def get_link_stats(self) -> dict:
+        """
+        Count record links by the outcome of their last check
+
+        Returns:
+            Outcome -> number of distinct links, plus 'unchecked'
+        """
+        with self.session():
+            self.cursor.execute('''
+                SELECT IFNULL(c.outcome, 'unchecked'), COUNT(DISTINCT r.link)
+                FROM records r
+                LEFT JOIN link_checks c ON c.link = r.link
+                WHERE IFNULL(r.link, '') != ''
+                GROUP BY 1
+            ''')
+            return dict(self.cursor.fetchall())
+            
+    def display_records(self, records: Iterable[Tuple]):
         """
         Display records in a formatted table
         
         Args:
-            records: List of record tuples to display
+            records: Record tuples to display (a list or e.g. iter_records())
         """
-        if not records:
+        records = iter(records)
+        first = next(records, None)
+        if first is None:
             print("No records found.")
             return
             
@@ -251,7 +1983,7 @@ class DatabaseManager:
         print(f"{'ID':<5} {'Name':<20} {'Link':<30} {'Location':<20} {'Description':<25}")
         print("-"*100)
         
-        for record in records:
+        for record in itertools.chain([first], records):
             id_, name, link, location, desc, created, updated = record
             # Truncate long strings for display
             name = (name[:17] + '...') if len(name) > 20 else name
@@ -262,76 +1994,251 @@ class DatabaseManager:
             print(f"{id_:<5} {name:<20} {link:<30} {location:<20} {desc:<25}")
         print("="*100 + "\n")
     
-    def export_to_csv(self, filename: str = None) -> str:
+    @instrumented()
+    def export_to_csv(self, filename: str = None, batch_size: int = 1000,
+                      compress: Iterable[str] = ()) -> str:
         """
         Export all records to a CSV file
         
+        Records are streamed in batches into a temporary file that is then
+        atomically renamed over the target, so memory stays O(batch_size)
+        and readers never see a half-written export.
+        
         Args:
             filename: Name of the CSV file (if None, auto-generates with timestamp)
+            batch_size: Number of records fetched from the database at a time
+            compress: Also write precompressed siblings, e.g. ('gzip', 'br')
+                      for filename.gz / filename.br (published together
+                      with the file; stale siblings are removed)
             
         Returns:
             Path to the exported CSV file
+            
+        Raises:
+            ValueError: For an unknown compression method (before anything is written)
         """
         import csv
         from datetime import datetime
+        from export_utils import COMPRESSION_SUFFIXES, atomic_write, check_compression
         
+        compress = check_compression(compress)
         if not filename:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"database_backup_{timestamp}.csv"
         
-        records = self.get_all_records()
+        records = self.iter_records(batch_size=batch_size,
+                                    extra_columns=('city', 'state', 'zip_code', TAGS_SQL))
+        first = next(records, None)
         
-        if not records:
+        if first is None:
             print("No records to export.")
             return None
         
         try:
-            with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
+            with atomic_write(filename, 'w', compress, newline='', encoding='utf-8') as csvfile:
                 writer = csv.writer(csvfile)
                 
                 # Write header
-                writer.writerow(['ID', 'Name', 'Link', 'Location', 'Description', 'Created At', 'Updated At'])
+                writer.writerow(['ID', 'Name', 'Link', 'Location', 'Description', 'Created At', 'Updated At',
+                                 'City', 'State', 'ZIP', 'Tags'])
                 
                 # Write records
-                for record in records:
-                    writer.writerow(record)
+                writer.writerow(first)
+                exported = 1
+                for batch in iter(lambda: list(itertools.islice(records, batch_size)), []):
+                    writer.writerows(batch)
+                    exported += len(batch)
+            
+            for method in compress:
+                print(f" Wrote {filename}{COMPRESSION_SUFFIXES[method]}")
             
-            print(f" Exported {len(records)} records to {filename}")
+            print(f" Exported {exported} records to {filename}")
             return filename
             
         except Exception as e:
             print(f" Error exporting to CSV: {e}")
             return None
-    
-    def import_from_csv(self, filename: str) -> int:
+
+    @instrumented()
+    def export_to_binary(self, filename: str = None, coordinates: bool = True,
+                         compress: Iterable[str] = ()) -> str:
+        """
+        Export all records in the compact binary format (see binary_format.py)
+
+        Same records and order as export_to_csv, but with length-prefixed
+        strings and interned city/state/ZIP/tag values, so the file is
+        smaller and the map client decodes it without CSV parsing.
+
+        Args:
+            filename: Output file (if None, auto-generates with timestamp)
+            coordinates: Include latitude/longitude
+            compress: Also write precompressed siblings, e.g. ('gzip', 'br')
+                      (published together with the file, as in export_to_csv)
+
+        Returns:
+            Path to the exported file (None if there was nothing to export)
+
+        Raises:
+            ValueError: For an unknown compression method (before anything is written)
+        """
+        from binary_format import encode_parts
+        from export_utils import COMPRESSION_SUFFIXES, atomic_write, check_compression
+
+        compress = check_compression(compress)
+        if not filename:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"database_backup_{timestamp}.bin"
+
+        extra_columns = ('city', 'state', 'zip_code', TAGS_SQL)
+        if coordinates:
+            extra_columns += ('latitude', 'longitude')
+        records = self.iter_records(extra_columns=extra_columns)
+        first = next(records, None)
+        if first is None:
+            print("No records to export.")
+            return None
+
+        try:
+            # Rows are encoded as they stream in; only the encoded columns
+            # (about the size of the file) are held until they are written
+            exported, parts = encode_parts(itertools.chain((first,), records), coordinates)
+            with atomic_write(filename, 'wb', compress) as f:
+                f.writelines(parts)
+
+            for method in compress:
+                print(f" Wrote {filename}{COMPRESSION_SUFFIXES[method]}")
+
+            print(f" Exported {exported} records to {filename}")
+            return filename
+
+        except Exception as e:
+            print(f" Error exporting to binary: {e}")
+            return None
+
+    @instrumented(rows=int)
+    def import_from_csv(self, filename: str, batch_size: int = 5000, preserve_ids: bool = False,
+                        preserve_timestamps: bool = False, workers: int = 1) -> int:
         """
         Import records from a CSV file
         
+        The file is streamed and rows are inserted with executemany, one
+        transaction per batch, with a progress line after every batch.
+        With workers > 1, CSV parsing is spread across worker processes
+        while this process remains the only database writer.
+        
         Args:
             filename: Path to the CSV file to import
+            batch_size: Number of rows written per transaction
+            preserve_ids: Keep the ID column: a stored record with the same ID
+                          is updated if it has the same name and address,
+                          and a copy of it under another ID is replaced. A
+                          row whose ID belongs to a different record is
+                          never written over it; it is imported under
+                          another ID and reported.
+            preserve_timestamps: Keep the Created At / Updated At columns
+            workers: Number of processes used to parse the CSV
             
         Returns:
             Number of records imported
         """
         import csv
+        import time
+        
+        columns = list(CSV_IMPORT_COLUMNS)
+        if not preserve_ids:
+            columns.remove('id')
+        if not preserve_timestamps:
+            columns.remove('created_at')
+            columns.remove('updated_at')
+        
+        # Empty IDs get a fresh one, empty timestamps default to now
+        placeholders = {
+            'id': "NULLIF(?, '')",
+            'created_at': "COALESCE(NULLIF(?, ''), CURRENT_TIMESTAMP)",
+            'updated_at': "COALESCE(NULLIF(?, ''), CURRENT_TIMESTAMP)",
+        }
+        values = ', '.join(placeholders.get(column, '?') for column in columns)
+        derived = ', '.join(DERIVED_COLUMNS)
+        query = (f"INSERT INTO records ({', '.join(columns)}, {derived}) "
+                 f"VALUES ({values}, {', '.join('?' for _ in DERIVED_COLUMNS)})")
+        if preserve_ids:
+            assignments = ', '.join(
+                f"{column} = excluded.{column}" for column in columns + list(DERIVED_COLUMNS) if column != 'id'
+            )
+            query += f" ON CONFLICT(id) DO UPDATE SET {assignments}"
+        # Rows matching an existing record update it instead of duplicating it
+        upsert = self._upsert_clause()
+        query += upsert
+        
+        # An upsert only resolves one conflict, so with preserved IDs a stored
+        # copy of a row under another ID would fail the dedupe_key index once
+        # the ID conflict is updated; delete those copies before each batch
+        replace_moved = None
+        if preserve_ids and upsert:
+            replace_moved = '''
+                DELETE FROM records WHERE id IN (
+                    SELECT records.id FROM json_each(?) AS incoming
+                    JOIN records ON records.dedupe_key = json_extract(incoming.value, '$[1]')
+                    WHERE json_extract(incoming.value, '$[0]') != ''
+                      AND records.id != CAST(json_extract(incoming.value, '$[0]') AS INTEGER)
+                )
+            '''
+        
+        imported_count = 0
+        moved_ids = []
+        start = time.perf_counter()
         
         try:
-            imported_count = 0
-            
-            with open(filename, 'r', encoding='utf-8') as csvfile:
-                reader = csv.DictReader(csvfile)
+            with open(filename, 'r', encoding='utf-8', newline='') as csvfile:
+                header = next(csv.reader(csvfile), None)
+                if header is None:
+                    print(f"✓ Imported 0 records from {filename} (file is empty)")
+                    return 0
+                
+                positions = {name.strip(): index for index, name in enumerate(header)}
+                indexes = [positions.get(CSV_IMPORT_COLUMNS[column]) for column in columns]
+                key_positions = (columns.index('name'), columns.index('location'), positions.get('City'))
                 
-                for row in reader:
-                    # Skip the ID and timestamps, add only the core data
-                    self.add_record(
-                        name=row.get('Name', ''),
-                        link=row.get('Link', ''),
-                        location=row.get('Location', ''),
-                        description=row.get('Description', '')
-                    )
-                    imported_count += 1
-            
-            print(f"✓ Imported {imported_count} records from {filename}")
+                if workers > 1:
+                    batches = _parse_csv_parallel(csvfile, indexes, key_positions, batch_size, workers)
+                else:
+                    rows = (_csv_row_values(row, indexes, key_positions)
+                            for row in csv.reader(csvfile) if row)
+                    batches = iter(lambda: list(itertools.islice(rows, batch_size)), [])
+                
+                # Upserts hide which IDs were written, so tag each batch's
+                # rows by their (indexed) dedupe keys
+                key_position = len(columns)
+                id_position = columns.index('id') if preserve_ids else None
+                with self.session():
+                    for batch in batches:
+                        if preserve_ids:
+                            batch = self._release_taken_ids(batch, id_position, key_position, moved_ids)
+                        if replace_moved:
+                            self.cursor.execute(replace_moved, (
+                                json.dumps([[row[id_position], row[key_position]] for row in batch]),
+                            ))
+                        self.cursor.executemany(query, batch)
+                        self._retag(
+                            'SELECT id, name, description FROM records '
+                            'WHERE dedupe_key IN (SELECT value FROM json_each(?))',
+                            (json.dumps([row[key_position] for row in batch]),)
+                        )
+                        self.connection.commit()
+                        imported_count += len(batch)
+                        
+                        elapsed = time.perf_counter() - start
+                        print(f"  ... {imported_count:,} records imported "
+                              f"({imported_count / elapsed:,.0f} records/s)")
+            
+            elapsed = time.perf_counter() - start
+            print(f"✓ Imported {imported_count} records from {filename} in {elapsed:.1f}s")
+            if moved_ids:
+                sample = ', '.join(moved_ids[:10]) + (', ...' if len(moved_ids) > 10 else '')
+                print(f"⚠️  {len(moved_ids)} records were imported under other IDs because their "
+                      f"IDs belong to different records: {sample}")
+            if self.snapshot_path and imported_count:
+                self.publish_snapshot()
             return imported_count
             
         except FileNotFoundError:
@@ -339,8 +2246,48 @@ class DatabaseManager:
             return 0
         except Exception as e:
             print(f"❌ Error importing from CSV: {e}")
-            return 0
+            if imported_count:
+                print(f"   {imported_count} records were imported before the error")
+            return imported_count
     
+    def _release_taken_ids(self, batch: List[Tuple], id_position: int, key_position: int,
+                           moved_ids: List[str]) -> List[Tuple]:
+        """
+        Clear the preserved ID of rows whose ID belongs to a different record
+
+        Those rows then get a new ID (or update their own stored copy by
+        dedupe key) instead of overwriting an unrelated record.
+        Must be called inside a session.
+
+        Args:
+            batch: Parsed import rows
+            id_position: Position of the ID among the row values
+            key_position: Position of the dedupe key among the row values
+            moved_ids: Cleared IDs are appended here
+
+        Returns:
+            The batch with those IDs replaced by ''
+        """
+        ids = [row[id_position].strip() for row in batch if row[id_position].strip().isdigit()]
+        if not ids:
+            return batch
+        self.cursor.execute(
+            'SELECT id, dedupe_key FROM records WHERE id IN (SELECT CAST(value AS INTEGER) FROM json_each(?))',
+            (json.dumps(ids),))
+        stored_keys = dict(self.cursor.fetchall())
+        if not stored_keys:
+            return batch
+        
+        rows = []
+        for row in batch:
+            record_id = row[id_position].strip()
+            stored_key = stored_keys.get(int(record_id), row[key_position]) if record_id.isdigit() else row[key_position]
+            if stored_key != row[key_position]:
+                moved_ids.append(record_id)
+                row = row[:id_position] + ('',) + row[id_position + 1:]
+            rows.append(row)
+        return rows
+
     def reset_database(self, confirm: bool = False, backup: bool = True) -> bool:
         """
         Reset the database by deleting all records
@@ -354,10 +2301,9 @@ class DatabaseManager:
         """
         if not confirm:
             # Get record count first
-            self.connect()
-            self.cursor.execute('SELECT COUNT(*) FROM records')
-            count = self.cursor.fetchone()[0]
-            self.disconnect()
+            with self.session():
+                self.cursor.execute('SELECT COUNT(*) FROM records')
+                count = self.cursor.fetchone()[0]
             
             if count == 0:
                 print("Database is already empty.")
@@ -380,66 +2326,98 @@ class DatabaseManager:
                 return False
         
         try:
-            self.connect()
-            
-            # Delete all records
-            self.cursor.execute('DELETE FROM records')
-            
-            # Reset the auto-increment counter
-            self.cursor.execute('DELETE FROM sqlite_sequence WHERE name="records"')
-            
-            # Vacuum the database to reclaim space
-            self.cursor.execute('VACUUM')
-            
-            self.connection.commit()
-            self.disconnect()
+            # Rolls back automatically if anything below fails
+            with self.session():
+                # Delete all records
+                self.cursor.execute('DELETE FROM records')
+                
+                # Reset the auto-increment counter
+                self.cursor.execute('DELETE FROM sqlite_sequence WHERE name="records"')
+                
+                self.connection.commit()
+                
+                # Vacuum the database to reclaim space (must run outside a transaction)
+                self.cursor.execute('VACUUM')
             
             print(" Database reset successfully. All records have been deleted.")
             return True
             
         except Exception as e:
             print(f" Error resetting database: {e}")
-            if self.connection:
-                self.connection.rollback()
-                self.disconnect()
             return False
     
+    @instrumented()
     def get_database_stats(self) -> dict:
         """
         Get statistics about the database
         
+        Counts come from the trigger-maintained stats tables and the date
+        range from the created_at index, so this does not scan records.
+        Databases without the stats tables fall back to counting directly.
+        
         Returns:
             Dictionary containing database statistics
         """
-        self.connect()
-        
-        # Total records
-        self.cursor.execute('SELECT COUNT(*) FROM records')
-        total_records = self.cursor.fetchone()[0]
-        
-        # Records by location (top 5)
-        self.cursor.execute('''
-            SELECT location, COUNT(*) as count 
-            FROM records 
-            GROUP BY location 
-            ORDER BY count DESC 
-            LIMIT 5
-        ''')
-        top_locations = self.cursor.fetchall()
-        
-        # Records with links vs without
-        self.cursor.execute('SELECT COUNT(*) FROM records WHERE link != ""')
-        with_links = self.cursor.fetchone()[0]
-        
-        # Get date range
-        self.cursor.execute('''
-            SELECT MIN(created_at), MAX(created_at) 
-            FROM records
-        ''')
-        date_range = self.cursor.fetchone()
-        
-        self.disconnect()
+        if not self._stats_tables_ready():
+            return self._compute_stats()
         
+        with self.session():
+            self.cursor.execute('SELECT total_records, records_with_links FROM record_stats WHERE id = 1')
+            total_records, with_links = self.cursor.fetchone() or (0, 0)
+            
+            # Records by location (top 5)
+            self.cursor.execute('''
+                SELECT location, count
+                FROM location_counts
+                ORDER BY count DESC
+                LIMIT 5
+            ''')
+            top_locations = self.cursor.fetchall()
+            
+            # Get date range
+            self.cursor.execute('''
+                SELECT MIN(created_at), MAX(created_at) 
+                FROM records
+            ''')
+            date_range = self.cursor.fetchone()
+            
+        return {
+            'total_records': total_records,
+            'top_locations': top_locations,
+            'records_with_links': with_links,
+            'records_without_links': total_records - with_links,
+            'oldest_record': date_range[0] if date_range[0] else None,
+            'newest_record': date_range[1] if date_range[1] else None
+        }
+
+    def _compute_stats(self) -> dict:
+        """Compute get_database_stats() from scratch by scanning records"""
+        with self.session():
+            # Total records
+            self.cursor.execute('SELECT COUNT(*) FROM records')
+            total_records = self.cursor.fetchone()[0]
+            
+            # Records by location (top 5)
+            self.cursor.execute('''
+                SELECT IFNULL(location, ''), COUNT(*) as count 
+                FROM records 
+                GROUP BY IFNULL(location, '') 
+                ORDER BY count DESC 
+                LIMIT 5
+            ''')
+            top_locations = self.cursor.fetchall()
+            
+            # Records with links vs without
+            self.cursor.execute("SELECT COUNT(*) FROM records WHERE link != ''")
+            with_links = self.cursor.fetchone()[0]
+            
+            # Get date range
+            self.cursor.execute('''
+                SELECT MIN(created_at), MAX(created_at) 
+                FROM records
+            ''')
+            date_range = self.cursor.fetchone()
+            
         return {
             'total_records': total_records,
             'top_locations': top_locations,
@@ -449,6 +2427,196 @@ class DatabaseManager:
             'newest_record': date_range[1] if date_range[1] else None
         }
 
+    @instrumented()
+    def verify_stats(self, rebuild: bool = False) -> List[str]:
+        """
+        Check the materialized stats against a full recount
+        
+        Args:
+            rebuild: Recompute the stats tables if they don't match
+            
+        Returns:
+            Descriptions of the mismatches found (empty if the stats are correct)
+        """
+        if not self._stats_tables_ready():
+            return ["Stats tables are missing; run create_database() to add them"]
+        
+        problems = []
+        with self.session():
+            self.cursor.execute('SELECT total_records, records_with_links FROM record_stats WHERE id = 1')
+            stored = self.cursor.fetchone() or (None, None)
+            self.cursor.execute("SELECT COUNT(*), TOTAL(IFNULL(link, '') != '') FROM records")
+            actual = self.cursor.fetchone()
+            for label, stored_value, actual_value in zip(('total_records', 'records_with_links'),
+                                                         stored, actual):
+                if stored_value != actual_value:
+                    problems.append(f"{label}: stored {stored_value}, actual {int(actual_value)}")
+            
+            # Every location whose stored count differs from a recount
+            self.cursor.execute('''
+                WITH actual AS (
+                    SELECT IFNULL(location, '') AS location, COUNT(*) AS count
+                    FROM records GROUP BY IFNULL(location, '')
+                )
+                SELECT a.location, s.count, a.count FROM actual a
+                LEFT JOIN location_counts s ON s.location = a.location
+                WHERE s.count IS NOT a.count
+                UNION ALL
+                SELECT s.location, s.count, NULL FROM location_counts s
+                WHERE s.location NOT IN (SELECT location FROM actual)
+            ''')
+            for location, stored_count, actual_count in self.cursor.fetchall():
+                problems.append(f"location {location!r}: stored {stored_count}, actual {actual_count or 0}")
+            
+            if problems and rebuild:
+                self._rebuild_stats()
+                self.connection.commit()
+        
+        return problems
+
+    def flush_metrics(self) -> bool:
+        """
+        Add the metrics collected since the last flush to the totals stored
+        in the metrics file (op_metrics and slow_queries tables)
+        
+        Without a metrics_path the metrics stay in memory only. The file is
+        separate from the records database, so read-only snapshot managers
+        can flush too.
+        
+        Returns:
+            True if anything was written
+        """
+        if self.metrics is None or not self.metrics_path:
+            return False
+        snapshot = self.metrics.drain()
+        if not snapshot['operations'] and not snapshot['slow_queries']:
+            return False
+        
+        try:
+            connection = open_metrics_db(self.metrics_path)
+            try:
+                save_metrics(connection, snapshot)
+                connection.commit()
+            finally:
+                connection.close()
+        except Exception:
+            # Keep them for the next flush
+            self.metrics.merge(snapshot)
+            raise
+        return True
+
+    def metrics_snapshot(self, include_stored: bool = True) -> dict:
+        """
+        Get operation timings and the slow-query log
+        
+        Args:
+            include_stored: Add the totals flushed to the metrics file (by
+                            this and other processes) to this manager's own
+            
+        Returns:
+            Snapshot to pass to db_metrics.to_json / to_prometheus / summarize
+        """
+        current = self.metrics.snapshot() if self.metrics is not None else \
+            {'operations': {}, 'slow_queries': []}
+        if not include_stored or not self.metrics_path or not os.path.exists(self.metrics_path):
+            return current
+        
+        connection = open_metrics_db(self.metrics_path)
+        try:
+            stored = load_metrics(connection)
+        finally:
+            connection.close()
+        return merge_snapshots(stored, current)
+
+    def reset_metrics(self):
+        """Discard collected and stored metrics"""
+        if self.metrics is not None:
+            self.metrics.drain()
+        if not self.metrics_path or not os.path.exists(self.metrics_path):
+            return
+        connection = open_metrics_db(self.metrics_path)
+        try:
+            clear_metrics(connection)
+            connection.commit()
+        finally:
+            connection.close()
+
+
+    @instrumented()
+    def publish_snapshot(self, path: str = None) -> str:
+        """
+        Publish a read-only copy of the database for readers
+        
+        The copy is made with the SQLite backup API (a consistent view
+        even while other connections write), switched out of WAL mode and
+        then atomically renamed over the previous snapshot. Readers that
+        still have the old file open keep a consistent view of it until
+        they reconnect; managers from open_snapshot() do so on their next
+        query.
+        
+        Args:
+            path: Snapshot file (defaults to snapshot_path, or
+                  my_records.snapshot.db next to the database)
+            
+        Returns:
+            Path of the published snapshot
+        """
+        path = path or self.snapshot_path or snapshot_path_for(self.db_path)
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        
+        with self._snapshot_lock:
+            target = sqlite3.connect(temporary)
+            try:
+                with self.session():
+                    self.connection.backup(target)
+                # Readers open it immutable, so it must not depend on a -wal file
+                target.execute('PRAGMA journal_mode = DELETE')
+                target.close()
+                os.replace(temporary, path)
+            except Exception:
+                target.close()
+                if os.path.exists(temporary):
+                    os.remove(temporary)
+                raise
+        
+        return path
+
+    def open_snapshot(self, path: str = None) -> 'DatabaseManager':
+        """
+        Open a published snapshot for reading
+        
+        Queries on the returned manager never wait on (or block) writers to
+        this database, and pick up a newly published snapshot automatically.
+        
+        Args:
+            path: Snapshot file (same default as publish_snapshot)
+            
+        Returns:
+            A read-only DatabaseManager
+            
+        Raises:
+            FileNotFoundError: If no snapshot has been published there yet
+        """
+        path = path or self.snapshot_path or snapshot_path_for(self.db_path)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No snapshot at {path}; run 'python db_utils.py snapshot' first")
+        return DatabaseManager(path, persistent=self.persistent,
+                               pool_size=self.pool.size if self.pool else 4,
+                               instrument=self.metrics is not None,
+                               slow_query_ms=self.metrics.slow_query_ms if self.metrics else None,
+                               read_only=True, metrics_path=self.metrics_path)
+
+
+def _flush_metrics_at_exit(reference: weakref.ref):
+    """Flush a manager's metrics when the process exits (if it still exists)"""
+    manager = reference()
+    if manager is None:
+        return
+    try:
+        manager.flush_metrics()
+    except Exception:
+        pass
+
 
 def main():
     """Main function demonstrating database usage"""
@@ -491,8 +2659,7 @@ def main():
     
     # Display all records
     print("\n--- All Records ---")
-    all_records = db.get_all_records()
-    db.display_records(all_records)
+    db.display_records(db.iter_records())
     
     # Search for records
     print("\n--- Search Results for 'Python' ---")
@@ -537,8 +2704,7 @@ def main():
             db.add_record(name, link, location, description)
             
         elif choice == "2":
-            records = db.get_all_records()
-            db.display_records(records)
+            db.display_records(db.iter_records())
             
         elif choice == "3":
             search_term = input("Enter search term: ").strip()
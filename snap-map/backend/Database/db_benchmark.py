@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Database Benchmark
+Times the DatabaseManager operations on synthetic data and saves the results
+as JSON so runs can be compared for regressions
+
+For every operation it reports throughput, p50/p99 latency and peak Python
+memory (tracemalloc, measured in a separate untimed call so tracing does
+not distort the latencies). Exports also record their file size in bytes.
+
+Usage: python db_benchmark.py [--rows 1000,10000] [--seed N] [--output FILE]
+                              [--compare OLD.json]
+"""
+
+import contextlib
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+from unittest import mock
+
+from binary_format import read_binary
+from database_manager import DatabaseManager
+import db_utils
+
+CITIES = [
+    ("New York", "NY"), ("Los Angeles", "CA"), ("Chicago", "IL"), ("Houston", "TX"),
+    ("Phoenix", "AZ"), ("Philadelphia", "PA"), ("San Antonio", "TX"), ("San Diego", "CA"),
+    ("Dallas", "TX"), ("Austin", "TX"), ("Jacksonville", "FL"), ("Columbus", "OH"),
+    ("Charlotte", "NC"), ("Indianapolis", "IN"), ("Seattle", "WA"), ("Denver", "CO"),
+    ("Washington", "DC"), ("Boston", "MA"), ("Nashville", "TN"), ("Detroit", "MI"),
+    ("Portland", "OR"), ("Las Vegas", "NV"), ("Memphis", "TN"), ("Louisville", "KY"),
+    ("Baltimore", "MD"), ("Milwaukee", "WI"), ("Albuquerque", "NM"), ("Pittsburgh", "PA"),
+    ("St. Louis", "MO"), ("New Orleans", "LA"), ("Cleveland", "OH"), ("Atlanta", "GA"),
+]
+NAME_PREFIXES = ["Community", "Neighborhood", "St. Mary's", "Grace", "Hope", "Unity", "Riverside",
+                 "Eastside", "Westside", "Harvest", "Open Door", "Good Shepherd", "Second Helping"]
+NAME_KINDS = ["Food Bank", "Food Pantry", "Soup Kitchen", "Community Kitchen", "Farmers Market",
+              "Meal Program", "Mobile Pantry", "Grocery Distribution", "Free Fridge"]
+STREETS = ["Main", "Oak", "Maple", "Cedar", "Elm", "Washington", "Lincoln", "Park", "Lake", "Hill"]
+STREET_TYPES = ["Street", "Avenue", "Road", "Boulevard", "Drive"]
+SENTENCES = [
+    "Free groceries are distributed every Saturday morning.",
+    "Accepts SNAP/EBT and doubles benefits on fresh produce.",
+    "Serves a hot meal to anyone in need, no questions asked.",
+    "Volunteers pack emergency food boxes for families.",
+    "Offers fresh produce, dairy and canned goods at no cost.",
+    "Bring a photo ID and proof of address on your first visit.",
+    "Wheelchair accessible, with parking behind the building.",
+    "Spanish and English speaking staff are available.",
+    "Partners with local farms to rescue surplus food.",
+    "Seniors and veterans can sign up for home delivery.",
+]
+
+# Search terms drawn from the generated vocabulary (plus one that never matches)
+SEARCH_TERMS = ["food bank", "pantry", "Harvest", "soup", "produce", "Austin", "Oak Street",
+                "Community Kitchen", "snap", "zzznomatch"]
+
+
+def generate_records(count: int, seed: int = 42, duplicate_rate: float = 0.05) -> List[Tuple]:
+    """
+    Build realistic synthetic records
+
+    About duplicate_rate of the rows repeat an earlier record with
+    different case, punctuation or abbreviations, as re-crawls produce.
+
+    Args:
+        count: Number of records
+        seed: Random seed, so runs are comparable
+        duplicate_rate: Fraction of rows that duplicate an earlier row
+
+    Returns:
+        (name, link, location, description) tuples
+    """
+    rng = random.Random(seed)
+    records = []
+    for index in range(count):
+        if records and rng.random() < duplicate_rate:
+            name, link, location, description = rng.choice(records)
+            name = name.upper() if rng.random() < 0.5 else name + "."
+            location = location.replace("Street", "St").replace("Avenue", "Ave")
+            records.append((name, link, location, description))
+            continue
+
+        city, state = rng.choice(CITIES)
+        name = f"{rng.choice(NAME_PREFIXES)} {rng.choice(NAME_KINDS)} #{index}"
+        location = (f"{rng.randint(1, 9999)} {rng.choice(STREETS)} {rng.choice(STREET_TYPES)}, "
+                    f"{city}, {state} {rng.randint(10000, 99999)}")
+        link = f"https://example.org/{index}" if rng.random() < 0.7 else ""
+        description = " ".join(rng.choices(SENTENCES, k=rng.randint(2, 12)))
+        records.append((name, link, location, description))
+    return records
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silence the database layer's progress prints"""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def measure(operation: Callable, calls: int, items_per_call: int = 1,
+            setup: Callable = None) -> Dict:
+    """
+    Time repeated calls of an operation, then trace one more call for peak memory
+
+    Args:
+        operation: Function taking the call number (or setup's result)
+        calls: Number of timed calls
+        items_per_call: Records processed per call (for throughput)
+        setup: Untimed function run before each call; takes the call
+               number and returns the argument for operation
+
+    Returns:
+        Timing and memory summary
+    """
+    setup = setup or (lambda call: call)
+    latencies = []
+    with quiet():
+        for call in range(calls):
+            argument = setup(call)
+            start = time.perf_counter()
+            operation(argument)
+            latencies.append(time.perf_counter() - start)
+
+        argument = setup(calls)
+        tracemalloc.start()
+        try:
+            operation(argument)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    total = sum(latencies)
+    return {
+        'calls': calls,
+        'items': calls * items_per_call,
+        'total_s': round(total, 4),
+        'throughput_per_s': round(calls * items_per_call / total, 1) if total else None,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 3),
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def run_suite(rows: int, directory: str, seed: int) -> Dict[str, Dict]:
+    """Run every benchmark against a database of the given size"""
+    records = generate_records(rows, seed)
+    results = {}
+    db_path = os.path.join(directory, f"bench_{rows}.db")
+
+    db = DatabaseManager(db_path)
+    with quiet():
+        db.create_database()
+
+    # Bulk insert: the whole data set in batches of 1000
+    batch_size = 1000
+    batches = [records[start:start + batch_size] for start in range(0, rows, batch_size)]
+    results['add_records_many'] = measure(
+        lambda call: db.add_records_many(batches[call % len(batches)]),
+        len(batches), items_per_call=min(batch_size, rows)
+    )
+
+    # Single inserts (each its own transaction)
+    single = generate_records(min(rows, 2000), seed + 1, duplicate_rate=0)
+    results['add_record'] = measure(
+        lambda call: db.add_record(*single[call % len(single)]), len(single) - 1
+    )
+
+    results['search_records'] = measure(
+        lambda call: db.search_records(SEARCH_TERMS[call % len(SEARCH_TERMS)], limit=50), 200
+    )
+
+    total = db.get_database_stats()['total_records']
+    results['get_all_records'] = measure(lambda call: db.get_all_records(), 3, items_per_call=total)
+
+    results['get_database_stats'] = measure(lambda call: db.get_database_stats(), 200)
+
+    export_path = os.path.join(directory, f"export_{rows}.csv")
+    results['export_to_csv'] = measure(lambda call: db.export_to_csv(export_path), 3, items_per_call=total)
+    results['export_to_csv']['bytes'] = os.path.getsize(export_path)
+
+    binary_path = os.path.join(directory, f"export_{rows}.bin")
+    results['export_to_binary'] = measure(lambda call: db.export_to_binary(binary_path), 3, items_per_call=total)
+    results['export_to_binary']['bytes'] = os.path.getsize(binary_path)
+    results['read_binary'] = measure(lambda call: read_binary(binary_path), 3, items_per_call=total)
+
+    def import_into_fresh_db(call):
+        target = DatabaseManager(os.path.join(directory, f"import_{rows}_{call}.db"))
+        target.create_database()
+        target.import_from_csv(export_path)
+        target.close()
+
+    results['import_from_csv'] = measure(import_into_fresh_db, 3, items_per_call=total)
+
+    results['find_near_duplicates'] = measure(lambda call: db.find_near_duplicates(), 3, items_per_call=total)
+    db.close()
+
+    # clean_duplicates needs a legacy database whose duplicates were never
+    # merged; building it is setup, so only the clean itself is timed
+    def legacy_db(call):
+        path = os.path.join(directory, f"legacy_{rows}_{call}.db")
+        DatabaseManager(path).create_database()
+        with sqlite3.connect(path) as connection:
+            connection.execute('DROP INDEX idx_dedupe_key')
+        legacy = DatabaseManager(path)
+        legacy.add_records_many(records)
+        return legacy
+
+    def clean(legacy):
+        with mock.patch('builtins.input', return_value='y'):
+            db_utils.clean_duplicates(legacy)
+        legacy.close()
+
+    results['clean_duplicates'] = measure(clean, 3, items_per_call=rows, setup=legacy_db)
+
+    return results
+
+
+def git_commit() -> str:
+    """Current commit of the repository, if available"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+
+def compare(current: Dict, baseline: Dict):
+    """Print how each operation's p50 and throughput changed against a baseline run"""
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'} ({baseline.get('started_at')}):")
+    for rows, operations in current['results'].items():
+        for name, result in operations.items():
+            old = baseline.get('results', {}).get(rows, {}).get(name)
+            if not old or not old.get('p50_ms'):
+                continue
+            change = (result['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100
+            flag = "  ⚠️  slower" if change > 20 else ""
+            print(f"  {rows:>8} rows  {name:<20} p50 {old['p50_ms']:>10.3f} -> "
+                  f"{result['p50_ms']:>10.3f} ms ({change:+.0f}%){flag}")
+
+
+def main():
+    """Run the suite for each requested size and save the results"""
+    args = sys.argv[1:]
+    try:
+        sizes = [int(size) for size in args[args.index("--rows") + 1].split(',')] \
+            if "--rows" in args else [1000, 10000]
+        seed = int(args[args.index("--seed") + 1]) if "--seed" in args else 42
+        output = args[args.index("--output") + 1] if "--output" in args else \
+            f"db_benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        baseline_path = args[args.index("--compare") + 1] if "--compare" in args else None
+    except (IndexError, ValueError):
+        print(__doc__)
+        return
+
+    report = {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': sys.version.split()[0],
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'seed': seed,
+        'results': {},
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in sizes:
+            print(f"\nBenchmarking with {rows:,} rows...")
+            results = run_suite(rows, directory, seed)
+            report['results'][str(rows)] = results
+
+            print(f"{'Operation':<20} {'calls':>6} {'items/s':>12} {'p50 ms':>10} {'p99 ms':>10} {'peak KB':>10}")
+            print("-" * 72)
+            for name, result in results.items():
+                print(f"{name:<20} {result['calls']:>6} {result['throughput_per_s'] or 0:>12,.0f} "
+                      f"{result['p50_ms']:>10.3f} {result['p99_ms']:>10.3f} {result['peak_memory_kb']:>10,.1f}")
+
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Results saved to {output}")
+
+    if baseline_path:
+        with open(baseline_path, 'r', encoding='utf-8') as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
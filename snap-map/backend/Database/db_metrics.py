@@ -0,0 +1,628 @@
+#!/usr/bin/env python3
+"""
+Database Metrics
+Per-operation latency histograms, call/row/query counters and a slow-query
+log for DatabaseManager, with Prometheus text and JSON output
+
+Metrics are collected in memory. Keeping them is opt-in: when a metrics file
+is configured (DatabaseManager(metrics_path=...) or the SNAPMAP_METRICS_DB
+environment variable), they are flushed into its op_metrics and slow_queries
+tables, so every process using the database - the CLI, the worker service,
+batch crawls - adds to the same totals and `python db_utils.py metrics` can
+show them. The records database itself (and its snapshots) never holds them.
+"""
+
+import bisect
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+# Upper bounds of the latency histogram buckets, in milliseconds (plus +Inf)
+LATENCY_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+DEFAULT_SLOW_QUERY_MS = 100.0
+
+# Slow queries kept in memory and in the slow_queries table
+SLOW_LOG_SIZE = 200
+
+# Longest SQL text / parameter list stored with a slow query
+SLOW_LOG_TEXT_LIMIT = 2000
+SLOW_LOG_PARAMS_LIMIT = 300
+
+# Queries run outside any instrumented method (e.g. by shard_export)
+OTHER_OPERATION = "other"
+
+METRIC_PREFIX = "snapmap_db"
+
+# Environment variable naming the file metrics are flushed to (unset: memory only)
+METRICS_PATH_ENV = "SNAPMAP_METRICS_DB"
+
+
+def _empty_operation() -> Dict:
+    """Counters of an operation that has not run yet"""
+    return {
+        'calls': 0,
+        'errors': 0,
+        'rows': 0,
+        'queries': 0,
+        'total_ms': 0.0,
+        'max_ms': 0.0,
+        'buckets': [0] * (len(LATENCY_BUCKETS_MS) + 1),
+    }
+
+
+def bucket_percentile(buckets: List[int], fraction: float) -> Optional[float]:
+    """
+    Estimate a latency percentile from histogram buckets
+
+    Args:
+        buckets: Per-bucket counts aligned with LATENCY_BUCKETS_MS (+ overflow)
+        fraction: Percentile as a fraction, e.g. 0.99
+
+    Returns:
+        Upper bound in ms of the bucket holding the percentile (inf for the
+        overflow bucket), or None if there are no observations
+    """
+    total = sum(buckets)
+    if not total:
+        return None
+    target = fraction * total
+    seen = 0
+    for bound, count in zip(LATENCY_BUCKETS_MS + (float('inf'),), buckets):
+        seen += count
+        if seen >= target:
+            return bound
+    return float('inf')
+
+
+class Metrics:
+    """Thread-safe registry of operation timings and slow queries"""
+
+    def __init__(self, slow_query_ms: float = DEFAULT_SLOW_QUERY_MS):
+        """
+        Initialize an empty registry
+
+        Args:
+            slow_query_ms: Queries taking at least this long are logged with
+                           their query plan (None disables the log)
+        """
+        self.slow_query_ms = slow_query_ms
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._operations = {}
+        self._slow_queries = deque(maxlen=SLOW_LOG_SIZE)
+
+    @property
+    def current_operation(self) -> str:
+        """Innermost instrumented operation running on this thread"""
+        stack = getattr(self._local, 'stack', None)
+        return stack[-1] if stack else OTHER_OPERATION
+
+    def operation(self, name: str) -> 'OperationTimer':
+        """
+        Time a with-block as one call of an operation
+
+        Returns:
+            Context manager whose 'rows' attribute the block may set to the
+            number of rows it handled
+        """
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return OperationTimer(self, name, stack)
+
+    def observe(self, name: str, seconds: float, rows: int = 0, error: bool = False):
+        """Record one call of an operation"""
+        elapsed_ms = seconds * 1000
+        with self._lock:
+            stats = self._operations.get(name)
+            if stats is None:
+                stats = self._operations[name] = _empty_operation()
+            stats['calls'] += 1
+            stats['errors'] += error
+            stats['rows'] += rows
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+            stats['buckets'][bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+
+    def observe_query(self, connection: sqlite3.Connection, sql: str, params, seconds: float):
+        """
+        Count one statement against the current operation and log it if slow
+
+        Args:
+            connection: Connection the statement ran on (used for EXPLAIN QUERY PLAN)
+            sql: Statement text
+            params: Bound parameters (None for executemany)
+            seconds: Time spent executing and fetching
+        """
+        name = self.current_operation
+        elapsed_ms = seconds * 1000
+        slow = self.slow_query_ms is not None and elapsed_ms >= self.slow_query_ms
+        entry = None
+        if slow:
+            entry = {
+                'logged_at': time.time(),
+                'operation': name,
+                'elapsed_ms': round(elapsed_ms, 3),
+                'sql': ' '.join(sql.split())[:SLOW_LOG_TEXT_LIMIT],
+                'params': repr(params)[:SLOW_LOG_PARAMS_LIMIT] if params is not None else None,
+                'plan': query_plan(connection, sql, params),
+            }
+
+        with self._lock:
+            stats = self._operations.get(name)
+            if stats is None:
+                stats = self._operations[name] = _empty_operation()
+            stats['queries'] += 1
+            if entry is not None:
+                self._slow_queries.append(entry)
+
+    def snapshot(self) -> Dict:
+        """
+        Copy of the current metrics
+
+        Returns:
+            {'operations': {name: counters}, 'slow_queries': [...]}
+        """
+        with self._lock:
+            return {
+                'operations': {name: dict(stats, buckets=list(stats['buckets']))
+                               for name, stats in self._operations.items()},
+                'slow_queries': list(self._slow_queries),
+            }
+
+    def drain(self) -> Dict:
+        """Return the current metrics and reset the registry"""
+        with self._lock:
+            snapshot = {
+                'operations': self._operations,
+                'slow_queries': list(self._slow_queries),
+            }
+            self._operations = {}
+            self._slow_queries.clear()
+        return snapshot
+
+    def merge(self, snapshot: Dict):
+        """Add a snapshot's counters back into the registry (e.g. after a failed flush)"""
+        with self._lock:
+            self._operations = merge_snapshots({'operations': self._operations}, snapshot)['operations']
+            self._slow_queries.extend(snapshot.get('slow_queries', []))
+
+
+class OperationTimer:
+    """One timed call of an operation (see Metrics.operation)"""
+
+    __slots__ = ('metrics', 'name', 'stack', 'rows', 'start')
+
+    def __init__(self, metrics: Metrics, name: str, stack: List[str]):
+        self.metrics = metrics
+        self.name = name
+        self.stack = stack
+        self.rows = 0
+
+    def __enter__(self):
+        self.stack.append(self.name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.perf_counter() - self.start
+        self.stack.pop()
+        self.metrics.observe(self.name, elapsed, self.rows, exc_type is not None)
+
+
+def merge_snapshots(first: Dict, second: Dict) -> Dict:
+    """
+    Combine two metric snapshots
+
+    Returns:
+        A new snapshot with summed counters and both slow-query logs, oldest first
+    """
+    operations = {name: dict(stats, buckets=list(stats['buckets']))
+                  for name, stats in first.get('operations', {}).items()}
+    for name, stats in second.get('operations', {}).items():
+        target = operations.get(name)
+        if target is None:
+            operations[name] = dict(stats, buckets=list(stats['buckets']))
+            continue
+        for counter in ('calls', 'errors', 'rows', 'queries', 'total_ms'):
+            target[counter] += stats[counter]
+        target['max_ms'] = max(target['max_ms'], stats['max_ms'])
+        target['buckets'] = [a + b for a, b in zip(target['buckets'], stats['buckets'])]
+
+    slow_queries = sorted(first.get('slow_queries', []) + second.get('slow_queries', []),
+                          key=lambda entry: entry['logged_at'])[-SLOW_LOG_SIZE:]
+    return {'operations': operations, 'slow_queries': slow_queries}
+
+
+def query_plan(connection: sqlite3.Connection, sql: str, params=None) -> str:
+    """
+    EXPLAIN QUERY PLAN of a statement, one step per line
+
+    Args:
+        connection: Connection to explain the statement on
+        sql: Statement text
+        params: Parameters it ran with (None binds NULL to every placeholder)
+
+    Returns:
+        The plan, or "" for statements that have none (PRAGMA, BEGIN, ...)
+    """
+    if params is None:
+        params = (None,) * sql.count('?')
+    try:
+        # Straight to sqlite3 so the EXPLAIN is not counted as a query itself
+        rows = sqlite3.Connection.execute(connection, f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+    except sqlite3.Error:
+        return ""
+    # (id, parent, notused, detail) - indent each step under its parent
+    depth = {0: -1}
+    lines = []
+    for step_id, parent, _, detail in rows:
+        depth[step_id] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[step_id] + detail)
+    return '\n'.join(lines)
+
+
+class TimedCursor(sqlite3.Cursor):
+    """
+    Cursor that reports each statement to a Metrics registry
+
+    A statement's time covers its execute() call and every fetch (or
+    iteration step) until its rows run out, the next statement runs or the
+    cursor is closed or discarded.
+    """
+
+    metrics = None
+    _statement = None
+    _elapsed = 0.0
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._statement = (sql, parameters)
+            self._elapsed = time.perf_counter() - start
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._statement = (sql, None)
+            self._elapsed = time.perf_counter() - start
+
+    def fetchone(self):
+        start = time.perf_counter()
+        try:
+            row = super().fetchone()
+        finally:
+            self._elapsed += time.perf_counter() - start
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        try:
+            rows = super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            self._elapsed += time.perf_counter() - start
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._elapsed += time.perf_counter() - start
+            self._finish()
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            return super().__next__()
+        except StopIteration:
+            self._elapsed += time.perf_counter() - start
+            self._finish()
+            raise
+        finally:
+            if self._statement is not None:
+                self._elapsed += time.perf_counter() - start
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # Cursors from connection.execute() are often dropped after one fetch
+        if self._statement is not None:
+            try:
+                self._finish()
+            except Exception:
+                pass
+
+    def _finish(self):
+        """Report the previous statement, if any"""
+        if self._statement is None or self.metrics is None:
+            return
+        sql, params = self._statement
+        self._statement = None
+        self.metrics.observe_query(self.connection, sql, params, self._elapsed)
+
+
+class TimedConnection(sqlite3.Connection):
+    """
+    Connection whose cursors are TimedCursors while `metrics` is set
+
+    Covers the connection.execute() / executemany() shortcuts too, so every
+    statement on the connection is counted, not only those run through the
+    manager's own cursor.
+    """
+
+    metrics = None
+
+    def cursor(self, factory=None):
+        if factory is None:
+            if self.metrics is None:
+                return super().cursor()
+            factory = TimedCursor
+        cursor = super().cursor(factory)
+        if isinstance(cursor, TimedCursor):
+            cursor.metrics = self.metrics
+        return cursor
+
+    def execute(self, sql, parameters=()):
+        if self.metrics is None:
+            return super().execute(sql, parameters)
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if self.metrics is None:
+            return super().executemany(sql, seq_of_parameters)
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def instrumented(rows: Callable = None):
+    """
+    Decorator timing a DatabaseManager method as an operation of self.metrics
+
+    Args:
+        rows: Function turning the method's return value into the number of
+              rows it handled (e.g. len); calls are only counted if None
+    """
+    def decorator(method):
+        name = method.__name__
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self.metrics is None:
+                return method(self, *args, **kwargs)
+            with self.metrics.operation(name) as call:
+                result = method(self, *args, **kwargs)
+                if rows is not None and result is not None:
+                    call.rows = int(rows(result))
+                return result
+
+        return wrapper
+    return decorator
+
+
+def default_metrics_path() -> Optional[str]:
+    """Metrics file named by SNAPMAP_METRICS_DB, or None to keep metrics in memory"""
+    return os.environ.get(METRICS_PATH_ENV) or None
+
+
+def open_metrics_db(path: str) -> sqlite3.Connection:
+    """
+    Open (creating if needed) a metrics file
+
+    Args:
+        path: Metrics database file, separate from the records database
+
+    Returns:
+        A connection with the op_metrics and slow_queries tables in place
+    """
+    connection = sqlite3.connect(path, timeout=5.0)
+    connection.execute("PRAGMA journal_mode = WAL")
+    create_metrics_tables(connection)
+    connection.commit()
+    return connection
+
+
+def create_metrics_tables(connection: sqlite3.Connection):
+    """Create the op_metrics and slow_queries tables if needed"""
+    connection.execute('''
+        CREATE TABLE IF NOT EXISTS op_metrics (
+            operation TEXT PRIMARY KEY,
+            calls INTEGER NOT NULL,
+            errors INTEGER NOT NULL,
+            rows INTEGER NOT NULL,
+            queries INTEGER NOT NULL,
+            total_ms REAL NOT NULL,
+            max_ms REAL NOT NULL,
+            buckets TEXT NOT NULL
+        )
+    ''')
+    connection.execute('''
+        CREATE TABLE IF NOT EXISTS slow_queries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            logged_at REAL NOT NULL,
+            operation TEXT NOT NULL,
+            elapsed_ms REAL NOT NULL,
+            sql TEXT NOT NULL,
+            params TEXT,
+            plan TEXT
+        )
+    ''')
+
+
+def save_metrics(connection: sqlite3.Connection, snapshot: Dict):
+    """
+    Add a snapshot to the totals stored in a metrics file (one transaction)
+
+    Args:
+        connection: Connection from open_metrics_db()
+        snapshot: Metrics from Metrics.drain()
+    """
+    create_metrics_tables(connection)
+    stored = {row[0]: row for row in connection.execute(
+        'SELECT operation, buckets FROM op_metrics'
+    )}
+    for name, stats in snapshot['operations'].items():
+        buckets = stats['buckets']
+        if name in stored:
+            old = json.loads(stored[name][1])
+            if len(old) == len(buckets):
+                buckets = [a + b for a, b in zip(old, buckets)]
+        connection.execute('''
+            INSERT INTO op_metrics (operation, calls, errors, rows, queries, total_ms, max_ms, buckets)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(operation) DO UPDATE SET
+                calls = calls + excluded.calls,
+                errors = errors + excluded.errors,
+                rows = rows + excluded.rows,
+                queries = queries + excluded.queries,
+                total_ms = total_ms + excluded.total_ms,
+                max_ms = MAX(max_ms, excluded.max_ms),
+                buckets = excluded.buckets
+        ''', (name, stats['calls'], stats['errors'], stats['rows'], stats['queries'],
+              stats['total_ms'], stats['max_ms'], json.dumps(buckets)))
+
+    connection.executemany('''
+        INSERT INTO slow_queries (logged_at, operation, elapsed_ms, sql, params, plan)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(entry['logged_at'], entry['operation'], entry['elapsed_ms'], entry['sql'],
+           entry['params'], entry['plan']) for entry in snapshot['slow_queries']])
+    connection.execute('''
+        DELETE FROM slow_queries
+        WHERE id <= (SELECT MAX(id) FROM slow_queries) - ?
+    ''', (SLOW_LOG_SIZE,))
+
+
+def load_metrics(connection: sqlite3.Connection) -> Dict:
+    """
+    Metrics stored in a metrics file (empty if none were ever flushed)
+
+    Returns:
+        A snapshot in the same shape as Metrics.snapshot()
+    """
+    snapshot = {'operations': {}, 'slow_queries': []}
+    try:
+        rows = connection.execute('''
+            SELECT operation, calls, errors, rows, queries, total_ms, max_ms, buckets
+            FROM op_metrics
+        ''').fetchall()
+        slow = connection.execute('''
+            SELECT logged_at, operation, elapsed_ms, sql, params, plan
+            FROM slow_queries ORDER BY id
+        ''').fetchall()
+    except sqlite3.OperationalError:
+        return snapshot
+
+    for name, calls, errors, row_count, queries, total_ms, max_ms, buckets in rows:
+        buckets = json.loads(buckets)
+        if len(buckets) != len(LATENCY_BUCKETS_MS) + 1:
+            # Stored with different bucket bounds - keep the counters only
+            buckets = [0] * len(LATENCY_BUCKETS_MS) + [calls]
+        snapshot['operations'][name] = {
+            'calls': calls, 'errors': errors, 'rows': row_count, 'queries': queries,
+            'total_ms': total_ms, 'max_ms': max_ms, 'buckets': buckets,
+        }
+    snapshot['slow_queries'] = [
+        dict(zip(('logged_at', 'operation', 'elapsed_ms', 'sql', 'params', 'plan'), row))
+        for row in slow
+    ]
+    return snapshot
+
+
+def clear_metrics(connection: sqlite3.Connection):
+    """Delete the stored metrics"""
+    create_metrics_tables(connection)
+    connection.execute('DELETE FROM op_metrics')
+    connection.execute('DELETE FROM slow_queries')
+
+
+def summarize(snapshot: Dict) -> Dict:
+    """
+    JSON-ready view of a snapshot with means and estimated percentiles added
+
+    Returns:
+        The snapshot with, per operation, mean_ms, p50_ms and p99_ms (bucket
+        upper bounds) and the histogram as {"<=bound": count}
+    """
+    operations = {}
+    for name, stats in sorted(snapshot['operations'].items()):
+        calls = stats['calls']
+        labels = [f"<={bound:g}" for bound in LATENCY_BUCKETS_MS] + ["+Inf"]
+        p50 = bucket_percentile(stats['buckets'], 0.50)
+        p99 = bucket_percentile(stats['buckets'], 0.99)
+        operations[name] = {
+            'calls': calls,
+            'errors': stats['errors'],
+            'rows': stats['rows'],
+            'queries': stats['queries'],
+            'total_ms': round(stats['total_ms'], 3),
+            'mean_ms': round(stats['total_ms'] / calls, 3) if calls else None,
+            'p50_ms': None if p50 in (None, float('inf')) else p50,
+            'p99_ms': None if p99 in (None, float('inf')) else p99,
+            'max_ms': round(stats['max_ms'], 3),
+            'histogram_ms': dict(zip(labels, stats['buckets'])),
+        }
+    return {'operations': operations, 'slow_queries': snapshot['slow_queries']}
+
+
+def to_json(snapshot: Dict) -> str:
+    """Render a snapshot as indented JSON"""
+    return json.dumps(summarize(snapshot), indent=2)
+
+
+def _escape_label(value: str) -> str:
+    """Escape a Prometheus label value"""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def to_prometheus(snapshot: Dict) -> str:
+    """
+    Render a snapshot in the Prometheus text exposition format
+
+    Latencies are exported in seconds as a histogram per operation, with
+    counters for rows, queries and errors.
+    """
+    operations = sorted(snapshot['operations'].items())
+    lines = [
+        f"# HELP {METRIC_PREFIX}_operation_seconds Latency of DatabaseManager operations",
+        f"# TYPE {METRIC_PREFIX}_operation_seconds histogram",
+    ]
+    for name, stats in operations:
+        label = f'operation="{_escape_label(name)}"'
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, stats['buckets']):
+            cumulative += count
+            lines.append(f'{METRIC_PREFIX}_operation_seconds_bucket{{{label},le="{bound / 1000:g}"}} {cumulative}')
+        lines.append(f'{METRIC_PREFIX}_operation_seconds_bucket{{{label},le="+Inf"}} {stats["calls"]}')
+        lines.append(f'{METRIC_PREFIX}_operation_seconds_sum{{{label}}} {stats["total_ms"] / 1000:.6f}')
+        lines.append(f'{METRIC_PREFIX}_operation_seconds_count{{{label}}} {stats["calls"]}')
+
+    for counter, description in (('rows', 'Rows returned or written by DatabaseManager operations'),
+                                 ('queries', 'SQL statements run by DatabaseManager operations'),
+                                 ('errors', 'DatabaseManager operations that raised')):
+        lines.append(f"# HELP {METRIC_PREFIX}_operation_{counter}_total {description}")
+        lines.append(f"# TYPE {METRIC_PREFIX}_operation_{counter}_total counter")
+        for name, stats in operations:
+            lines.append(f'{METRIC_PREFIX}_operation_{counter}_total'
+                         f'{{operation="{_escape_label(name)}"}} {stats[counter]}')
+
+    lines.append(f"# HELP {METRIC_PREFIX}_slow_queries Slow queries currently in the log")
+    lines.append(f"# TYPE {METRIC_PREFIX}_slow_queries gauge")
+    lines.append(f"{METRIC_PREFIX}_slow_queries {len(snapshot['slow_queries'])}")
+    return '\n'.join(lines) + '\n'
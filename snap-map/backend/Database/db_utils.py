@@ -8,6 +8,9 @@ import sys
 import os
 from database_manager import DatabaseManager
 
+# Read-only commands that can run against the published snapshot
+SNAPSHOT_COMMANDS = ("stats", "backup", "binary", "shards")
+
 
 def print_usage():
     """Print usage information"""
@@ -19,18 +22,64 @@ Usage: python db_utils.py [command] [options]
 
 Commands:
     stats           Show database statistics
+    verify-stats    Check the stored statistics against a full recount
+                    --rebuild      recompute them if they don't match
     reset           Reset database (delete all records)
     backup          Create CSV backup of all records
+    binary [file]   Export all records in the compact binary format
     restore [file]  Restore records from CSV file
-    clean           Remove duplicate records (by name)
+                    --preserve     keep original IDs and timestamps
+                    --workers N    parse the CSV with N processes
+    clean           Remove duplicate records (same normalized name and address)
+    fuzzy-clean     Review near-duplicates (reworded names or addresses at the same
+                    street number) group by group, keeping the newest
+                    --dry-run      only list the groups that would be merged
+                    --all          remove every group after a single confirmation
+                    --threshold X  similarity needed, 0-1 (default 0.7)
+    check-links     Check record links (new, stale or throttled ones) and store the results
+                    --all          recheck every link
+                    --max-age D    recheck links last checked D days ago (default 7)
+                    --workers N    check with N threads (default 32)
+                    --rate R       at most R requests per second to one host (default 2)
+                    --limit N      check at most N links
+    broken-links    List records whose link failed its last check
+    backfill        Fill in city/state/ZIP columns for older records
+                    --all          recompute every record
+    shards [dir]    Export one file per city plus manifest.json (only changed cities are rewritten)
+                    --json         also write JSON shards
+                    --bin          also write compact binary shards (read by the map)
+                    --gzip         also write .gz siblings
+                    --full         regenerate every shard
+    metrics         Show per-operation timings, query counts and slow queries
+                    --json         print them as JSON
+                    --prometheus   print them in Prometheus text format
+                    --reset        clear the stored metrics
+                    (kept across runs only when SNAPMAP_METRICS_DB names a file)
+    snapshot [file] Publish a read-only copy of the database for readers
+                    (default: my_records.snapshot.db)
     quick-reset     Reset without confirmation (use with caution!)
+
+Options:
+    --snapshot      Run stats, backup, binary or shards against the published
+                    snapshot instead of the live database
     
 Examples:
     python db_utils.py stats
     python db_utils.py reset
     python db_utils.py backup
     python db_utils.py restore backup.csv
+    python db_utils.py restore backup.csv --preserve --workers 4
     python db_utils.py clean
+    python db_utils.py fuzzy-clean --dry-run
+    python db_utils.py fuzzy-clean --threshold 0.8
+    python db_utils.py check-links --workers 64 --limit 20000
+    python db_utils.py broken-links
+    python db_utils.py backfill
+    python db_utils.py shards ../../public/shards --bin --gzip
+    python db_utils.py binary ../../public/food_opportunities_export.bin
+    python db_utils.py metrics --prometheus
+    python db_utils.py snapshot
+    python db_utils.py stats --snapshot
     """)
 
 
@@ -58,6 +107,27 @@ def show_stats(db):
     print("="*50)
 
 
+def verify_stats(db, rebuild=False):
+    """Compare the materialized statistics with a full recount"""
+    print("Recounting records to verify statistics...")
+    
+    problems = db.verify_stats(rebuild=rebuild)
+    if not problems:
+        print("✓ Statistics are correct!")
+        return
+    
+    print(f"\n⚠️  Found {len(problems)} mismatches:")
+    for problem in problems[:10]:
+        print(f"  • {problem}")
+    if len(problems) > 10:
+        print(f"  ... and {len(problems) - 10} more")
+    
+    if rebuild:
+        print("\n✓ Statistics rebuilt from scratch")
+    else:
+        print("\nRun 'python db_utils.py verify-stats --rebuild' to fix them")
+
+
 def reset_database(db, quick=False):
     """Reset the database"""
     if quick:
@@ -101,7 +171,24 @@ def backup_database(db):
             print(f"   Size: {file_size / (1024 * 1024):.2f} MB")
 
 
-def restore_database(db, filename):
+def export_binary(db, filename=None):
+    """Export every record in the compact binary format"""
+    stats = db.get_database_stats()
+    
+    if stats['total_records'] == 0:
+        print("No records to export.")
+        return
+    
+    print(f"Exporting {stats['total_records']} records...")
+    path = db.export_to_binary(filename)
+    
+    if path:
+        print(f"\n✅ Binary export complete!")
+        print(f"   File: {path}")
+        print(f"   Size: {os.path.getsize(path) / 1024:.2f} KB")
+
+
+def restore_database(db, filename, preserve=False, workers=1):
     """Restore database from a CSV file"""
     if not os.path.exists(filename):
         print(f"❌ Error: File '{filename}' not found!")
@@ -118,7 +205,12 @@ def restore_database(db, filename):
             return
     
     # Import the records
-    imported = db.import_from_csv(filename)
+    imported = db.import_from_csv(
+        filename,
+        preserve_ids=preserve,
+        preserve_timestamps=preserve,
+        workers=workers
+    )
     
     if imported > 0:
         print(f"\n✅ Restore complete!")
@@ -130,32 +222,37 @@ def restore_database(db, filename):
 
 
 def clean_duplicates(db):
-    """Remove duplicate records based on name"""
+    """Remove duplicate records (same normalized name and address)"""
     print("Checking for duplicate records...")
     
+    # Fill in keys missing on older databases so the preview groups exactly
+    # what remove_duplicates() will delete
+    db.create_database()
+    
     db.connect()
     
-    # Find duplicates
+    # Find duplicates by the stored key (no per-row key function calls)
     db.cursor.execute('''
-        SELECT name, COUNT(*) as count
+        SELECT MIN(name), COUNT(*) as count
         FROM records
-        GROUP BY name
+        GROUP BY dedupe_key
         HAVING count > 1
         ORDER BY count DESC
     ''')
     
     duplicates = db.cursor.fetchall()
+    db.disconnect()
     
     if not duplicates:
         print("✓ No duplicate records found!")
-        db.disconnect()
         return
     
     print(f"\n Found {len(duplicates)} sets of duplicates:")
     total_duplicates = 0
+    for name, count in duplicates:
+        total_duplicates += (count - 1)
     for name, count in duplicates[:10]:  # Show first 10
         print(f"  • '{name[:40]}...': {count} copies")
-        total_duplicates += (count - 1)
     
     if len(duplicates) > 10:
         print(f"  ... and {len(duplicates) - 10} more")
@@ -166,29 +263,217 @@ def clean_duplicates(db):
     
     if choice.lower() != 'y':
         print("Cleanup cancelled.")
-        db.disconnect()
-        return
-    
-    # Remove duplicates, keeping the newest (highest ID)
-    removed = 0
-    for name, _ in duplicates:
-        db.cursor.execute('''
-            DELETE FROM records 
-            WHERE name = ? 
-            AND id NOT IN (
-                SELECT MAX(id) 
-                FROM records 
-                WHERE name = ?
-            )
-        ''', (name, name))
-        removed += db.cursor.rowcount
-    
-    db.connection.commit()
-    db.disconnect()
+        return
+    
+    # Remove duplicates in one statement, keeping the newest (highest ID)
+    removed = db.remove_duplicates()
     
     print(f"✓ Removed {removed} duplicate records!")
 
 
+def show_near_duplicate_group(db, group):
+    """Print one group of near-duplicates, newest (the one kept) first"""
+    for position, record_id in enumerate(reversed(group)):
+        record = db.get_record_by_id(record_id)
+        if record:
+            label = "keep  " if position == 0 else "remove"
+            print(f"    {label} #{record[0]}: {record[1][:40]} - {(record[3] or 'N/A')[:50]}")
+
+
+def fuzzy_clean(db, threshold=None, dry_run=False, review=True):
+    """
+    Remove near-duplicate records (reworded names or addresses), keeping the newest of each group
+
+    Groups are confirmed one at a time unless review is False, since a
+    near-duplicate is only probably the same place.
+    """
+    print("Checking for near-duplicate records...")
+    
+    groups = db.find_near_duplicates(threshold)
+    
+    if not groups:
+        print("✓ No near-duplicate records found!")
+        return
+    
+    total_duplicates = sum(len(group) - 1 for group in groups)
+    print(f"\n Found {len(groups)} groups of near-duplicates:")
+    
+    # A dry run lists every group; otherwise review shows them one at a time
+    shown = groups if dry_run else [] if review else groups[:10]
+    for group in shown:
+        print(f"  • {len(group)} records:")
+        show_near_duplicate_group(db, group)
+    
+    if len(shown) < len(groups) and not review:
+        print(f"  ... and {len(groups) - len(shown)} more")
+    
+    print(f"\nTotal near-duplicate records that would be removed: {total_duplicates}")
+    
+    if dry_run:
+        print("Dry run - nothing was removed.")
+        return
+    
+    if review:
+        to_remove = []
+        for number, group in enumerate(groups, 1):
+            print(f"\nGroup {number} of {len(groups)}:")
+            show_near_duplicate_group(db, group)
+            choice = input("Remove the older copies? (y/n/q): ").lower()
+            if choice == 'q':
+                break
+            if choice == 'y':
+                to_remove.extend(group[:-1])
+    else:
+        choice = input("\nRemove near-duplicates (keeping the newest of each group)? (y/n): ")
+        if choice.lower() != 'y':
+            print("Cleanup cancelled.")
+            return
+        to_remove = [record_id for group in groups for record_id in group[:-1]]
+    
+    if not to_remove:
+        print("Nothing removed.")
+        return
+    
+    removed = db.delete_records(to_remove)
+    print(f"✓ Removed {removed} near-duplicate records!")
+
+
+def check_links(db, options):
+    """Check the links that are due and show how they fared"""
+    from link_checker import (DEFAULT_MAX_AGE, DEFAULT_RATE, DEFAULT_WORKERS, OUTCOMES,
+                              check_database_links)
+    
+    max_age = None if "--all" in options else DEFAULT_MAX_AGE
+    workers, rate, limit = DEFAULT_WORKERS, DEFAULT_RATE, None
+    try:
+        if "--max-age" in options:
+            max_age = float(options[options.index("--max-age") + 1]) * 24 * 60 * 60
+        if "--workers" in options:
+            workers = int(options[options.index("--workers") + 1])
+        if "--rate" in options:
+            rate = float(options[options.index("--rate") + 1])
+        if "--limit" in options:
+            limit = int(options[options.index("--limit") + 1])
+    except (IndexError, ValueError):
+        print("❌ Error: --max-age, --workers, --rate and --limit need a number")
+        return
+    if workers < 1:
+        print("❌ Error: --workers needs a number of at least 1")
+        return
+    
+    # Make sure the link_checks table exists on older databases
+    db.create_database()
+    
+    summary = check_database_links(db, max_age, limit, workers, rate)
+    if not summary['checked']:
+        print("✓ No links due for checking")
+    else:
+        print(f"\n✓ Checked {summary['checked']} links in {summary['seconds']:.1f}s "
+              f"({summary['requests']} requests over {summary['connections']} connections)")
+        for outcome in OUTCOMES:
+            if summary[outcome]:
+                print(f"   {outcome}: {summary[outcome]}")
+    
+    stats = db.get_link_stats()
+    print("\nAll links: " + ", ".join(f"{count} {outcome}" for outcome, count in sorted(stats.items())))
+
+
+def show_broken_links(db):
+    """List records whose link failed its last check"""
+    problems = db.get_link_problems()
+    
+    if not problems:
+        print("✓ No broken links found (run 'python db_utils.py check-links' first)")
+        return
+    
+    print(f"\n Found {len(problems)} records with failing links:")
+    for record_id, name, link, outcome, status, error, checked_at in problems[:50]:
+        reason = f"HTTP {status}" if status else (error or outcome)
+        print(f"  • #{record_id} {name[:40]}: {link[:60]} - {reason} ({checked_at})")
+    
+    if len(problems) > 50:
+        print(f"  ... and {len(problems) - 50} more")
+
+
+def backfill_locations(db, overwrite=False):
+    """Populate the indexed city/state/ZIP columns from record addresses"""
+    print("Backfilling city/state/ZIP columns...")
+    
+    # Make sure the columns and indexes exist on older databases
+    db.create_database()
+    
+    updated = db.backfill_locations(overwrite=overwrite)
+    print(f"✓ Updated {updated} records")
+
+
+def export_shards(db, directory, options):
+    """Export per-city shard files and their manifest"""
+    from shard_export import export_city_shards
+    
+    formats = ('csv',) + tuple(fmt for fmt in ('json', 'bin') if f"--{fmt}" in options)
+    compress = ('gzip',) if "--gzip" in options else ()
+    
+    summary = export_city_shards(db, directory, formats, compress, full="--full" in options)
+    print(f"✓ {summary['cities']} cities in {summary['manifest']}")
+    print(f"   Files written: {summary['written']}")
+    print(f"   Cities unchanged: {summary['unchanged']}")
+    print(f"   Old files removed: {summary['removed']}")
+
+
+def show_metrics(db, options):
+    """Display the operation timings and slow-query log collected so far"""
+    import db_metrics
+    
+    if "--reset" in options:
+        db.reset_metrics()
+        print("✓ Metrics cleared")
+        return
+    
+    snapshot = db.metrics_snapshot()
+    if "--json" in options:
+        print(db_metrics.to_json(snapshot))
+        return
+    if "--prometheus" in options:
+        print(db_metrics.to_prometheus(snapshot), end="")
+        return
+    
+    summary = db_metrics.summarize(snapshot)
+    if not summary['operations']:
+        print("No metrics recorded yet.")
+        if not db.metrics_path:
+            print(f"   Set {db_metrics.METRICS_PATH_ENV} to a file to keep them across runs")
+        return
+    
+    print("\n" + "="*96)
+    print("DATABASE OPERATION METRICS")
+    print("="*96)
+    print(f"{'Operation':<22} {'calls':>8} {'rows':>10} {'queries':>9} {'mean ms':>9} "
+          f"{'p50 ms':>8} {'p99 ms':>8} {'max ms':>9} {'errors':>7}")
+    print("-"*96)
+    for name, stats in summary['operations'].items():
+        mean = f"{stats['mean_ms']:.2f}" if stats['mean_ms'] is not None else "-"
+        p50 = f"≤{stats['p50_ms']:g}" if stats['p50_ms'] is not None else ">10000"
+        p99 = f"≤{stats['p99_ms']:g}" if stats['p99_ms'] is not None else ">10000"
+        print(f"{name:<22} {stats['calls']:>8} {stats['rows']:>10} {stats['queries']:>9} {mean:>9} "
+              f"{p50:>8} {p99:>8} {stats['max_ms']:>9.2f} {stats['errors']:>7}")
+    
+    slow_queries = summary['slow_queries']
+    print(f"\nSlow queries logged: {len(slow_queries)}")
+    for entry in slow_queries[-5:]:
+        print(f"\n  • {entry['elapsed_ms']:.1f} ms in {entry['operation']}: {entry['sql'][:200]}")
+        for line in (entry['plan'] or '').splitlines():
+            print(f"      {line}")
+    print("="*96)
+
+
+def publish_snapshot(db, path=None):
+    """Publish a read-only snapshot of the database"""
+    print("Publishing read-only snapshot...")
+    snapshot = db.publish_snapshot(path)
+    print(f"✓ Snapshot published: {snapshot}")
+    print(f"   Size: {os.path.getsize(snapshot) / (1024 * 1024):.2f} MB")
+
+
 def main():
     """Main entry point"""
     if len(sys.argv) < 2:
@@ -198,9 +483,19 @@ def main():
     command = sys.argv[1].lower()
     db = DatabaseManager("my_records.db")
     
+    if "--snapshot" in sys.argv[2:] and command in SNAPSHOT_COMMANDS:
+        try:
+            db = db.open_snapshot()
+        except FileNotFoundError as e:
+            print(f"❌ Error: {e}")
+            return
+    
     if command == "stats":
         show_stats(db)
     
+    elif command == "verify-stats":
+        verify_stats(db, rebuild="--rebuild" in sys.argv[2:])
+    
     elif command == "reset":
         reset_database(db, quick=False)
     
@@ -211,16 +506,62 @@ def main():
     elif command == "backup":
         backup_database(db)
     
+    elif command == "binary":
+        paths = [option for option in sys.argv[2:] if not option.startswith("--")]
+        export_binary(db, paths[0] if paths else None)
+    
     elif command == "restore":
         if len(sys.argv) < 3:
             print("❌ Error: Please specify the CSV file to restore from")
             print("   Usage: python db_utils.py restore [filename.csv]")
         else:
-            restore_database(db, sys.argv[2])
+            options = sys.argv[3:]
+            workers = 1
+            if "--workers" in options:
+                try:
+                    workers = int(options[options.index("--workers") + 1])
+                    if workers < 1:
+                        raise ValueError
+                except (IndexError, ValueError):
+                    print("❌ Error: --workers needs a number of at least 1")
+                    return
+            restore_database(db, sys.argv[2], preserve="--preserve" in options, workers=workers)
     
     elif command == "clean":
         clean_duplicates(db)
     
+    elif command == "fuzzy-clean":
+        options = sys.argv[2:]
+        threshold = None
+        if "--threshold" in options:
+            try:
+                threshold = float(options[options.index("--threshold") + 1])
+            except (IndexError, ValueError):
+                print("❌ Error: --threshold needs a number between 0 and 1")
+                return
+        fuzzy_clean(db, threshold, dry_run="--dry-run" in options, review="--all" not in options)
+    
+    elif command == "check-links":
+        check_links(db, sys.argv[2:])
+    
+    elif command == "broken-links":
+        show_broken_links(db)
+    
+    elif command == "backfill":
+        backfill_locations(db, overwrite="--all" in sys.argv[2:])
+    
+    elif command == "metrics":
+        show_metrics(db, sys.argv[2:])
+    
+    elif command == "snapshot":
+        paths = [option for option in sys.argv[2:] if not option.startswith("--")]
+        publish_snapshot(db, paths[0] if paths else None)
+    
+    elif command == "shards":
+        options = sys.argv[2:]
+        paths = [option for option in options if not option.startswith("--")]
+        export_shards(db, paths[0] if paths else "shards", options)
+    
     else:
         print(f"❌ Unknown command: {command}")
         print_usage()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Export Utilities
+Helpers for publishing export files safely: atomic replacement and
+precompressed (gzip/brotli) siblings for static file servers
+"""
+
+import gzip
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import Iterable, List, Optional
+
+# Brotli is optional - only needed for .br siblings
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Bytes read per step when compressing a file
+CHUNK_SIZE = 1024 * 1024
+
+# Compression method -> file suffix
+COMPRESSION_SUFFIXES = {
+    'gzip': '.gz',
+    'br': '.br',
+}
+
+
+def check_compression(methods: Iterable[str]) -> List[str]:
+    """
+    Validate compression methods before anything is written
+
+    Args:
+        methods: Compression methods ('gzip' and/or 'br')
+
+    Returns:
+        The methods that can be written (br is skipped without brotli)
+
+    Raises:
+        ValueError: For an unknown method
+    """
+    usable = []
+    for method in methods:
+        if method not in COMPRESSION_SUFFIXES:
+            raise ValueError(f"Unknown compression method: {method}")
+        if method == 'br' and brotli is None:
+            print("Skipping .br output: install brotli (pip install brotli)")
+            continue
+        if method not in usable:
+            usable.append(method)
+    return usable
+
+
+def _temp_path(path: str) -> str:
+    """New empty temporary file next to path"""
+    fd, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)), prefix=f".{os.path.basename(path)}.", suffix=".tmp"
+    )
+    os.close(fd)
+    return temp_path
+
+
+def _compress_file(source_path: str, method: str, target_path: str):
+    """Compress a file in chunks into target_path (synced to disk)"""
+    with open(source_path, 'rb') as source, open(target_path, 'wb') as out:
+        if method == 'gzip':
+            # Fixed timestamp so identical input gives identical bytes
+            with gzip.GzipFile(filename='', mode='wb', fileobj=out, mtime=0) as gz:
+                while True:
+                    chunk = source.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    gz.write(chunk)
+        else:
+            compressor = brotli.Compressor()
+            while True:
+                chunk = source.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                out.write(compressor.process(chunk))
+            out.write(compressor.finish())
+        out.flush()
+        os.fsync(out.fileno())
+
+
+@contextmanager
+def atomic_write(path: str, mode: str = 'w', compress: Optional[Iterable[str]] = None, **open_kwargs):
+    """
+    Open a temporary file next to path and move it into place on success
+
+    Readers see either the old file or the complete new one, never a
+    partially written file. If the with-block raises, the temporary file
+    is removed and path is left untouched.
+
+    When compress is given (even empty), precompressed siblings (path.gz,
+    path.br) are written from the temporary file too, and only once all of
+    them are complete are they renamed into place, the file itself last.
+    Siblings of methods not written are removed then, so a client
+    negotiating compression is never served a stale copy. Call
+    check_compression() first to fail before any work is done; the
+    sibling paths are path + COMPRESSION_SUFFIXES[method].
+
+    Args:
+        path: Final destination of the file
+        mode: 'w' for text or 'wb' for binary
+        compress: Compression methods ('gzip' and/or 'br') to publish with it
+                  (None leaves any existing siblings alone)
+        **open_kwargs: Extra arguments for open() (e.g. encoding, newline)
+
+    Yields:
+        The open temporary file object
+    """
+    methods = check_compression(compress) if compress is not None else []
+    temp_path = _temp_path(path)
+    siblings = {}
+    try:
+        with open(temp_path, mode, **open_kwargs) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        for method in methods:
+            siblings[method] = _temp_path(path + COMPRESSION_SUFFIXES[method])
+            _compress_file(temp_path, method, siblings[method])
+
+        # mkstemp creates files readable only by the owner
+        for method, suffix in COMPRESSION_SUFFIXES.items():
+            if compress is None:
+                break
+            if method in siblings:
+                os.chmod(siblings[method], 0o644)
+                os.replace(siblings.pop(method), path + suffix)
+            elif os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        for leftover in [temp_path] + list(siblings.values()):
+            try:
+                os.remove(leftover)
+            except OSError:
+                pass
+        raise
@@ -4,32 +4,55 @@ Food Opportunities Finder
 Queries Claude API for food opportunities in a given city and populates the SQL database
 """
 
-import json
 import sys
 import os
-from typing import List, Dict, Optional
-import re
+from typing import List, Dict, Iterator, Optional, Tuple
 
 # Import the database manager from the previous script
 from database_manager import DatabaseManager
+from response_cache import ResponseCache
+from response_parser import OpportunityStreamParser, parse_opportunities
 
-# For Claude API - we'll use the Anthropic SDK
-try:
-    from anthropic import Anthropic
-except ImportError:
-    print("Please install the Anthropic SDK: pip install anthropic")
-    sys.exit(1)
+# For Claude API - we'll use the Anthropic SDK. It is imported on first use:
+# it is the slowest import by far and commands that only touch the
+# database never need it.
+ANTHROPIC_INSTALL_HINT = "Please install the Anthropic SDK: pip install anthropic"
+
+# Claude model used for queries
+MODEL = "claude-opus-4-1-20250805"  # Using Claude Opus 4.1
+
+# Bump whenever the prompt changes so cached responses for the old prompt are not reused
+PROMPT_VERSION = "2"
+
+
+def _parse_coordinates(latitude, longitude):
+    """Return (latitude, longitude) as floats, or (None, None) if missing or invalid"""
+    try:
+        latitude, longitude = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        return None, None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None, None
+    return latitude, longitude
 
 
 class FoodOpportunitiesFinder:
     """Finds food opportunities in a city using Claude API and stores them in database"""
     
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, use_cache: bool = True,
+                 cache_ttl: float = 24 * 60 * 60, cache_size: int = 1000,
+                 db_path: str = "my_records.db", snapshot_path: str = None):
         """
         Initialize the finder with API key and database connection
         
         Args:
             api_key: Anthropic API key (if None, will look for environment variable)
+            use_cache: Reuse cached Claude responses for repeated queries
+            cache_ttl: Seconds a cached response stays valid
+            cache_size: Maximum number of cached responses (least recently used are evicted)
+            db_path: Path to the SQLite database file
+            snapshot_path: Publish a read-only snapshot of the database here
+                           after every successful lookup (see DatabaseManager.publish_snapshot)
         """
         # Initialize Claude API client
         self.api_key = api_key or os.environ.get("ANTHROPIC_API_KEY") or "YOUR_API_KEY_HERE"
@@ -41,24 +64,52 @@ class FoodOpportunitiesFinder:
             print("   2. Set ANTHROPIC_API_KEY environment variable")
             print("   3. Pass it when creating FoodOpportunitiesFinder instance\n")
         
-        self.client = Anthropic(api_key=self.api_key)
+        # API clients are created on first use (see the client property)
+        self._client = None
+        self.async_client = None
         
         # Initialize database manager
-        self.db = DatabaseManager("my_records.db")
+        self.db = DatabaseManager(db_path, snapshot_path=snapshot_path)
         self.db.create_database()
         
-    def query_claude_for_food_opportunities(self, city: str, num_opportunities: int = 10) -> str:
+        # Cache of Claude responses, stored next to the database and opened
+        # on first use (see the cache property)
+        self.use_cache = use_cache
+        self.cache_path = os.path.join(os.path.dirname(self.db.db_path), "claude_cache.db")
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self._cache = None
+        
+    @property
+    def cache(self) -> ResponseCache:
+        """Response cache, opened (and its table created) on first use"""
+        if self._cache is None:
+            self._cache = ResponseCache(self.cache_path, ttl=self.cache_ttl, max_entries=self.cache_size)
+        return self._cache
+    
+    @property
+    def client(self):
+        """Synchronous Anthropic client, created (and the SDK imported) on first use"""
+        if self._client is None:
+            try:
+                from anthropic import Anthropic
+            except ImportError as e:
+                raise ImportError(ANTHROPIC_INSTALL_HINT) from e
+            self._client = Anthropic(api_key=self.api_key)
+        return self._client
+    
+    def build_prompt(self, city: str, num_opportunities: int = 10) -> str:
         """
-        Query Claude API for food opportunities in a given city
+        Build the Claude prompt asking for food opportunities in a city
         
         Args:
             city: Name of the city to search for food opportunities
             num_opportunities: Number of opportunities to request
             
         Returns:
-            Claude's response as a string
+            The prompt text (bump PROMPT_VERSION when changing it)
         """
-        prompt = f"""Please Find {num_opportunities} opportunies in {city} for poor people who rely on SNAP benefits. 
+        return f"""Please Find {num_opportunities} opportunies in {city} for poor people who rely on SNAP benefits. 
         These should be food kitchens, food banks, drives, and anywhere were someone who can't afford food can go to get a meal or groceries.
         The goal is to help people in need find food resources in {city}.
         
@@ -69,7 +120,9 @@ class FoodOpportunitiesFinder:
                     "name": "Name of the place or event",
                     "link": "Website URL if available, otherwise empty string",
                     "location": "Specific address or area in {city}",
-                    "description": "Brief description of what makes this place special, the type of cuisine, or experience offered"
+                    "description": "Brief description of what makes this place special, the type of cuisine, or experience offered",
+                    "latitude": "Latitude of the address in decimal degrees as a number, or null if unknown",
+                    "longitude": "Longitude of the address in decimal degrees as a number, or null if unknown"
                 }}
             ]
         }}
@@ -77,134 +130,269 @@ class FoodOpportunitiesFinder:
         Please ensure your response is valid JSON that can be parsed directly. Include a mix of different 
         types of food experiences - from casual to fine dining, local specialties, markets, and unique culinary experiences.
         Focus on real, actual places and events in {city}."""
+
+    def _message_params(self, prompt: str) -> Dict:
+        """Arguments for messages.create() shared by the sync and async clients"""
+        return {
+            "model": MODEL,
+            "max_tokens": 2000,
+            "temperature": 0.7,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ]
+        }
+        
+    def query_claude_for_food_opportunities(self, city: str, num_opportunities: int = 10,
+                                            use_cache: bool = None) -> str:
+        """
+        Query Claude API for food opportunities in a given city
+        
+        Args:
+            city: Name of the city to search for food opportunities
+            num_opportunities: Number of opportunities to request
+            use_cache: Override the instance's use_cache setting (False forces a fresh query)
+            
+        Returns:
+            Claude's response as a string
+        """
+        use_cache = self.use_cache if use_cache is None else use_cache
+        cache_key = ResponseCache.make_key(city, num_opportunities, MODEL, PROMPT_VERSION)
+        
+        if use_cache:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                print(" Using cached response")
+                return cached
+        
+        prompt = self.build_prompt(city, num_opportunities)
         
         try:
-            message = self.client.messages.create(
-                model="claude-opus-4-1-20250805",  # Using Claude Opus 4.1
-                max_tokens=2000,
-                temperature=0.7,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
-            )
+            message = self.client.messages.create(**self._message_params(prompt))
             
-            return message.content[0].text
+            response = message.content[0].text
             
         except Exception as e:
             print(f"Error querying Claude API: {e}")
             return None
+        
+        # Usable fresh responses are cached even when the lookup was bypassed
+        self._cache_response(cache_key, response, message.stop_reason)
+        return response
     
-    def parse_opportunities_from_response(self, response: str) -> List[Dict]:
+    def _cache_response(self, cache_key: str, response: str, stop_reason: str = None) -> bool:
         """
-        Parse the JSON response from Claude to extract food opportunities
+        Cache a fresh response if it is complete and has opportunities in it
+        
+        Refusals, malformed JSON and answers cut off at max_tokens are not
+        cached, so the next call asks again instead of reusing them for the
+        whole TTL.
         
         Args:
-            response: Claude's response string
+            cache_key: Key from ResponseCache.make_key()
+            response: Claude's response text
+            stop_reason: Why Claude stopped writing ("max_tokens" means truncated)
             
         Returns:
-            List of dictionaries containing opportunity information
+            True if the response was cached
         """
-        if not response:
-            return []
+        if stop_reason == "max_tokens" or not parse_opportunities(response):
+            return False
+        self.cache.put(cache_key, response)
+        return True
+    
+    async def query_claude_for_food_opportunities_async(self, city: str, num_opportunities: int = 10,
+                                                        use_cache: bool = None) -> str:
+        """
+        Async version of query_claude_for_food_opportunities for concurrent crawls
         
-        try:
-            # Try to extract JSON from the response
-            # Sometimes Claude might include explanation text around the JSON
-            json_match = re.search(r'\{.*"opportunities".*\}', response, re.DOTALL)
-            
-            if json_match:
-                json_str = json_match.group(0)
-                data = json.loads(json_str)
-                return data.get("opportunities", [])
-            else:
-                # Try to parse the entire response as JSON
-                data = json.loads(response)
-                return data.get("opportunities", [])
-                
-        except json.JSONDecodeError as e:
-            print(f"Error parsing JSON response: {e}")
-            print("Attempting to extract information manually...")
-            
-            # Fallback: try to extract information manually if JSON parsing fails
-            opportunities = []
+        Args:
+            city: Name of the city to search for food opportunities
+            num_opportunities: Number of opportunities to request
+            use_cache: Override the instance's use_cache setting (False forces a fresh query)
             
-            # This is a basic fallback parser - you might need to adjust based on actual responses
-            lines = response.split('\n')
-            current_opportunity = {}
+        Returns:
+            Claude's response as a string, or None on failure
+        """
+        use_cache = self.use_cache if use_cache is None else use_cache
+        cache_key = ResponseCache.make_key(city, num_opportunities, MODEL, PROMPT_VERSION)
+        
+        if use_cache:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        try:
+            if self.async_client is None:
+                from anthropic import AsyncAnthropic
+                self.async_client = AsyncAnthropic(api_key=self.api_key)
+            message = await self.async_client.messages.create(
+                **self._message_params(self.build_prompt(city, num_opportunities))
+            )
+            response = message.content[0].text
+        except Exception as e:
+            print(f"Error querying Claude API for {city}: {e}")
+            return None
+        
+        self._cache_response(cache_key, response, message.stop_reason)
+        return response
+    
+    def stream_food_opportunities(self, city: str, num_opportunities: int = 10,
+                                  use_cache: bool = None) -> Iterator[Dict]:
+        """
+        Stream Claude's answer and yield each opportunity as soon as it is complete
+        
+        The full response is cached once the stream finishes, so later calls
+        (streaming or not) can reuse it. A partial response, or one without
+        any opportunities, is never cached.
+        
+        Args:
+            city: Name of the city to search for food opportunities
+            num_opportunities: Number of opportunities to request
+            use_cache: Override the instance's use_cache setting (False forces a fresh query)
             
-            for line in lines:
-                if '"name"' in line:
-                    match = re.search(r'"name":\s*"([^"]+)"', line)
-                    if match:
-                        current_opportunity['name'] = match.group(1)
-                elif '"link"' in line:
-                    match = re.search(r'"link":\s*"([^"]*)"', line)
-                    if match:
-                        current_opportunity['link'] = match.group(1)
-                elif '"location"' in line:
-                    match = re.search(r'"location":\s*"([^"]+)"', line)
-                    if match:
-                        current_opportunity['location'] = match.group(1)
-                elif '"description"' in line:
-                    match = re.search(r'"description":\s*"([^"]+)"', line)
-                    if match:
-                        current_opportunity['description'] = match.group(1)
-                        
-                        # If we have all fields, add to opportunities
-                        if all(key in current_opportunity for key in ['name', 'location', 'description']):
-                            if 'link' not in current_opportunity:
-                                current_opportunity['link'] = ""
-                            opportunities.append(current_opportunity)
-                            current_opportunity = {}
+        Yields:
+            Opportunity dictionaries in the order Claude writes them
+        """
+        use_cache = self.use_cache if use_cache is None else use_cache
+        cache_key = ResponseCache.make_key(city, num_opportunities, MODEL, PROMPT_VERSION)
+        
+        if use_cache:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                print(" Using cached response")
+                yield from self.parse_opportunities_from_response(cached)
+                return
+        
+        parser = OpportunityStreamParser()
+        chunks = []
+        found = 0
+        
+        try:
+            with self.client.messages.stream(**self._message_params(self.build_prompt(city, num_opportunities))) as stream:
+                for text in stream.text_stream:
+                    chunks.append(text)
+                    for opportunity in parser.feed(text):
+                        found += 1
+                        yield opportunity
+                stop_reason = stream.get_final_message().stop_reason
+        except Exception as e:
+            print(f"Error streaming from Claude API: {e}")
+            return
+        
+        # Reached only when the stream ran to the end (a consumer that stops
+        # early never gets here); empty or truncated answers are not cached
+        if found:
+            self._cache_response(cache_key, ''.join(chunks), stop_reason)
+    
+    def parse_opportunities_from_response(self, response: str) -> List[Dict]:
+        """
+        Parse the JSON response from Claude to extract food opportunities
+        
+        Args:
+            response: Claude's response string
             
-            return opportunities
+        Returns:
+            List of dictionaries containing opportunity information
+        """
+        # Sometimes Claude might include explanation text around the JSON,
+        # or stop partway through it - parse_opportunities handles both
+        return parse_opportunities(response)
     
-    def save_opportunities_to_database(self, opportunities: List[Dict], city: str) -> int:
+    def save_opportunities_to_database(self, opportunities: List[Dict], city: str,
+                                       near_duplicate_indexes: Dict = None) -> List[int]:
         """
         Save the parsed opportunities to the database
         
         Args:
             opportunities: List of opportunity dictionaries
             city: Name of the city (used as fallback location)
+            near_duplicate_indexes: City indexes to reuse for the near-duplicate
+                                    check across calls (see DatabaseManager.near_duplicates_of)
             
         Returns:
-            Number of successfully saved records
+            IDs of the saved (inserted or updated) records
         """
-        saved_count = 0
+        rows = []
         
         for opp in opportunities:
             try:
                 # Extract fields with defaults
-                name = opp.get('name', 'Unknown Food Opportunity')
-                link = opp.get('link', '')
-                location = opp.get('location', city)  # Use city as fallback location
-                description = opp.get('description', 'No description available')
-                
-                # Add to database
-                self.db.add_record(
-                    name=name,
-                    link=link,
-                    location=location,
-                    description=description
-                )
-                saved_count += 1
-                print(f"✓ Added: {name}")
+                name = opp.get('name') or 'Unknown Food Opportunity'
+                link = opp.get('link') or ''
+                location = opp.get('location') or city  # Use city as fallback location
+                description = opp.get('description') or 'No description available'
+                latitude, longitude = _parse_coordinates(opp.get('latitude'), opp.get('longitude'))
+                rows.append((name, link, location, description, latitude, longitude))
                 
             except Exception as e:
-                print(f"✗ Error saving '{opp.get('name', 'Unknown')}': {e}")
+                print(f"✗ Skipping malformed opportunity {opp!r}: {e}")
+        
+        if not rows:
+            return []
+        
+        # Warn about reworded copies of records we already have
+        self.flag_near_duplicates(rows, city, near_duplicate_indexes)
+        
+        # Write the whole batch in one transaction
+        try:
+            record_ids = self.db.add_records_many(rows, city=city)
+        except Exception as e:
+            print(f"✗ Error saving opportunities: {e}")
+            return []
+        
+        # Later batches are checked against this one too
+        if near_duplicate_indexes:
+            try:
+                self.db.index_saved_records(near_duplicate_indexes, record_ids)
+            except Exception as e:
+                print(f"⚠️  Could not index saved records for the near-duplicate check: {e}")
+        return record_ids
+    
+    def flag_near_duplicates(self, rows: List[Tuple], city: str,
+                             indexes: Dict = None) -> List[Tuple[int, int, float]]:
+        """
+        Warn about new records that look like existing ones under different wording
+        
+        Flagged records are still saved; `python db_utils.py fuzzy-clean`
+        merges them later.
         
-        return saved_count
+        Args:
+            rows: (name, link, location, description, ...) tuples about to be saved
+            city: Name of the city they were found for
+            indexes: City indexes kept between calls (see DatabaseManager.near_duplicates_of)
+            
+        Returns:
+            (position in rows, existing record ID, similarity) for each match
+        """
+        try:
+            matches = self.db.near_duplicates_of(rows, city=city, indexes=indexes)
+        except Exception as e:
+            print(f"⚠️  Could not check for near-duplicates: {e}")
+            return []
+        
+        flagged = set()
+        for position, record_id, score in matches:
+            # Only the closest match of each record
+            if position not in flagged:
+                flagged.add(position)
+                print(f"⚠️  '{rows[position][0]}' looks like existing record #{record_id} "
+                      f"({score:.0%} similar)")
+        return matches
     
-    def find_and_save_food_opportunities(self, city: str, num_opportunities: int = 10) -> bool:
+    def find_and_save_food_opportunities(self, city: str, num_opportunities: int = 10,
+                                         use_cache: bool = None, stream: bool = False) -> bool:
         """
         Main method to find and save food opportunities for a city
         
         Args:
             city: Name of the city to search
             num_opportunities: Number of opportunities to find
+            use_cache: Override the instance's use_cache setting (False forces a fresh query)
+            stream: Save each opportunity as soon as Claude finishes writing it
+                    instead of waiting for the whole response
             
         Returns:
             True if successful, False otherwise
@@ -212,8 +400,25 @@ class FoodOpportunitiesFinder:
         print(f"\n🔍 Searching for food opportunities in {city}...")
         print(f"   Requesting {num_opportunities} opportunities from Claude API...")
         
+        if stream:
+            saved = 0
+            # The city's records are indexed once for the whole lookup
+            near_duplicate_indexes = {}
+            for opportunity in self.stream_food_opportunities(city, num_opportunities, use_cache):
+                if self.save_opportunities_to_database([opportunity], city, near_duplicate_indexes):
+                    saved += 1
+                    print(f"✓ Saved: {opportunity.get('name')}")
+            
+            if not saved:
+                print("❌ No opportunities could be saved from the response")
+                return False
+            
+            print(f"\n✅ Successfully saved {saved} food opportunities to the database!")
+            self.publish_snapshot()
+            return True
+        
         # Query Claude API
-        response = self.query_claude_for_food_opportunities(city, num_opportunities)
+        response = self.query_claude_for_food_opportunities(city, num_opportunities, use_cache)
         
         if not response:
             print("❌ Failed to get response from Claude API")
@@ -232,18 +437,30 @@ class FoodOpportunitiesFinder:
         
         # Save to database
         print("\n📝 Saving to database...")
-        saved = self.save_opportunities_to_database(opportunities, city)
+        record_ids = self.save_opportunities_to_database(opportunities, city)
         
-        print(f"\n✅ Successfully saved {saved} food opportunities to the database!")
+        print(f"\n✅ Successfully saved {len(record_ids)} food opportunities to the database!")
+        self.publish_snapshot()
         
-        # Display the saved records
+        # Display the records just saved
         print("\n📊 Recently added food opportunities:")
-        search_results = self.db.search_records(city)
-        self.db.display_records(search_results[-saved:] if len(search_results) > saved else search_results)
+        saved_records = [self.db.get_record_by_id(record_id) for record_id in record_ids]
+        self.db.display_records([record for record in saved_records if record])
         
         return True
 
 
+    def publish_snapshot(self):
+        """Swap in a fresh read-only snapshot for readers (if a snapshot path is set)"""
+        if not self.db.snapshot_path:
+            return
+        try:
+            path = self.db.publish_snapshot()
+            print(f"📸 Published read-only snapshot: {path}")
+        except Exception as e:
+            print(f"⚠️  Could not publish snapshot: {e}")
+
+
 def main():
     """Main function to run the food opportunities finder"""
     
@@ -254,14 +471,21 @@ def main():
     # Or set it as an environment variable:
     # export ANTHROPIC_API_KEY="your-key-here"
     
+    # --no-cache forces a fresh Claude query instead of reusing a cached response
+    # --stream saves each opportunity as soon as Claude has written it
+    args = sys.argv[1:]
+    use_cache = "--no-cache" not in args
+    stream = "--stream" in args
+    args = [arg for arg in args if arg not in ("--no-cache", "--stream")]
+    
     # Create finder instance
-    finder = FoodOpportunitiesFinder(api_key=API_KEY)
+    finder = FoodOpportunitiesFinder(api_key=API_KEY, use_cache=use_cache)
     
     # Check if city was provided as command line argument
-    if len(sys.argv) > 1:
-        city = ' '.join(sys.argv[1:])
+    if args:
+        city = ' '.join(args)
         print(f"Finding food opportunities in: {city}")
-        finder.find_and_save_food_opportunities(city)
+        finder.find_and_save_food_opportunities(city, stream=stream)
     else:
         # Interactive mode
         print("\n" + "="*60)
@@ -301,8 +525,7 @@ def main():
             if success:
                 view_all = input("\nWould you like to view all records in the database? (y/n): ").strip()
                 if view_all.lower() == 'y':
-                    all_records = finder.db.get_all_records()
-                    finder.db.display_records(all_records)
+                    finder.db.display_records(finder.db.iter_records())
             
             another = input("\nSearch for another city? (y/n): ").strip()
             if another.lower() != 'y':
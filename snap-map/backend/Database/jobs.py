@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Jobs
+Persistent table of city lookup jobs with single-flight de-duplication:
+while a lookup for a city is queued or running, new requests for the same
+city (compared case/spacing/punctuation-insensitively) join that job
+instead of starting another one
+
+Jobs live in their own file (my_records.jobs.db beside the records
+database, or $SNAPMAP_JOBS_DB), so their captured output is never copied
+into the records database's snapshots and backups.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from database_manager import city_key
+
+# Job states; a job is "active" while queued or running
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+JOB_COLUMNS = ('id', 'city', 'city_key', 'num_opportunities', 'status', 'output', 'error',
+               'created_at', 'started_at', 'finished_at')
+
+# Environment variable naming the jobs file (default: beside the records database)
+JOBS_PATH_ENV = "SNAPMAP_JOBS_DB"
+JOBS_SUFFIX = ".jobs.db"
+
+
+def jobs_path_for(db_path: str) -> str:
+    """Jobs file of a records database: $SNAPMAP_JOBS_DB, or e.g. my_records.db -> my_records.jobs.db"""
+    if os.environ.get(JOBS_PATH_ENV):
+        return os.environ[JOBS_PATH_ENV]
+    root, ext = os.path.splitext(db_path)
+    return (root if ext == '.db' else db_path) + JOBS_SUFFIX
+
+
+class JobStore:
+    """Stores lookup jobs in SQLite and coalesces concurrent requests for the same city"""
+
+    def __init__(self, db_path: str = "my_records.jobs.db"):
+        """
+        Initialize the store, creating the jobs table if needed
+
+        Args:
+            db_path: Path to the jobs file (see jobs_path_for), not the
+                     records database
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.execute("PRAGMA busy_timeout = 5000")
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                city TEXT NOT NULL,
+                city_key TEXT NOT NULL,
+                num_opportunities INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                output TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )
+        ''')
+        # At most one active job per city - the database enforces single-flight too
+        self.connection.execute(f'''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_active_city ON jobs(city_key)
+            WHERE status IN {ACTIVE_STATUSES}
+        ''')
+        self.connection.execute('''
+            CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs(finished_at)
+        ''')
+        self.connection.commit()
+
+    def submit(self, city: str, num_opportunities: int = 10) -> Tuple[Dict, bool]:
+        """
+        Create a job for a city, or return the one already queued or running for it
+
+        Args:
+            city: City to look up
+            num_opportunities: Number of opportunities to request
+
+        Returns:
+            (job, created) - created is False when the request joined an existing job
+
+        Raises:
+            ValueError: If the city is empty
+        """
+        key = city_key(city)
+        if not key:
+            raise ValueError("City must not be empty")
+
+        with self._lock:
+            row = self.connection.execute(
+                f'SELECT * FROM jobs WHERE city_key = ? AND status IN {ACTIVE_STATUSES}', (key,)
+            ).fetchone()
+            if row is not None:
+                return dict(row), False
+
+            job = {
+                'id': uuid.uuid4().hex,
+                'city': city.strip(),
+                'city_key': key,
+                'num_opportunities': num_opportunities,
+                'status': QUEUED,
+                'output': None,
+                'error': None,
+                'created_at': time.time(),
+                'started_at': None,
+                'finished_at': None,
+            }
+            self.connection.execute(
+                f'INSERT INTO jobs ({", ".join(JOB_COLUMNS)}) VALUES ({", ".join("?" * len(JOB_COLUMNS))})',
+                [job[column] for column in JOB_COLUMNS]
+            )
+            self.connection.commit()
+            return job, True
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """
+        Look up a job
+
+        Args:
+            job_id: ID returned by submit()
+
+        Returns:
+            The job as a dictionary, or None if unknown
+        """
+        with self._lock:
+            row = self.connection.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def mark_running(self, job_id: str):
+        """Record that a worker picked up the job"""
+        self._update(job_id, status=RUNNING, started_at=time.time())
+
+    def finish(self, job_id: str, ok: bool, output: str = "", error: str = None):
+        """
+        Record the outcome of a job
+
+        Args:
+            job_id: ID of the job
+            ok: Whether the lookup succeeded
+            output: Progress output produced while running it
+            error: Error message if it failed
+        """
+        self._update(job_id, status=DONE if ok else FAILED, output=output,
+                     error=None if ok else error, finished_at=time.time())
+
+    def fail(self, job_id: str, error: str):
+        """Mark a job failed without running it"""
+        self.finish(job_id, False, error=error)
+
+    def recover(self) -> List[Dict]:
+        """
+        Requeue jobs left active by a previous process that stopped unexpectedly
+
+        Returns:
+            The requeued jobs, oldest first
+        """
+        with self._lock:
+            self.connection.execute(
+                'UPDATE jobs SET status = ?, started_at = NULL WHERE status = ?', (QUEUED, RUNNING)
+            )
+            self.connection.commit()
+            rows = self.connection.execute(
+                'SELECT * FROM jobs WHERE status = ? ORDER BY created_at', (QUEUED,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def prune(self, max_age: float = 7 * 24 * 60 * 60) -> int:
+        """
+        Delete finished jobs older than max_age seconds
+
+        Returns:
+            Number of jobs removed
+        """
+        with self._lock:
+            removed = self.connection.execute(
+                'DELETE FROM jobs WHERE finished_at < ?', (time.time() - max_age,)
+            ).rowcount
+            self.connection.commit()
+        return removed
+
+    def close(self):
+        """Close the job database connection"""
+        self.connection.close()
+
+    def _update(self, job_id: str, **fields):
+        """Set columns of one job"""
+        assignments = ', '.join(f'{column} = ?' for column in fields)
+        with self._lock:
+            self.connection.execute(
+                f'UPDATE jobs SET {assignments} WHERE id = ?', [*fields.values(), job_id]
+            )
+            self.connection.commit()
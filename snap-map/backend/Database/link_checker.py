@@ -0,0 +1,505 @@
+#!/usr/bin/env python3
+"""
+Link Checker
+Checks record links concurrently and stores the results in the database, so
+later runs only recheck links that are new, stale or were throttled
+
+Requests go over pooled keep-alive connections (at most PER_HOST at a time
+to one host, idle ones kept up to a global limit). Each host is rate limited
+by a scheduler: workers take the next link of whichever host may be
+contacted soonest, so a slow or strictly limited host never holds up the
+others. Every link is tried with HEAD first; servers often refuse or
+mishandle HEAD, so an error status is retried with GET before the link
+counts as broken.
+
+Run through db_utils.py (check-links, broken-links).
+"""
+
+import heapq
+import http.client
+import re
+import ssl
+import threading
+import time
+from collections import OrderedDict, deque
+from queue import Queue
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import quote, urljoin, urlsplit
+
+# Outcomes stored in link_checks.outcome
+OK = "ok"                    # 2xx after following redirects
+BROKEN = "broken"            # the server answered with an error status
+UNREACHABLE = "unreachable"  # no HTTP answer: DNS failure, refused, timeout, TLS error
+INVALID = "invalid"          # not an http(s) URL
+THROTTLED = "throttled"      # 429 / 503; always rechecked on the next run
+OUTCOMES = (OK, BROKEN, UNREACHABLE, INVALID, THROTTLED)
+
+# Order of the values in each result tuple (and the link_checks columns)
+LINK_CHECK_COLUMNS = ('link', 'outcome', 'status', 'final_url', 'error', 'elapsed_ms')
+
+DEFAULT_WORKERS = 32
+# Simultaneous requests to one host
+PER_HOST = 2
+# Requests per second to one host
+DEFAULT_RATE = 2.0
+DEFAULT_TIMEOUT = 10.0
+# Links checked within this many seconds are not checked again
+DEFAULT_MAX_AGE = 7 * 24 * 60 * 60
+MAX_REDIRECTS = 5
+# Idle keep-alive connections kept open across all hosts (only hosts with
+# links still to check keep theirs)
+MAX_IDLE_CONNECTIONS = 256
+# GET bodies are drained up to this size so the connection can be reused;
+# longer ones are cut off and the connection closed instead
+MAX_DRAIN_BYTES = 64 * 1024
+# Longest Retry-After honoured before contacting a throttling host again
+MAX_RETRY_AFTER = 60.0
+USER_AGENT = "SNAP-Map-LinkChecker/1.0"
+
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+THROTTLE_STATUSES = (429, 503)
+
+# Failures of a reused connection the server already closed; retried once on a new one
+_STALE_ERRORS = (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                 ConnectionResetError, BrokenPipeError)
+
+_SSL_CONTEXT = ssl.create_default_context()
+
+# "mailto:", "tel:", "javascript:" and the like (a host:port has digits after the colon)
+_OTHER_SCHEME_PATTERN = re.compile(r"^[a-zA-Z][a-zA-Z0-9+.-]*:(?!\d)")
+
+
+def normalize_link(link: Optional[str]) -> Optional[str]:
+    """
+    Turn a stored link into a URL that can be requested
+
+    Links come from model output, so a bare "www.example.org/page" gets an
+    https:// scheme and spaces or non-ASCII characters in the path are
+    percent-encoded.
+
+    Args:
+        link: Link as stored in the records table
+
+    Returns:
+        The URL, or None if it is not an http(s) URL
+    """
+    link = (link or "").strip()
+    if not link:
+        return None
+    if "://" not in link:
+        if _OTHER_SCHEME_PATTERN.match(link):
+            return None
+        link = "https://" + link.lstrip("/")
+    try:
+        parts = urlsplit(link)
+        parts.port  # Raises ValueError for a malformed port
+    except ValueError:
+        return None
+    if parts.scheme.lower() not in ("http", "https") or not parts.hostname:
+        return None
+    path = quote(parts.path or "/", safe="/%:@!$&'()*+,;=-._~")
+    query = quote(parts.query, safe="/%:@!$&'()*+,;=-._~?")
+    return f"{parts.scheme.lower()}://{parts.netloc}{path}{'?' + query if query else ''}"
+
+
+def _host_key(url: str) -> Tuple[str, str, int]:
+    """(scheme, host, port) of a normalized URL: one connection pool and rate limit each"""
+    parts = urlsplit(url)
+    return parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80)
+
+
+def _request_target(url: str) -> str:
+    """Path and query of a normalized URL"""
+    parts = urlsplit(url)
+    return f"{parts.path or '/'}{'?' + parts.query if parts.query else ''}"
+
+
+def _retry_after(response: http.client.HTTPResponse) -> float:
+    """Seconds to wait from a Retry-After header (delta seconds only), capped"""
+    try:
+        return min(max(float(response.getheader("Retry-After", "")), 0.0), MAX_RETRY_AFTER)
+    except ValueError:
+        return 1.0
+
+
+class _Host:
+    """Scheduling and pooling state of one (scheme, host, port)"""
+
+    __slots__ = ('key', 'pending', 'active', 'next_time', 'scheduled')
+
+    def __init__(self, key: Tuple[str, str, int]):
+        self.key = key
+        self.pending = deque()
+        self.active = 0
+        self.next_time = 0.0
+        self.scheduled = False
+
+
+class LinkChecker:
+    """Checks links concurrently over pooled keep-alive connections with per-host rate limits"""
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, rate: float = DEFAULT_RATE,
+                 per_host: int = PER_HOST, timeout: float = DEFAULT_TIMEOUT,
+                 max_idle: int = MAX_IDLE_CONNECTIONS):
+        """
+        Args:
+            workers: Number of checking threads
+            rate: Maximum requests per second to one host (None or 0 for no limit)
+            per_host: Maximum simultaneous requests to one host
+            timeout: Connect / read timeout in seconds
+            max_idle: Idle keep-alive connections kept open across all hosts
+
+        Raises:
+            ValueError: If workers is below 1 (no link would ever be checked)
+        """
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        self.workers = workers
+        self.interval = 1.0 / rate if rate else 0.0
+        self.per_host = per_host
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._hosts: Dict[Tuple[str, str, int], _Host] = {}
+        # (time, tie-breaker, host) of hosts with pending links and a free slot
+        self._heap: List[Tuple[float, int, _Host]] = []
+        self._sequence = 0
+        self._remaining = 0
+        # Idle connections by host, and all of them least recently used first
+        self._idle: Dict[Tuple[str, str, int], List[http.client.HTTPConnection]] = {}
+        self._idle_order: "OrderedDict[http.client.HTTPConnection, Tuple[str, str, int]]" = OrderedDict()
+        self.connections_opened = 0
+        self.requests_sent = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Close the idle connections"""
+        with self._lock:
+            idle = list(self._idle_order)
+            self._idle.clear()
+            self._idle_order.clear()
+        for connection in idle:
+            connection.close()
+
+    # --- Connection pool ---
+
+    def _acquire_connection(self, key: Tuple[str, str, int]) -> Tuple[http.client.HTTPConnection, bool]:
+        """An idle connection to the host if there is one, else a new one; returns (connection, reused)"""
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                connection = idle.pop()
+                del self._idle_order[connection]
+                return connection, True
+            self.connections_opened += 1
+        scheme, host, port = key
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout, context=_SSL_CONTEXT), False
+        return http.client.HTTPConnection(host, port, timeout=self.timeout), False
+
+    def _release_connection(self, connection: http.client.HTTPConnection, key: Tuple[str, str, int]):
+        """Keep a connection for reuse, closing the least recently used one beyond max_idle"""
+        with self._lock:
+            host = self._hosts.get(key)
+            if host is None or not host.pending:
+                # Nothing left to send there
+                evicted = connection
+            else:
+                self._idle.setdefault(key, []).append(connection)
+                self._idle_order[connection] = key
+                evicted = None
+                if len(self._idle_order) > self.max_idle:
+                    evicted, evicted_key = self._idle_order.popitem(last=False)
+                    self._idle[evicted_key].remove(evicted)
+        if evicted is not None:
+            evicted.close()
+
+    def _request(self, method: str, url: str) -> Tuple[int, Optional[str], float]:
+        """
+        Send one request over a pooled connection
+
+        Returns:
+            (status, Location header, Retry-After seconds)
+
+        Raises:
+            OSError / http.client.HTTPException: If no response was received
+        """
+        key = _host_key(url)
+        headers = {"User-Agent": USER_AGENT, "Accept": "*/*"}
+        target = _request_target(url)
+        while True:
+            connection, reused = self._acquire_connection(key)
+            try:
+                connection.request(method, target, headers=headers)
+                response = connection.getresponse()
+                # Read the body so the connection can carry the next request
+                body = response.read(MAX_DRAIN_BYTES)
+                complete = response.isclosed() or (len(body) < MAX_DRAIN_BYTES and not response.read(1))
+            except _STALE_ERRORS:
+                connection.close()
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                connection.close()
+                raise
+            with self._lock:
+                self.requests_sent += 1
+            if complete and not response.will_close:
+                self._release_connection(connection, key)
+            else:
+                connection.close()
+            return response.status, response.getheader("Location"), _retry_after(response)
+
+    # --- Checking ---
+
+    def _wait_for_host(self, key: Tuple[str, str, int]):
+        """Reserve the next request slot of a host and sleep until it (used for redirect targets)"""
+        with self._lock:
+            host = self._hosts.get(key)
+            if host is None:
+                host = self._hosts[key] = _Host(key)
+            now = time.monotonic()
+            start = max(now, host.next_time)
+            host.next_time = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+    def _throttle_host(self, key: Tuple[str, str, int], seconds: float):
+        """Push back the next request to a host that asked us to slow down"""
+        with self._lock:
+            host = self._hosts.get(key)
+            if host is not None:
+                host.next_time = max(host.next_time, time.monotonic() + seconds)
+
+    def _check_url(self, url: str) -> Tuple[str, Optional[int], str, Optional[str]]:
+        """
+        Check one normalized URL, following redirects
+
+        The first request's rate-limit slot is reserved by the caller.
+
+        Returns:
+            (outcome, status, final URL, error)
+        """
+        for redirect in range(MAX_REDIRECTS + 1):
+            key = _host_key(url)
+            if redirect:
+                self._wait_for_host(key)
+            try:
+                status, location, retry_after = self._request("HEAD", url)
+                if status >= 400 and status not in THROTTLE_STATUSES:
+                    # HEAD not allowed / not implemented / mishandled: ask with GET
+                    self._wait_for_host(key)
+                    status, location, retry_after = self._request("GET", url)
+            except (OSError, http.client.HTTPException) as e:
+                return UNREACHABLE, None, url, f"{type(e).__name__}: {e}"[:200]
+
+            if status in REDIRECT_STATUSES and location:
+                url = normalize_link(urljoin(url, location))
+                if url is None:
+                    return INVALID, status, location, "Redirect to a non-http(s) URL"
+                continue
+            if status in THROTTLE_STATUSES:
+                self._throttle_host(key, retry_after)
+                return THROTTLED, status, url, None
+            if status >= 400:
+                return BROKEN, status, url, None
+            return OK, status, url, None
+        return BROKEN, status, url, f"More than {MAX_REDIRECTS} redirects"
+
+    def check(self, link: str) -> Tuple:
+        """
+        Check a single link (waiting for its host's rate limit)
+
+        Args:
+            link: Link as stored in the records table
+
+        Returns:
+            Result tuple in LINK_CHECK_COLUMNS order
+        """
+        url = normalize_link(link)
+        if url is None:
+            return (link, INVALID, None, None, "Not an http(s) URL", 0.0)
+        start = time.perf_counter()
+        self._wait_for_host(_host_key(url))
+        outcome, status, final_url, error = self._check_url(url)
+        return (link, outcome, status, final_url, error, (time.perf_counter() - start) * 1000)
+
+    def _schedule(self, host: _Host):
+        """Queue a host for its next request if it has work and a free slot (lock held)"""
+        if host.pending and not host.scheduled and host.active < self.per_host:
+            host.scheduled = True
+            self._sequence += 1
+            heapq.heappush(self._heap, (host.next_time, self._sequence, host))
+            self._ready.notify()
+
+    def _next_link(self) -> Optional[Tuple[_Host, str, str]]:
+        """
+        Take the link whose host may be contacted soonest, waiting for its slot
+
+        Returns:
+            (host, link, normalized URL), or None once every link is taken
+        """
+        with self._lock:
+            while True:
+                if self._remaining == 0:
+                    return None
+                if not self._heap:
+                    # Every host with links left is at its concurrency limit
+                    self._ready.wait()
+                    continue
+                ready_at, _, host = self._heap[0]
+                delay = ready_at - time.monotonic()
+                if delay > 0:
+                    # A finished request or throttle may reorder the heap meanwhile
+                    self._ready.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+                host.scheduled = False
+                if host.next_time > ready_at:
+                    # Throttled after it was queued
+                    self._schedule(host)
+                    continue
+                link, url = host.pending.popleft()
+                self._remaining -= 1
+                host.active += 1
+                host.next_time = max(time.monotonic(), host.next_time) + self.interval
+                self._schedule(host)
+                if self._remaining == 0:
+                    self._ready.notify_all()
+                return host, link, url
+
+    def _finished(self, host: _Host):
+        """Free the host's slot for its next link"""
+        with self._lock:
+            host.active -= 1
+            self._schedule(host)
+
+    def _work(self, results: Queue):
+        """Worker thread: check links until none are left"""
+        while True:
+            taken = self._next_link()
+            if taken is None:
+                results.put(None)
+                return
+            host, link, url = taken
+            start = time.perf_counter()
+            try:
+                outcome, status, final_url, error = self._check_url(url)
+            except Exception as e:
+                outcome, status, final_url, error = UNREACHABLE, None, url, f"{type(e).__name__}: {e}"[:200]
+            finally:
+                self._finished(host)
+            results.put((link, outcome, status, final_url, error, (time.perf_counter() - start) * 1000))
+
+    def check_many(self, links: Iterable[str]) -> Iterator[Tuple]:
+        """
+        Check links concurrently
+
+        Args:
+            links: Links as stored in the records table
+
+        Yields:
+            Result tuples in LINK_CHECK_COLUMNS order, as each check finishes
+        """
+        results = Queue()
+        with self._lock:
+            for link in links:
+                url = normalize_link(link)
+                if url is None:
+                    results.put((link, INVALID, None, None, "Not an http(s) URL", 0.0))
+                    continue
+                key = _host_key(url)
+                host = self._hosts.get(key)
+                if host is None:
+                    host = self._hosts[key] = _Host(key)
+                host.pending.append((link, url))
+                self._remaining += 1
+            for host in self._hosts.values():
+                self._schedule(host)
+            workers = min(self.workers, self._remaining)
+
+        invalid = results.qsize()
+        for _ in range(invalid):
+            yield results.get()
+
+        threads = [threading.Thread(target=self._work, args=(results,), name=f"link-checker-{number}",
+                                    daemon=True)
+                   for number in range(workers)]
+        for thread in threads:
+            thread.start()
+        finished = 0
+        while finished < workers:
+            result = results.get()
+            if result is None:
+                finished += 1
+            else:
+                yield result
+
+
+def check_database_links(db, max_age: float = DEFAULT_MAX_AGE, limit: int = None,
+                         workers: int = DEFAULT_WORKERS, rate: float = DEFAULT_RATE,
+                         timeout: float = DEFAULT_TIMEOUT, batch_size: int = 500,
+                         progress: bool = True) -> dict:
+    """
+    Check the links that are due and store the results
+
+    Results are written in batches from this thread as they arrive, so the
+    database has a single writer and an interrupted run keeps what it
+    already checked.
+
+    Args:
+        db: DatabaseManager to read links from and save results to
+        max_age: Recheck links last checked at least this many seconds ago
+                 (None rechecks every link)
+        limit: Check at most this many links
+        workers: Number of checking threads
+        rate: Maximum requests per second to one host
+        timeout: Request timeout in seconds
+        batch_size: Results saved per transaction
+        progress: Print progress while checking
+
+    Returns:
+        {'checked': ..., 'seconds': ..., 'requests': ..., 'connections': ...,
+        plus a count for each outcome}
+
+    Raises:
+        ValueError: If workers is below 1
+    """
+    if workers < 1:
+        raise ValueError("workers must be at least 1")
+    links = db.links_to_check(max_age, limit)
+    summary = {outcome: 0 for outcome in OUTCOMES}
+    summary.update(checked=0, seconds=0.0, requests=0, connections=0)
+    if not links:
+        return summary
+
+    if progress:
+        print(f"Checking {len(links)} links with {min(workers, len(links))} workers...")
+    start = time.perf_counter()
+    batch = []
+    with LinkChecker(workers, rate, timeout=timeout) as checker:
+        for result in checker.check_many(links):
+            batch.append(result)
+            summary[result[1]] += 1
+            summary['checked'] += 1
+            if len(batch) >= batch_size:
+                db.save_link_checks(batch)
+                batch = []
+                if progress:
+                    print(f"  [{summary['checked']}/{len(links)}] {summary[OK]} ok, "
+                          f"{summary[BROKEN] + summary[UNREACHABLE] + summary[INVALID]} failing "
+                          f"({time.perf_counter() - start:.1f}s)")
+        if batch:
+            db.save_link_checks(batch)
+        summary['requests'] = checker.requests_sent
+        summary['connections'] = checker.connections_opened
+    summary['seconds'] = time.perf_counter() - start
+    return summary
+
@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""
+Near-Duplicate Detection
+Finds records that are probably the same place under slightly different
+names or addresses ("Greater Pittsburgh Community Food Bank" vs "Greater
+Pittsburgh Food Bank"), which the exact dedupe_key cannot match
+
+Each record is reduced to a set of shingles (character trigrams of the
+folded name and address in its dedupe key) and summarized by a MinHash
+signature, whose agreement with another signature estimates the Jaccard
+similarity of the two shingle sets. LSH banding splits signatures into
+BANDS bands of ROWS values; only records that agree on a whole band are
+compared, so the work grows with the number of records rather than the
+number of pairs. Candidates whose estimate comes close to the threshold
+are then checked with their exact Jaccard similarity, so estimation noise
+does not link unrelated records.
+
+Text similarity alone cannot tell "The Salvation Army, 123 Main St" from
+the same name at 456 Main St, or "St Mary Food Pantry, 200 Oak Ave" from
+"St Paul Food Pantry, 210 Oak Ave". Records are therefore only compared
+when their address anchors agree (see address_anchor): the same street
+number, or the same address when there is none, and no conflicting ZIP.
+Most anchors hold only a few such pairs, which are compared exactly; the
+signatures and banding are for the crowded ones.
+
+Signatures use one-permutation hashing: every shingle is hashed once into
+one of NUM_PERM bins and each bin keeps its minimum, with empty bins filled
+from the next non-empty bin (densification by rotation). That costs one
+hash per shingle instead of one per shingle and permutation, and since
+folded text only has so many trigrams, each shingle's hash is computed once
+and kept. That is what makes a million records practical in pure Python.
+"""
+
+import struct
+import zlib
+from functools import lru_cache
+from itertools import chain, combinations, compress, product, repeat
+from operator import itemgetter
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+# MinHash values (bins) per signature and how they are banded
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+# Top bits of a shingle hash pick its bin, the rest is its value
+_BIN_BITS = 6
+_VALUE_BITS = 32 - _BIN_BITS
+_VALUE_MASK = (1 << _VALUE_BITS) - 1
+_EMPTY = 1 << _VALUE_BITS
+# Odd multiplier that spreads CRC-32 bits before binning
+_MIX = 0x9E3779B1
+# Mixed hash of every shingle seen so far. Folded text only has so many
+# trigrams, so this stays small; it is cleared if odd input ever grows it.
+_shingle_hashes: Dict[str, int] = {}
+_MAX_SHINGLE_HASHES = 1 << 18
+
+# Jaccard similarity at which two records count as near-duplicates
+DEFAULT_THRESHOLD = 0.7
+
+# How far below the threshold an estimate may be and still get an exact check
+ESTIMATE_MARGIN = 0.15
+
+SHINGLE_SIZE = 3
+
+# Earlier members of a bucket each record is compared with. Records sharing
+# a common name ("Salvation Army") fill large buckets in every band; true
+# near-duplicates also meet in the small buckets of their shared address
+# bins, so a short window keeps the work linear at little cost in recall.
+MAX_BUCKET_COMPARISONS = 10
+
+# Anchor groups that need at most this many exact comparisons per record skip
+# signatures: one signature costs about as much as ten exact comparisons
+MAX_PAIRS_PER_RECORD = 8
+
+# Lowest bit of every 32-bit value in a signature
+_LANE_BITS = int('00000001' * NUM_PERM, 16)
+# Densified neighbours are correlated, so band b holds bins b, b + BANDS, ...
+_BAND_ORDER = itemgetter(*[band + BANDS * row for band in range(BANDS) for row in range(ROWS)])
+_PACKED = struct.Struct(f'<{NUM_PERM}I')
+# Splits a packed signature into its bands, as bytes usable as bucket keys
+_BANDS = struct.Struct(f'{4 * ROWS}s' * BANDS)
+
+try:
+    _popcount = int.bit_count  # Python 3.10+
+except AttributeError:
+    def _popcount(value: int) -> int:
+        return bin(value).count('1')
+
+
+def shingles(key: str) -> Set[str]:
+    """
+    Shingle set of a record: trigrams of the name and of the address in its dedupe key
+
+    Dedupe keys are already folded (case, accents, punctuation, address
+    abbreviations), so only real wording differences count. Name and
+    address trigrams are kept apart, so a name never matches an address.
+
+    Args:
+        key: The record's dedupe key, "name words|address words"
+
+    Returns:
+        The shingles (empty when neither part has any words)
+    """
+    name, _, address = key.partition('|')
+    found = set()
+    if name:
+        text = f" {name} "
+        found = {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+    if address:
+        # '|' never survives folding, so it marks address trigrams apart from name ones
+        text = f" {address} "
+        found.update(['|' + text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)])
+    return found
+
+
+def address_anchor(key: str) -> Tuple[str, Optional[str]]:
+    """
+    Street number and ZIP code of the address in a dedupe key
+
+    Reworded copies of a place keep its street number, while different
+    places with similar names or on the same street differ in it.
+
+    Args:
+        key: The record's dedupe key, "name words|address words"
+
+    Returns:
+        (anchor, zip_code): the anchor is the first word of the address
+        starting with a digit (the street number), or the whole address
+        when there is none; zip_code is None when the address has none
+    """
+    words = key.partition('|')[2].split()
+    zip_code = None
+    # Folding turns ZIP+4 into two words
+    if len(words) >= 2 and len(words[-1]) == 4 and words[-1].isdigit() \
+            and len(words[-2]) == 5 and words[-2].isdigit():
+        words.pop()
+    if words and len(words[-1]) == 5 and words[-1].isdigit():
+        zip_code = words.pop()
+    for word in words:
+        if word[0].isdigit():
+            return word, zip_code
+    return '|' + ' '.join(words), zip_code
+
+
+# Exact checks compare each record with its bucket neighbours, so the same
+# keys come back many times in a row
+_cached_shingles = lru_cache(maxsize=4096)(shingles)
+
+
+def _set_jaccard(first: Set[str], second: Set[str]) -> float:
+    """Jaccard similarity of two shingle sets"""
+    common = len(first & second)
+    union = len(first) + len(second) - common
+    return common / union if union else 0.0
+
+
+def jaccard(first: str, second: str) -> float:
+    """Exact Jaccard similarity of the shingle sets of two dedupe keys"""
+    return _set_jaccard(_cached_shingles(first), _cached_shingles(second))
+
+
+def _hashes(shingle_set: Set[str]) -> List[int]:
+    """Mixed CRC-32 of every shingle in a set, largest first"""
+    try:
+        return sorted(map(_shingle_hashes.__getitem__, shingle_set), reverse=True)
+    except KeyError:
+        if len(_shingle_hashes) > _MAX_SHINGLE_HASHES:
+            _shingle_hashes.clear()
+        for shingle in shingle_set:
+            if shingle not in _shingle_hashes:
+                _shingle_hashes[shingle] = (zlib.crc32(shingle.encode('utf-8')) * _MIX) & 0xFFFFFFFF
+        return sorted(map(_shingle_hashes.__getitem__, shingle_set), reverse=True)
+
+
+def signature(shingle_set: Set[str]) -> Optional[int]:
+    """
+    MinHash signature of a shingle set (one-permutation hashing)
+
+    An empty bin takes the value of the next non-empty bin (wrapping
+    around) plus its distance times _EMPTY, so two sets only agree on a
+    filled-in bin when they agree on where its value came from.
+
+    Args:
+        shingle_set: Shingles from shingles()
+
+    Returns:
+        NUM_PERM 32-bit values packed into one integer, band by band from
+        the low bits up, or None for an empty set
+    """
+    packed = _packed_signature(shingle_set)
+    return None if packed is None else int.from_bytes(packed, 'little')
+
+
+def _packed_signature(shingle_set: Set[str]) -> Optional[bytes]:
+    """signature() as little-endian bytes, which _band_keys splits without arithmetic"""
+    if not shingle_set:
+        return None
+    bins = [_EMPTY] * NUM_PERM
+    # A bin is the top bits of a hash, so going from the largest hash down
+    # leaves every bin holding its smallest value
+    for h in _hashes(shingle_set):
+        bins[h >> _VALUE_BITS] = h & _VALUE_MASK
+
+    if _EMPTY in bins:
+        # Right to left, so `source` is always the next filled bin (wrapping)
+        source = next(index for index, value in enumerate(bins) if value < _EMPTY) + NUM_PERM
+        for index in range(NUM_PERM - 1, -1, -1):
+            if bins[index] < _EMPTY:
+                source = index
+            else:
+                bins[index] = bins[source % NUM_PERM] + (source - index) * _EMPTY
+    return _PACKED.pack(*_BAND_ORDER(bins))
+
+
+def similarity(first: int, second: int) -> float:
+    """Estimated Jaccard similarity of two signatures (fraction of equal values)"""
+    # Fold each 32-bit value's bits into its lowest bit, which is then set
+    # only where the two values differ
+    diff = first ^ second
+    for shift in (16, 8, 4, 2, 1):
+        diff |= diff >> shift
+    return 1 - _popcount(diff & _LANE_BITS) / NUM_PERM
+
+
+def _band_keys(packed: bytes) -> Tuple[bytes, ...]:
+    """The BANDS slices of a packed signature used as bucket keys"""
+    return _BANDS.unpack(packed)
+
+
+def _same_zip(first: Optional[str], second: Optional[str]) -> bool:
+    """Whether two ZIP codes can belong to one place (a missing one matches any)"""
+    return first is None or second is None or first == second
+
+
+class _ShingleSets(dict):
+    """Shingle sets of records by position, built the first time each is needed"""
+
+    def __init__(self, keys: List[str]):
+        super().__init__()
+        self.keys = keys
+
+    def __missing__(self, position: int) -> Set[str]:
+        found = self[position] = shingles(self.keys[position])
+        return found
+
+
+def _bucket_pairs(members: List[int], packed: Dict[int, bytes]) -> Iterator[Tuple[int, int]]:
+    """
+    Pairs of positions that share a bucket in some band, within the comparison window
+
+    All bands share one set of buckets; four equal hash values in two
+    different bands are too unlikely to matter, and candidates are checked
+    anyway. Nearly every bucket holds a single record, so shared keys are
+    found with dict and set operations before any bucket is built.
+    """
+    keys = list(chain.from_iterable(map(_BANDS.unpack, map(packed.__getitem__, members))))
+    positions = list(chain.from_iterable(map(repeat, members, repeat(BANDS))))
+    last = dict(zip(keys, positions))
+    if len(last) == len(keys):
+        return
+    # A key's first and last position differ exactly when it is shared
+    first = dict(zip(reversed(keys), reversed(positions)))
+    shared = {key for key, _ in last.items() - first.items()}
+
+    buckets: Dict[bytes, List[int]] = {}
+    for key, position in compress(zip(keys, positions), map(shared.__contains__, keys)):
+        buckets.setdefault(key, []).append(position)
+    for bucket in buckets.values():
+        for offset in range(1, len(bucket)):
+            for other in bucket[max(0, offset - MAX_BUCKET_COMPARISONS):offset]:
+                yield bucket[offset], other
+
+
+def find_near_duplicates(records: Iterable[Tuple[int, str]],
+                         threshold: float = DEFAULT_THRESHOLD) -> List[List[int]]:
+    """
+    Group records that are near-duplicates of each other
+
+    Records are split by address anchor first. Within an anchor only pairs
+    with the same ZIP code, or with a record that has none, can be linked;
+    when there are few of those they are all compared exactly. Otherwise the
+    anchor's signatures are bucketed by band and records sharing a bucket
+    are compared, checking the estimated similarity before the exact one.
+    Records are linked when their ZIP codes do not conflict and their exact
+    similarity reaches threshold, and groups are the connected components
+    of those links (a group never mixes two ZIP codes).
+
+    Args:
+        records: (id, dedupe_key) tuples
+        threshold: Minimum Jaccard similarity
+
+    Returns:
+        Groups of record IDs (each sorted ascending, at least two long),
+        largest groups first
+    """
+    ids: List[int] = []
+    keys: List[str] = []
+    # ZIP code of each group, kept on its root
+    zips: List[Optional[str]] = []
+    by_anchor: Dict[str, Dict[Optional[str], List[int]]] = {}
+    for record_id, key in records:
+        anchor, zip_code = address_anchor(key)
+        by_anchor.setdefault(anchor, {}).setdefault(zip_code, []).append(len(ids))
+        ids.append(record_id)
+        keys.append(key)
+        zips.append(zip_code)
+
+    parent = list(range(len(ids)))
+
+    def find(position: int) -> int:
+        while parent[position] != position:
+            parent[position] = parent[parent[position]]
+            position = parent[position]
+        return position
+
+    floor = threshold - ESTIMATE_MARGIN
+    for by_zip in by_anchor.values():
+        loose = by_zip.pop(None, [])
+        zipped = list(chain.from_iterable(by_zip.values()))
+        members = loose + zipped
+        # Pairs within each ZIP code, among records without one, and between the two
+        pair_count = sum(len(group) * (len(group) - 1) // 2 for group in by_zip.values()) \
+            + len(loose) * (len(loose) - 1) // 2 + len(loose) * len(zipped)
+        if not pair_count:
+            continue
+        shingle_sets = _ShingleSets(keys)
+        if pair_count <= MAX_PAIRS_PER_RECORD * len(members):
+            signatures = None
+            pairs = chain(chain.from_iterable(map(combinations, by_zip.values(), repeat(2))),
+                          combinations(loose, 2), product(loose, zipped))
+        else:
+            packed = {position: _packed_signature(shingle_sets[position]) for position in members}
+            members = [position for position in members if packed[position] is not None]
+            signatures = {position: int.from_bytes(packed[position], 'little') for position in members}
+            pairs = _bucket_pairs(members, packed)
+
+        for position, other in pairs:
+            first, second = find(position), find(other)
+            if first != second and _same_zip(zips[first], zips[second]) \
+                    and (signatures is None or similarity(signatures[position], signatures[other]) >= floor) \
+                    and _set_jaccard(shingle_sets[position], shingle_sets[other]) >= threshold:
+                parent[second] = first
+                zips[first] = zips[first] or zips[second]
+
+    groups: Dict[int, List[int]] = {}
+    for position, record_id in enumerate(ids):
+        groups.setdefault(find(position), []).append(record_id)
+    return sorted((sorted(group) for group in groups.values() if len(group) > 1),
+                  key=lambda group: (-len(group), group[0]))
+
+
+class NearDuplicateIndex:
+    """In-memory LSH index for checking new records against existing ones"""
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD):
+        """
+        Args:
+            threshold: Minimum Jaccard similarity for a match
+        """
+        self.threshold = threshold
+        self._keys: Dict[int, str] = {}
+        self._signatures: Dict[int, int] = {}
+        # Per band: (address anchor, band value) -> record IDs
+        self._buckets: List[Dict[Tuple[str, bytes], List[int]]] = [{} for _ in range(BANDS)]
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def add(self, record_id: int, key: str):
+        """Index an existing record by its dedupe key"""
+        packed = _packed_signature(shingles(key))
+        if packed is None or self._keys.get(record_id) == key:
+            return
+        self._keys[record_id] = key
+        self._signatures[record_id] = int.from_bytes(packed, 'little')
+        anchor = address_anchor(key)[0]
+        for buckets, band in zip(self._buckets, _band_keys(packed)):
+            buckets.setdefault((anchor, band), []).append(record_id)
+
+    def matches(self, key: str) -> List[Tuple[int, float]]:
+        """
+        Find indexed records that a new record is a near-duplicate of
+
+        Records with exactly the same key are not reported; those are plain
+        duplicates, which the unique dedupe index already handles. Only
+        records with the same address anchor and no conflicting ZIP code
+        are considered.
+
+        Args:
+            key: New record's dedupe key
+
+        Returns:
+            (record_id, similarity) pairs, most similar first
+        """
+        packed = _packed_signature(shingles(key))
+        if packed is None:
+            return []
+        sig = int.from_bytes(packed, 'little')
+        anchor, zip_code = address_anchor(key)
+        candidates = set()
+        for buckets, band in zip(self._buckets, _band_keys(packed)):
+            candidates.update(buckets.get((anchor, band), ()))
+
+        floor = self.threshold - ESTIMATE_MARGIN
+        found = []
+        for record_id in candidates:
+            if self._keys[record_id] != key and _same_zip(zip_code, address_anchor(self._keys[record_id])[1]) \
+                    and similarity(sig, self._signatures[record_id]) >= floor:
+                score = jaccard(key, self._keys[record_id])
+                if score >= self.threshold:
+                    found.append((record_id, score))
+        return sorted(found, key=lambda match: (-match[1], match[0]))
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Parser Benchmark
+Times parse_opportunities against the old greedy-regex extraction on
+well-formed and pathological responses of growing size
+
+Usage: python parser_benchmark.py [max_megabytes]
+"""
+
+import json
+import re
+import sys
+import time
+
+from response_parser import parse_opportunities
+
+# The extraction parse_opportunities_from_response used before the single-pass parser
+GREEDY_PATTERN = re.compile(r'\{.*"opportunities".*\}', re.DOTALL)
+
+# The greedy regex is quadratic on some inputs; skip it above this size
+GREEDY_LIMIT = 64 * 1024
+
+
+def make_response(size: int) -> str:
+    """A valid response wrapped in prose, with enough opportunities to reach ~size bytes"""
+    opportunity = {
+        "name": "Community Food Bank {i}",
+        "link": "https://example.org/{i}",
+        "location": "{i} Main St, Pittsburgh, PA 15219",
+        "description": "Free groceries every {{weekday}} - bring an ID [optional]",
+    }
+    entry = json.dumps(opportunity)
+    count = max(1, size // len(entry))
+    body = json.dumps({"opportunities": [json.loads(entry.replace("{i}", str(i))) for i in range(count)]})
+    return f"Here are the opportunities:\n```json\n{body}\n```\nLet me know if you need more!"
+
+
+def make_unbalanced(size: int) -> str:
+    """Many opening braces and no closing ones - worst case for backtracking regexes"""
+    return '{"opportunities": ' + '{"a": ' * (size // 6)
+
+
+def make_truncated(size: int) -> str:
+    """A valid response cut off partway through"""
+    response = make_response(size)
+    return response[:len(response) * 2 // 3]
+
+
+def make_prose(size: int) -> str:
+    """Braces scattered through text that never mentions opportunities"""
+    return "see {note} and [ref] " * (size // 21)
+
+
+def time_call(func, text: str) -> float:
+    """Seconds taken by one call of func(text)"""
+    start = time.perf_counter()
+    func(text)
+    return time.perf_counter() - start
+
+
+def greedy_extract(text: str):
+    """The old first step: greedy regex, then json.loads"""
+    match = GREEDY_PATTERN.search(text)
+    if match:
+        try:
+            return json.loads(match.group(0))
+        except json.JSONDecodeError:
+            return None
+    return None
+
+
+def main():
+    """Print a timing table; parse time per MB should stay roughly constant"""
+    try:
+        max_megabytes = float(sys.argv[1]) if len(sys.argv) > 1 else 4
+    except ValueError:
+        print(__doc__)
+        return
+
+    sizes = []
+    size = 16 * 1024
+    while size <= max_megabytes * 1024 * 1024:
+        sizes.append(size)
+        size *= 4
+
+    print(f"{'Input':<12} {'Size':>10} {'Parsed':>8} {'parse (ms)':>12} {'ms/MB':>8} {'greedy (ms)':>12}")
+    print("-" * 68)
+
+    for name, make in (("valid", make_response), ("truncated", make_truncated),
+                       ("unbalanced", make_unbalanced), ("prose", make_prose)):
+        for size in sizes:
+            text = make(size)
+            parsed = len(parse_opportunities(text))
+            elapsed = time_call(parse_opportunities, text)
+            per_mb = elapsed * 1000 / (len(text) / (1024 * 1024))
+
+            if len(text) <= GREEDY_LIMIT:
+                greedy = f"{time_call(greedy_extract, text) * 1000:12.1f}"
+            else:
+                greedy = f"{'skipped':>12}"
+
+            print(f"{name:<12} {len(text):>10,} {parsed:>8} {elapsed * 1000:>12.1f} {per_mb:>8.1f} {greedy}")
+
+
+if __name__ == "__main__":
+    main()
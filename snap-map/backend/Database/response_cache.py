@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Response Cache
+Persistent SQLite cache for Claude responses with TTL expiry and LRU eviction
+"""
+
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from database_manager import city_key
+
+
+class ResponseCache:
+    """Caches Claude responses keyed on (city, number of opportunities, model, prompt version)"""
+
+    def __init__(self, db_path: str = "claude_cache.db", ttl: float = 24 * 60 * 60,
+                 max_entries: int = 1000):
+        """
+        Initialize the cache, creating its table if needed
+
+        Args:
+            db_path: Path to the SQLite file holding the cache
+            ttl: Seconds a cached response stays valid
+            max_entries: Maximum number of cached responses; the least
+                         recently used ones are evicted beyond this
+        """
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS response_cache (
+                cache_key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL
+            )
+        ''')
+        self.connection.execute('''
+            CREATE INDEX IF NOT EXISTS idx_cache_last_used ON response_cache(last_used_at)
+        ''')
+        self.connection.commit()
+
+    @staticmethod
+    def make_key(city: str, num_opportunities: int, model: str, prompt_version: str) -> str:
+        """
+        Build the cache key for a query
+
+        Args:
+            city: City that was queried (case, spacing and punctuation are ignored)
+            num_opportunities: Number of opportunities requested
+            model: Claude model name
+            prompt_version: Version of the prompt template
+
+        Returns:
+            Cache key string
+        """
+        return f"{city_key(city) or ''}|{num_opportunities}|{model}|{prompt_version}"
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a cached response
+
+        Args:
+            key: Key from make_key()
+
+        Returns:
+            The cached response, or None if missing or expired
+        """
+        now = time.time()
+        with self._lock:
+            row = self.connection.execute(
+                'SELECT response, created_at FROM response_cache WHERE cache_key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            response, created_at = row
+            if now - created_at > self.ttl:
+                self.connection.execute('DELETE FROM response_cache WHERE cache_key = ?', (key,))
+                self.connection.commit()
+                return None
+
+            self.connection.execute(
+                'UPDATE response_cache SET last_used_at = ? WHERE cache_key = ?', (now, key)
+            )
+            self.connection.commit()
+            return response
+
+    def put(self, key: str, response: str):
+        """
+        Store a response, evicting the least recently used entries if the cache is full
+
+        Args:
+            key: Key from make_key()
+            response: Response text to cache
+        """
+        now = time.time()
+        with self._lock:
+            self.connection.execute('''
+                INSERT INTO response_cache (cache_key, response, created_at, last_used_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(cache_key) DO UPDATE SET
+                    response = excluded.response,
+                    created_at = excluded.created_at,
+                    last_used_at = excluded.last_used_at
+            ''', (key, response, now, now))
+
+            # Drop expired entries first, then the least recently used ones
+            self.connection.execute(
+                'DELETE FROM response_cache WHERE created_at < ?', (now - self.ttl,)
+            )
+            self.connection.execute('''
+                DELETE FROM response_cache WHERE cache_key IN (
+                    SELECT cache_key FROM response_cache
+                    ORDER BY last_used_at DESC
+                    LIMIT -1 OFFSET ?
+                )
+            ''', (self.max_entries,))
+            self.connection.commit()
+
+    def clear(self) -> int:
+        """
+        Remove every cached response
+
+        Returns:
+            Number of entries removed
+        """
+        with self._lock:
+            removed = self.connection.execute('DELETE FROM response_cache').rowcount
+            self.connection.commit()
+        return removed
+
+    def close(self):
+        """Close the cache database"""
+        self.connection.close()
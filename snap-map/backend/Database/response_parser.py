@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Response Parser
+Extracts opportunity objects from Claude's JSON output, either from a complete
+response or incrementally as it streams in. Every parser here makes a single
+forward pass, so time stays linear in the response size even for long or
+malformed output.
+"""
+
+import json
+import re
+from typing import Dict, Iterator, List, Tuple
+
+# Structural JSON tokens: a string or a bracket/brace. A string without its
+# closing quote (no "end" group) is still arriving in a later chunk.
+STRUCTURE_PATTERN = re.compile(r'"(?:[^"\\]|\\.)*(?P<end>")?|[{}\[\]]', re.DOTALL)
+
+# Where a JSON value can start when we are not inside one yet
+JSON_START_PATTERN = re.compile(r'[{\[]')
+
+CLOSERS = {'}': '{', ']': '['}
+
+DECODER = json.JSONDecoder()
+
+# What decoding untrusted text can raise: malformed JSON (JSONDecodeError is
+# a ValueError) or nesting deeper than the recursion limit
+DECODE_ERRORS = (ValueError, RecursionError)
+
+# Last-resort field extraction for output that is not valid JSON at all
+FIELD_PATTERN = re.compile(r'"(name|link|location|description)"\s*:\s*"((?:[^"\\\n]|\\.)*)"')
+
+
+class OpportunityStreamParser:
+    """
+    Pulls each complete object out of a JSON array as soon as its closing brace arrives
+
+    Feed text chunks in order; every object that is an element of an array
+    (e.g. each entry of {"opportunities": [...]}) and contains a "name" is
+    returned as a dict once it is complete. Prose before or after the JSON is
+    skipped. Every character is scanned once, and only the object currently
+    being read is kept in memory.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._position = 0
+        self._stack = []
+        self._object_start = None  # buffer index where the current array element began
+        self._object_depth = 0
+
+    def feed(self, chunk: str) -> List[Dict]:
+        """
+        Add the next piece of the response
+
+        Args:
+            chunk: Text that follows everything fed so far
+
+        Returns:
+            Opportunity dicts completed by this chunk, in order
+        """
+        self._buffer += chunk
+        completed = []
+        buffer = self._buffer
+
+        while True:
+            if not self._stack:
+                match = JSON_START_PATTERN.search(buffer, self._position)
+            else:
+                match = STRUCTURE_PATTERN.search(buffer, self._position)
+            if match is None:
+                self._position = len(buffer)
+                break
+
+            token = match.group()
+            if token[0] == '"':
+                if match.group('end') is None:
+                    # String continues in the next chunk - rescan it then
+                    self._position = match.start()
+                    break
+                self._position = match.end()
+                continue
+
+            self._position = match.end()
+            if token in '{[':
+                if token == '{' and self._stack and self._stack[-1] == '[' and self._object_start is None:
+                    self._object_start = match.start()
+                    self._object_depth = len(self._stack)
+                self._stack.append(token)
+                continue
+
+            # Closing bracket: anything that doesn't match means this wasn't JSON after all
+            if self._stack[-1] != CLOSERS[token]:
+                self._reset()
+                continue
+            self._stack.pop()
+
+            if token == '}' and self._object_start is not None and len(self._stack) == self._object_depth:
+                opportunity = _load_object(buffer[self._object_start:self._position])
+                if opportunity is not None:
+                    completed.append(opportunity)
+                self._object_start = None
+
+        self._trim()
+        return completed
+
+    def _reset(self):
+        """Forget any partially read JSON"""
+        self._stack = []
+        self._object_start = None
+
+    def _trim(self):
+        """Drop text that has been fully consumed"""
+        keep_from = self._position if self._object_start is None else self._object_start
+        if keep_from:
+            self._buffer = self._buffer[keep_from:]
+            self._position -= keep_from
+            if self._object_start is not None:
+                self._object_start = 0
+
+
+def _load_object(text: str):
+    """Decode one JSON object, returning it only if it looks like an opportunity"""
+    try:
+        value = json.loads(text)
+    except DECODE_ERRORS:
+        return None
+    if isinstance(value, dict) and 'name' in value:
+        return value
+    return None
+
+
+def iter_json_spans(text: str) -> Iterator[Tuple[int, int]]:
+    """
+    Find balanced top-level {...} / [...] regions in free text
+
+    Brackets inside JSON strings are ignored. A closing bracket that does
+    not match abandons the current region and scanning continues after it,
+    so prose around (or between) JSON blocks is skipped.
+
+    Args:
+        text: Text that may contain JSON
+
+    Yields:
+        (start, end) slices of each balanced region, in order
+    """
+    position = 0
+    stack = []
+    start = 0
+
+    while True:
+        pattern = STRUCTURE_PATTERN if stack else JSON_START_PATTERN
+        match = pattern.search(text, position)
+        if match is None:
+            return
+
+        token = match.group()
+        position = match.end()
+        if token[0] == '"':
+            if match.group('end') is None:
+                return  # unterminated string: nothing after it can be balanced
+            continue
+
+        if token in '{[':
+            if not stack:
+                start = match.start()
+            stack.append(token)
+        elif stack[-1] != CLOSERS[token]:
+            stack = []
+        else:
+            stack.pop()
+            if not stack:
+                yield start, position
+
+
+def _opportunities_from_value(value):
+    """Return the opportunity list held by a decoded JSON value, or None"""
+    if isinstance(value, dict):
+        opportunities = value.get('opportunities')
+    elif value:
+        opportunities = value  # a bare, non-empty list of objects
+    else:
+        return None
+    if isinstance(opportunities, list) and all(isinstance(item, dict) for item in opportunities):
+        return opportunities
+    return None
+
+
+def _parse_fields(response: str) -> List[Dict]:
+    """Pull name/link/location/description fields out of non-JSON text, in order"""
+    opportunities = []
+    current = {}
+
+    for match in FIELD_PATTERN.finditer(response):
+        key, raw = match.groups()
+        try:
+            value = json.loads(f'"{raw}"')
+        except DECODE_ERRORS:
+            value = raw
+        if key == 'name' and 'name' in current:
+            current = {}  # a new record started before the last one was complete
+        current[key] = value
+
+        # A record is complete once it has name, location and description
+        if all(field in current for field in ('name', 'location', 'description')):
+            current.setdefault('link', '')
+            opportunities.append(current)
+            current = {}
+
+    return opportunities
+
+
+def parse_opportunities(response: str) -> List[Dict]:
+    """
+    Extract the list of opportunities from a complete Claude response
+
+    Tries, in order:
+      1. the first balanced JSON block holding an "opportunities" list
+         (or a bare list of objects), ignoring any surrounding prose;
+      2. every complete opportunity object found inside arrays, which
+         recovers the finished entries of a truncated or broken response;
+      3. "field": "value" pairs, for output that is not JSON at all.
+
+    Args:
+        response: Claude's response text
+
+    Returns:
+        List of opportunity dictionaries (empty if nothing was found)
+    """
+    if not response:
+        return []
+
+    # Fast path: the JSON usually starts at the first bracket and is valid,
+    # so let the C decoder read it directly. Only one attempt is made, since
+    # retrying at every bracket would be quadratic on malformed input.
+    first = JSON_START_PATTERN.search(response)
+    if first is None:
+        return _parse_fields(response)
+    try:
+        value, _ = DECODER.raw_decode(response, first.start())
+    except DECODE_ERRORS:
+        pass
+    else:
+        opportunities = _opportunities_from_value(value)
+        if opportunities is not None:
+            return opportunities
+
+    for start, end in iter_json_spans(response):
+        try:
+            value = json.loads(response[start:end])
+        except DECODE_ERRORS:
+            continue
+        opportunities = _opportunities_from_value(value)
+        if opportunities is not None:
+            return opportunities
+
+    opportunities = OpportunityStreamParser().feed(response)
+    if opportunities:
+        return opportunities
+
+    return _parse_fields(response)
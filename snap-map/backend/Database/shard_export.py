@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Shard Export
+Publishes one small file per city plus a manifest, so the frontend fetches
+only the city it shows and each export rewrites only the cities that changed
+
+Shard files are named after a hash of their content (e.g.
+austin-tx.3f2a9c41d0be.csv), so they can be served with immutable caching;
+only manifest.json changes between exports. Its "hash" values double as ETags.
+
+Shards can be written as CSV, JSON, or the compact binary format of
+binary_format.py ('bin'), which also carries coordinates.
+"""
+
+import csv
+import hashlib
+import io
+import json
+import os
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+from binary_format import encode_records
+from database_manager import DatabaseManager, RECORD_COLUMNS, TAGS_SQL
+from export_utils import COMPRESSION_SUFFIXES, atomic_write, check_compression
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 2
+
+# Same columns and headers as DatabaseManager.export_to_csv (CSV and JSON
+# shards leave out the trailing coordinates, which only binary shards carry)
+SHARD_COLUMNS = RECORD_COLUMNS + ('city', 'state', 'zip_code', TAGS_SQL, 'latitude', 'longitude')
+SHARD_HEADER = ['ID', 'Name', 'Link', 'Location', 'Description', 'Created At', 'Updated At',
+                'City', 'State', 'ZIP', 'Tags']
+
+FORMATS = ('csv', 'json', 'bin')
+
+# What the map client loads: binary shards, with CSV for older clients
+CLIENT_FORMATS = ('csv', 'bin')
+
+# Hex digits of the content hash kept in shard file names
+NAME_HASH_LENGTH = 12
+
+
+def shard_slug(city_key: Optional[str], state: Optional[str]) -> str:
+    """File name stem for a city's shard, e.g. ('new york', 'NY') -> 'new-york-ny'"""
+    slug = (city_key or 'unknown').replace(' ', '-')
+    return f"{slug}-{state.lower()}" if state else slug
+
+
+def _render(rows, fmt: str, city: Optional[str], state: Optional[str]) -> bytes:
+    """Serialize one city's rows"""
+    if fmt == 'bin':
+        return encode_records(rows)
+
+    width = len(SHARD_HEADER)
+    if fmt == 'csv':
+        buffer = io.StringIO(newline='')
+        writer = csv.writer(buffer)
+        writer.writerow(SHARD_HEADER)
+        writer.writerows(row[:width] for row in rows)
+        return buffer.getvalue().encode('utf-8')
+
+    shard = {'city': city, 'state': state, 'columns': SHARD_HEADER, 'rows': [list(row[:width]) for row in rows]}
+    return json.dumps(shard, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _load_manifest(path: str) -> Dict:
+    """Previous manifest, or an empty one if missing or unreadable"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('version') == MANIFEST_VERSION:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {}
+
+
+def _manifest_files(manifest: Dict) -> set:
+    """Every shard file (and compressed sibling) a manifest references"""
+    files = set()
+    for entry in manifest.get('shards', {}).values():
+        for info in entry['files'].values():
+            files.add(info['path'])
+            files.update(info.get('compressed', []))
+    return files
+
+
+def export_city_shards(db: DatabaseManager, directory: str, formats: Iterable[str] = ('csv',),
+                       compress: Iterable[str] = (), full: bool = False) -> Dict:
+    """
+    Write per-city shard files and a manifest, regenerating only changed cities
+
+    A city is regenerated when its record count, ID sum or latest
+    updated_at differ from the previous manifest, or when it has records
+    updated at or after the previous export (timestamps only have
+    one-second resolution). A regenerated shard whose content hash is
+    unchanged keeps its existing file. Shards of cities that no longer
+    have records are deleted after the new manifest is in place.
+
+    Args:
+        db: Database to export
+        directory: Output directory (e.g. snap-map/public/shards)
+        formats: Shard formats to write: 'csv', 'json' and/or 'bin'
+        compress: Also write precompressed siblings, e.g. ('gzip',)
+        full: Regenerate every shard regardless of the previous manifest
+
+    Returns:
+        Summary with the manifest path, the number of cities, shard files
+        written, cities left unchanged and old files removed
+    """
+    formats = tuple(formats)
+    compress = tuple(check_compression(compress))
+    for fmt in formats:
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown shard format: {fmt}")
+
+    os.makedirs(directory, exist_ok=True)
+    manifest_path = os.path.join(directory, MANIFEST_NAME)
+    previous = _load_manifest(manifest_path)
+    previous_shards = {} if full else previous.get('shards', {})
+    watermark = previous.get('watermark')
+
+    # One grouped pass over the city index tells us which cities changed
+    with db.session():
+        db.cursor.execute('''
+            SELECT city_key, state, MIN(city), COUNT(*), TOTAL(id), MAX(updated_at)
+            FROM records
+            GROUP BY city_key, state
+        ''')
+        groups = db.cursor.fetchall()
+
+    shards = {}
+    written = unchanged = 0
+    select = ', '.join(SHARD_COLUMNS)
+
+    for city_key, state, city, count, id_total, last_updated in groups:
+        key = f"{city_key or ''}|{state or ''}"
+        signature = f"{count}:{int(id_total)}:{last_updated}"
+        old = previous_shards.get(key)
+
+        if (old is not None and old['signature'] == signature
+                and set(old['files']) == set(formats)
+                and not (watermark and last_updated and last_updated >= watermark)
+                and all(os.path.exists(os.path.join(directory, info['path']))
+                        for info in old['files'].values())):
+            shards[key] = old
+            unchanged += 1
+            continue
+
+        with db.session():
+            db.cursor.execute(f'''
+                SELECT {select} FROM records
+                WHERE city_key IS ? AND state IS ?
+                ORDER BY id
+            ''', (city_key, state))
+            rows = db.cursor.fetchall()
+
+        files = {}
+        written_before = written
+        for fmt in formats:
+            content = _render(rows, fmt, city, state)
+            digest = hashlib.sha256(content).hexdigest()
+            name = f"{shard_slug(city_key, state)}.{digest[:NAME_HASH_LENGTH]}.{fmt}"
+            path = os.path.join(directory, name)
+
+            # Same content hash means the same file name - nothing to rewrite
+            if not os.path.exists(path):
+                with atomic_write(path, 'wb', compress) as f:
+                    f.write(content)
+                written += 1
+
+            files[fmt] = {
+                'path': name,
+                'hash': f"sha256-{digest}",
+                'bytes': len(content),
+                'compressed': [name + COMPRESSION_SUFFIXES[method] for method in compress],
+            }
+
+        if written == written_before:
+            unchanged += 1
+        shards[key] = {
+            'city': city,
+            'city_key': city_key,
+            'state': state,
+            'records': count,
+            'signature': signature,
+            'files': files,
+        }
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'watermark': max((group[5] for group in groups if group[5]), default=None),
+        'columns': SHARD_HEADER,
+        'shards': shards,
+    }
+    with atomic_write(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+
+    # Old files are removed only once no manifest points at them
+    removed = 0
+    for name in _manifest_files(previous) - _manifest_files(manifest):
+        try:
+            os.remove(os.path.join(directory, name))
+            removed += 1
+        except FileNotFoundError:
+            pass
+
+    return {
+        'manifest': manifest_path,
+        'cities': len(shards),
+        'written': written,
+        'unchanged': unchanged,
+        'removed': removed,
+    }
+
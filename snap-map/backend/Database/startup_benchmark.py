@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Startup Benchmark
+Measures how long the backend's entry points take to start, using
+`python -X importtime` for per-module import costs, so slow imports and
+startup regressions are caught early
+
+Usage: python startup_benchmark.py [--runs N] [--top N] [--json] [--max-ms MS]
+
+With --max-ms, exits with status 1 if any entry point's median startup
+exceeds the limit (for use in CI or cron checks).
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Modules each command-line entry point imports at startup
+ENTRY_POINTS = (
+    "database_manager",
+    "db_utils",
+    "food_opportunities_finder",
+    "Auto_Opportunity",
+    "worker_service",
+    "batch_crawl",
+)
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """
+    Parse `-X importtime` output
+
+    Args:
+        stderr: Standard error of a python -X importtime run
+
+    Returns:
+        (module, self_us, cumulative_us) for every imported module
+    """
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+
+def measure_import(module: str) -> Tuple[float, List[Tuple[str, int, int]]]:
+    """
+    Import a module in a fresh interpreter
+
+    Returns:
+        (wall-clock milliseconds for the whole process, importtime rows)
+    """
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=HERE, capture_output=True, text=True
+    )
+    elapsed = (time.perf_counter() - start) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    return elapsed, parse_importtime(result.stderr)
+
+
+def measure_schema_setup(db_path: str, runs: int) -> Dict[str, float]:
+    """
+    Time create_database() on a new file and on an already initialized one
+
+    Returns:
+        {'first_ms': ..., 'repeat_ms': median of the repeat runs}
+    """
+    from database_manager import DatabaseManager
+
+    timings = []
+    for _ in range(runs + 1):
+        db = DatabaseManager(db_path)
+        start = time.perf_counter()
+        db.create_database()
+        timings.append((time.perf_counter() - start) * 1000)
+        db.close()
+    return {'first_ms': round(timings[0], 2), 'repeat_ms': round(statistics.median(timings[1:]), 2)}
+
+
+def main():
+    """Run the benchmark and print (or dump as JSON) the results"""
+    args = sys.argv[1:]
+    try:
+        runs = int(args[args.index("--runs") + 1]) if "--runs" in args else 5
+        top = int(args[args.index("--top") + 1]) if "--top" in args else 8
+        max_ms = float(args[args.index("--max-ms") + 1]) if "--max-ms" in args else None
+    except (IndexError, ValueError):
+        print(__doc__)
+        return
+    as_json = "--json" in args
+
+    report = {'python': sys.version.split()[0], 'runs': runs, 'entry_points': {}}
+
+    for module in ENTRY_POINTS:
+        walls = []
+        for _ in range(runs):
+            wall, modules = measure_import(module)
+            walls.append(wall)
+        # Slowest imports by self time (from the last run)
+        slowest = sorted(modules, key=lambda row: row[1], reverse=True)[:top]
+        report['entry_points'][module] = {
+            'median_ms': round(statistics.median(walls), 1),
+            'max_ms': round(max(walls), 1),
+            'import_ms': round(next((row[2] for row in modules if row[0] == module), 0) / 1000, 1),
+            'slowest_imports': [{'module': name, 'self_ms': round(self_us / 1000, 2)}
+                                for name, self_us, _ in slowest],
+        }
+
+    with tempfile.TemporaryDirectory() as directory:
+        sys.path.insert(0, HERE)
+        report['schema_setup'] = measure_schema_setup(os.path.join(directory, "bench.db"), runs)
+
+    too_slow = [module for module, result in report['entry_points'].items()
+                if max_ms is not None and result['median_ms'] > max_ms]
+
+    if as_json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"\nStartup times (python {report['python']}, median of {runs} runs)")
+        print("=" * 60)
+        print(f"{'Entry point':<28} {'process ms':>11} {'import ms':>10} {'max ms':>8}")
+        print("-" * 60)
+        for module, result in report['entry_points'].items():
+            print(f"{module:<28} {result['median_ms']:>11.1f} {result['import_ms']:>10.1f} "
+                  f"{result['max_ms']:>8.1f}")
+
+        for module, result in report['entry_points'].items():
+            print(f"\nSlowest imports for {module}:")
+            for row in result['slowest_imports']:
+                print(f"  {row['self_ms']:>8.2f} ms  {row['module']}")
+
+        schema = report['schema_setup']
+        print(f"\ncreate_database(): {schema['first_ms']:.2f} ms on a new file, "
+              f"{schema['repeat_ms']:.2f} ms when already initialized")
+
+    if too_slow:
+        print(f"\n❌ Startup over {max_ms:g} ms: {', '.join(too_slow)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Restoring CSV exports with DatabaseManager.import_from_csv"""
+
+from database_manager import DatabaseManager
+
+
+def make_db(path):
+    db = DatabaseManager(str(path), instrument=False)
+    db.create_database()
+    return db
+
+
+def test_restore_with_preserved_ids_into_populated_database(tmp_path):
+    source = make_db(tmp_path / "source.db")
+    source.add_records_many([(f"Pantry {i}", f"https://example.org/{i}", f"{i} Main St, Pittsburgh, PA", "new")
+                             for i in range(5)])
+    export = str(tmp_path / "export.csv")
+    source.export_to_csv(export)
+
+    # The same places stored under other IDs (1-5 are free), plus an unrelated record
+    target = make_db(tmp_path / "target.db")
+    target.add_records_many([(f"Filler {i}", "", f"{i} Elm St, Erie, PA", "") for i in range(5)] +
+                            [(f"Pantry {i}", "", f"{i} Main St, Pittsburgh, PA", "old") for i in range(5)] +
+                            [("Unrelated Kitchen", "", "7 Oak St, Erie, PA", "")])
+    target.delete_records(range(1, 6))
+
+    assert target.import_from_csv(export, preserve_ids=True, preserve_timestamps=True) == 5
+
+    restored = {record[0]: record for record in target.get_all_records()}
+    expected = {record[0]: record for record in source.get_all_records()}
+    for record_id, record in expected.items():
+        assert restored[record_id] == record
+    # The stale copies under other IDs are gone; the unrelated record is kept
+    assert sorted(restored) == sorted(expected) + [11]
+    assert restored[11][1] == "Unrelated Kitchen"
+    assert target.verify_stats() == []
+
+
+def test_restore_never_overwrites_an_unrelated_record_with_the_same_id(tmp_path, capsys):
+    source = make_db(tmp_path / "source.db")
+    source.add_records_many([("Pantry 0", "https://example.org/0", "0 Main St, Pittsburgh, PA", "new"),
+                             ("Pantry 1", "https://example.org/1", "1 Main St, Pittsburgh, PA", "new")])
+    export = str(tmp_path / "export.csv")
+    source.export_to_csv(export)
+
+    # IDs 1 and 2 hold different records; Pantry 1 is already stored, under ID 3
+    target = make_db(tmp_path / "target.db")
+    target.add_records_many([("Placeholder", "", "9 Elm St, Erie, PA", ""),
+                             ("Unrelated Kitchen", "", "7 Oak St, Erie, PA", ""),
+                             ("Pantry 1", "", "1 Main St, Pittsburgh, PA", "old")])
+
+    assert target.import_from_csv(export, preserve_ids=True) == 2
+    assert "2 records were imported under other IDs" in capsys.readouterr().out
+
+    records = {record[1]: record for record in target.get_all_records()}
+    assert sorted(records) == ["Pantry 0", "Pantry 1", "Placeholder", "Unrelated Kitchen"]
+    assert records["Placeholder"][0] == 1
+    assert records["Unrelated Kitchen"][0] == 2
+    # Pantry 0 got a new ID; Pantry 1's stored copy was updated where it is
+    assert records["Pantry 0"][0] > 3
+    assert records["Pantry 1"][0] == 3
+    assert records["Pantry 0"][4] == records["Pantry 1"][4] == "new"
+    assert target.verify_stats() == []
+
+
+def test_restore_twice_is_idempotent(tmp_path):
+    source = make_db(tmp_path / "source.db")
+    source.add_records_many([(f"Pantry {i}", "", f"{i} Main St, Pittsburgh, PA", "") for i in range(3)])
+    export = str(tmp_path / "export.csv")
+    source.export_to_csv(export)
+
+    target = make_db(tmp_path / "target.db")
+    assert target.import_from_csv(export, preserve_ids=True) == 3
+    assert target.import_from_csv(export, preserve_ids=True) == 3
+    assert sorted(record[0] for record in target.get_all_records()) == [1, 2, 3]
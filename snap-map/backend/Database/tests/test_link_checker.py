@@ -0,0 +1,182 @@
+"""LinkChecker against a local HTTP server, and the results it stores in the database"""
+
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import link_checker
+from database_manager import DatabaseManager
+from link_checker import BROKEN, INVALID, OK, THROTTLED, UNREACHABLE, LinkChecker
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Answers by path; keeps connections alive and logs every request it receives"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self):
+        self.respond(send_body=False)
+
+    def do_GET(self):
+        self.respond(send_body=True)
+
+    def respond(self, send_body: bool):
+        self.server.log.append((time.monotonic(), self.command, self.path, self.client_address))
+        path = self.path.split("?")[0]
+        headers = {}
+        if path == "/ok":
+            status = 200
+        elif path == "/missing":
+            status = 404
+        elif path == "/no-head":
+            status = 405 if self.command == "HEAD" else 200
+        elif path == "/redirect":
+            status = 302
+            headers["Location"] = "/ok"
+        elif path == "/throttle":
+            status = 429
+            headers["Retry-After"] = "0"
+        else:
+            status = 500
+        body = b"checked"
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.daemon_threads = True
+    httpd.log = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def refused_url():
+    # A port that was just free: nothing listens there, so connecting is refused
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    return f"http://127.0.0.1:{port}/ok"
+
+
+def test_requests_to_one_host_are_rate_limited(server):
+    links = [f"{server.url}/ok?n={n}" for n in range(6)]
+    with LinkChecker(workers=4, rate=10, per_host=2, timeout=5) as checker:
+        results = list(checker.check_many(links))
+
+    assert sorted(result[0] for result in results) == sorted(links)
+    assert all(result[1] == OK for result in results)
+    arrivals = sorted(entry[0] for entry in server.log)
+    assert len(arrivals) == len(links)
+    # 10 per second: request starts are 0.1 s apart (less a little arrival jitter)
+    gaps = [later - earlier for earlier, later in zip(arrivals, arrivals[1:])]
+    assert min(gaps) >= 0.08
+    assert arrivals[-1] - arrivals[0] >= 0.45
+
+
+def test_other_hosts_are_not_held_up_by_a_limited_one(server, refused_url):
+    slow = [f"{server.url}/ok?n={n}" for n in range(4)]
+    with LinkChecker(workers=4, rate=2, timeout=5) as checker:
+        start = time.monotonic()
+        order = [(result[0], time.monotonic() - start) for result in checker.check_many(slow + [refused_url])]
+
+    # The other host's link finishes while the limited host is still waiting for its slots
+    finished_at = dict(order)
+    assert finished_at[refused_url] < 0.5
+    assert max(finished_at[link] for link in slow) >= 1.4
+
+
+def test_keep_alive_connections_are_reused(server):
+    links = [f"{server.url}/ok?n={n}" for n in range(10)]
+    with LinkChecker(workers=1, rate=None, timeout=5) as checker:
+        results = list(checker.check_many(links))
+
+    assert [result[1] for result in results] == [OK] * len(links)
+    assert checker.requests_sent == len(links)
+    assert checker.connections_opened == 1
+    # The server saw every request arrive from the same client socket
+    assert len({entry[3] for entry in server.log}) == 1
+
+
+def test_links_are_classified(server, refused_url):
+    links = {
+        "ok": f"{server.url}/ok",
+        "missing": f"{server.url}/missing",
+        "no_head": f"{server.url}/no-head",
+        "redirect": f"{server.url}/redirect",
+        "throttled": f"{server.url}/throttle",
+        "refused": refused_url,
+        "mailto": "mailto:pantry@example.org",
+    }
+    with LinkChecker(workers=4, rate=None, timeout=5) as checker:
+        results = {result[0]: result for result in checker.check_many(links.values())}
+
+    assert results[links["ok"]][1:3] == (OK, 200)
+    # A 404 on HEAD is retried with GET before the link counts as broken
+    assert results[links["missing"]][1:3] == (BROKEN, 404)
+    assert [entry[1] for entry in server.log if entry[2] == "/missing"] == ["HEAD", "GET"]
+    # Servers that refuse HEAD are fine if GET works
+    assert results[links["no_head"]][1:3] == (OK, 200)
+    redirect = results[links["redirect"]]
+    assert redirect[1:3] == (OK, 200)
+    assert redirect[3] == f"{server.url}/ok"
+    assert results[links["throttled"]][1:3] == (THROTTLED, 429)
+    refused = results[links["refused"]]
+    assert refused[1:3] == (UNREACHABLE, None)
+    assert "ConnectionRefusedError" in refused[4]
+    assert results[links["mailto"]][1:3] == (INVALID, None)
+
+
+def test_results_are_cached_in_the_database(server, refused_url, tmp_path):
+    db = DatabaseManager(str(tmp_path / "links.db"), instrument=False)
+    db.create_database()
+    db.add_records_many([
+        ("Pantry A", f"{server.url}/ok", "1 Main St, Pittsburgh, PA", ""),
+        ("Pantry B", f"{server.url}/missing", "2 Main St, Pittsburgh, PA", ""),
+        ("Pantry C", f"{server.url}/throttle", "3 Main St, Pittsburgh, PA", ""),
+        ("Pantry D", refused_url, "4 Main St, Pittsburgh, PA", ""),
+        # Shares a link with Pantry A, so it is checked once
+        ("Pantry E", f"{server.url}/ok", "5 Main St, Pittsburgh, PA", ""),
+    ])
+
+    summary = link_checker.check_database_links(db, rate=None, timeout=5, progress=False)
+    assert summary['checked'] == 4
+    assert (summary[OK], summary[BROKEN], summary[THROTTLED], summary[UNREACHABLE]) == (1, 1, 1, 1)
+
+    # Fresh results are reused; only the throttled link is due again
+    assert db.links_to_check(link_checker.DEFAULT_MAX_AGE) == [f"{server.url}/throttle"]
+    requests_before = len(server.log)
+    summary = link_checker.check_database_links(db, rate=None, timeout=5, progress=False)
+    assert summary['checked'] == 1
+    assert len(server.log) == requests_before + 1
+
+    # Once they go stale every link is due
+    assert len(db.links_to_check(0)) == 4
+    problems = {row[2]: row for row in db.get_link_problems()}
+    assert set(problems) == {f"{server.url}/missing", refused_url}
+
+
+def test_at_least_one_worker_is_required(tmp_path):
+    with pytest.raises(ValueError):
+        LinkChecker(workers=0)
+    db = DatabaseManager(str(tmp_path / "links.db"), instrument=False)
+    db.create_database()
+    with pytest.raises(ValueError):
+        link_checker.check_database_links(db, workers=0, progress=False)
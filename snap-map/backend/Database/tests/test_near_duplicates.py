@@ -0,0 +1,78 @@
+"""Near-duplicate grouping (near_duplicates.py) on dedupe keys"""
+
+import pytest
+
+import near_duplicates
+from database_manager import DatabaseManager, city_key, dedupe_key
+from near_duplicates import NearDuplicateIndex, address_anchor, find_near_duplicates
+
+NEAR_MISSES = [
+    # Same name and street, different street number
+    (("The Salvation Army", "123 Main St, Pittsburgh, PA 15219"),
+     ("The Salvation Army", "456 Main St, Pittsburgh, PA 15219")),
+    # Similar names on the same street, different street number
+    (("St Mary Food Pantry", "200 Oak Ave, Pittsburgh, PA 15213"),
+     ("St Paul Food Pantry", "210 Oak Ave, Pittsburgh, PA 15213")),
+]
+
+
+def keyed(*records):
+    return [(record_id, dedupe_key(name, location)) for record_id, (name, location) in enumerate(records, 1)]
+
+
+def test_address_anchor():
+    assert address_anchor(dedupe_key("A", "123 Main St, Pittsburgh, PA 15219")) == ("123", "15219")
+    assert address_anchor(dedupe_key("A", "456 Main St, Pittsburgh, PA 15219-1234")) == ("456", "15219")
+    assert address_anchor(dedupe_key("A", "Downtown Pittsburgh, PA")) == ("|downtown pittsburgh pa", None)
+
+
+def test_different_street_numbers_are_not_near_duplicates():
+    for first, second in NEAR_MISSES:
+        assert find_near_duplicates(keyed(first, second)) == []
+
+        index = NearDuplicateIndex()
+        index.add(1, dedupe_key(*first))
+        assert index.matches(dedupe_key(*second)) == []
+
+
+# Small anchor groups are compared pair by pair; 0 forces LSH banding
+@pytest.mark.parametrize("pairs_per_record", [near_duplicates.MAX_PAIRS_PER_RECORD, 0])
+def test_reworded_copies_are_grouped(monkeypatch, pairs_per_record):
+    monkeypatch.setattr(near_duplicates, "MAX_PAIRS_PER_RECORD", pairs_per_record)
+    records = keyed(("Greater Pittsburgh Community Food Bank", "1 N Linden St, Duquesne, PA 15110"),
+                    ("Greater Pittsburgh Food Bank", "1 North Linden Street, Duquesne, PA 15110"),
+                    ("Greater Pittsburgh Community Food Bank", "1 N Linden St, Duquesne, PA"))
+    assert find_near_duplicates(records) == [[1, 2, 3]]
+
+    index = NearDuplicateIndex()
+    index.add(1, records[0][1])
+    assert [record_id for record_id, _ in index.matches(records[1][1])] == [1]
+
+
+def test_groups_never_mix_zip_codes():
+    # Each record is close to the one without a ZIP, but the ZIPs conflict
+    records = keyed(("Just Harvest", "16 Terminal Way, Pittsburgh, PA 15219"),
+                    ("Just Harvest", "16 Terminal Way, Pittsburgh, PA"),
+                    ("Just Harvest Inc", "16 Terminal Way, Pittsburgh, PA 15203"))
+    groups = find_near_duplicates(records)
+    assert len(groups) == 1 and len(groups[0]) == 2
+    assert find_near_duplicates([records[0], records[2]]) == []
+
+
+def test_city_index_is_kept_between_checks(tmp_path):
+    db = DatabaseManager(str(tmp_path / "records.db"), instrument=False)
+    db.create_database()
+    db.add_records_many([("Greater Pittsburgh Community Food Bank", "", "1 N Linden St, Duquesne, PA 15110", "")],
+                        city="Duquesne")
+    first = ("Greater Pittsburgh Food Bank", "", "1 North Linden Street, Duquesne, PA 15110", "")
+    second = ("Greater Pittsburgh Food Bank Inc", "", "1 North Linden Street, Duquesne, PA 15110", "")
+
+    indexes = {}
+    assert [match[1] for match in db.near_duplicates_of([first], city="Duquesne", indexes=indexes)] == [1]
+    index = indexes[city_key("Duquesne")]
+    db.index_saved_records(indexes, db.add_records_many([first], city="Duquesne"))
+
+    # The loaded index is reused, and it has the record saved since
+    matches = db.near_duplicates_of([second], city="Duquesne", indexes=indexes)
+    assert indexes[city_key("Duquesne")] is index and len(index) == 2
+    assert matches[0][1] == 2
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Worker Service
+Long-running process that keeps a FoodOpportunitiesFinder warm and handles
+city lookups sent as JSON lines on stdin, replying with JSON lines on stdout
+
+Requests and their responses (one JSON object per line):
+  {"id": "1", "city": "Austin", "count": 10, "no_cache": false}
+      -> {"id": "1", "job_id": "...", "ok": true, "output": "...", "elapsed_ms": 812.4}
+         (sent once the lookup finishes; on failure ok is false and "error" is set)
+  {"id": "2", "op": "submit", "city": "Austin"}
+      -> {"id": "2", "ok": true, "job_id": "...", "status": "queued", "coalesced": false}
+  {"id": "3", "op": "status", "job_id": "..."}
+      -> {"id": "3", "ok": true, "job": {"id": "...", "status": "done", ...}}
+  {"id": "4", "op": "metrics", "format": "prometheus"}
+      -> {"id": "4", "ok": true, "metrics": "..."}
+         (database operation timings; "format" may also be "json")
+
+Concurrent requests for the same city share one job (and one Claude call).
+
+With --shards DIR, the per-city shard files (see shard_export.py) are
+refreshed after every successful lookup.
+
+With --snapshot PATH, a read-only copy of the database is published there
+after every successful lookup (see DatabaseManager.publish_snapshot), and
+shards are exported from it instead of the live database.
+
+Jobs are kept in --jobs PATH (default: $SNAPMAP_JOBS_DB, or
+my_records.jobs.db beside the database).
+
+Usage: python worker_service.py [--workers N] [--queue N] [--db PATH] [--shards DIR]
+                                [--snapshot PATH] [--jobs PATH]
+"""
+
+import io
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Dict
+
+import db_metrics
+from food_opportunities_finder import FoodOpportunitiesFinder
+from jobs import JobStore, jobs_path_for
+from shard_export import CLIENT_FORMATS, export_city_shards
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "my_records.db")
+
+
+class ThreadOutput(io.TextIOBase):
+    """
+    Stand-in for sys.stdout that gives each worker thread its own buffer
+
+    The finder reports progress with print(); while a job runs, its output
+    is collected here so it can be returned with that job's response. Output
+    from any other thread goes to the fallback stream.
+    """
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+        self._local = threading.local()
+
+    def start_capture(self):
+        """Begin collecting this thread's output"""
+        self._local.buffer = io.StringIO()
+
+    def stop_capture(self) -> str:
+        """Stop collecting and return what this thread printed"""
+        buffer = getattr(self._local, 'buffer', None)
+        self._local.buffer = None
+        return buffer.getvalue() if buffer is not None else ""
+
+    def write(self, text):
+        buffer = getattr(self._local, 'buffer', None)
+        return (buffer if buffer is not None else self.fallback).write(text)
+
+    def flush(self):
+        self.fallback.flush()
+
+
+class WorkerService:
+    """Runs lookup jobs on a fixed pool of threads sharing one finder"""
+
+    def __init__(self, finder: FoodOpportunitiesFinder, protocol_out, workers: int = 2,
+                 max_queue: int = 32, jobs: JobStore = None, shards_dir: str = None):
+        """
+        Initialize the service
+
+        Args:
+            finder: Finder shared by all workers (its API client and caches stay warm)
+            protocol_out: Stream responses are written to, one JSON object per line
+            workers: Number of lookups processed at the same time
+            max_queue: Number of waiting jobs accepted before new ones are rejected
+            jobs: Job table (defaults to the jobs file beside the finder's database)
+            shards_dir: Directory of per-city shards to refresh after each successful job
+        """
+        self.finder = finder
+        self.protocol_out = protocol_out
+        self.workers = workers
+        self.store = jobs or JobStore(jobs_path_for(finder.db.db_path))
+        self.queue = queue.Queue(maxsize=max_queue)
+        self._write_lock = threading.Lock()
+        self._jobs_lock = threading.Lock()
+        self._waiters = {}  # job id -> ids of "run" requests waiting for it
+        self.shards_dir = shards_dir
+        self._export_lock = threading.Lock()
+        self._snapshot_db = None
+        self._threads = []
+
+    def start(self):
+        """Requeue interrupted jobs, then start the worker threads"""
+        for job in self.store.recover():
+            self._enqueue(job)
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"worker-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """Finish queued jobs, then stop the worker threads"""
+        for _ in self._threads:
+            self.queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def handle(self, request: Dict):
+        """
+        Dispatch one request
+
+        "run" (the default) replies when the lookup finishes, "submit"
+        replies at once with the job ID, "status" reports on a job and
+        "metrics" returns the database operation metrics.
+        Run and submit requests for a city that already has a queued or
+        running job share that job.
+
+        Args:
+            request: Decoded request object
+        """
+        if not isinstance(request, dict):
+            self.respond({"id": None, "ok": False, "error": "Request must be a JSON object"})
+            return
+
+        request_id = request.get('id')
+        op = request.get('op', 'run')
+
+        if op == 'status':
+            job = self.store.get(str(request.get('job_id')))
+            if job is None:
+                self.respond({"id": request_id, "ok": False, "error": "Unknown job"})
+            else:
+                self.respond({"id": request_id, "ok": True, "job": _public_job(job)})
+            return
+
+        if op == 'metrics':
+            self.respond({"id": request_id, "ok": True, "metrics": self.metrics(request.get('format'))})
+            return
+
+        if op not in ('run', 'submit'):
+            self.respond({"id": request_id, "ok": False, "error": f"Unknown op: {op}"})
+            return
+
+        city = str(request.get('city') or '').strip()
+        if not city:
+            self.respond({"id": request_id, "ok": False, "error": "Request needs a city"})
+            return
+
+        with self._jobs_lock:
+            try:
+                job, created = self.store.submit(city, request.get('count') or 10)
+            except ValueError as e:
+                self.respond({"id": request_id, "ok": False, "error": str(e)})
+                return
+            if created and not self._enqueue(job, no_cache=bool(request.get('no_cache'))):
+                self.respond({"id": request_id, "ok": False, "job_id": job['id'],
+                              "error": "Server busy, try again later"})
+                return
+            if op == 'run':
+                self._waiters.setdefault(job['id'], []).append(request_id)
+                return
+
+        self.respond({"id": request_id, "ok": True, "job_id": job['id'],
+                      "status": job['status'], "coalesced": not created})
+
+    def respond(self, response: Dict):
+        """Write one response line"""
+        line = json.dumps(response)
+        with self._write_lock:
+            self.protocol_out.write(line + "\n")
+            self.protocol_out.flush()
+
+    def _enqueue(self, job: Dict, no_cache: bool = False) -> bool:
+        """Hand a job to the workers; fails it if the queue is full"""
+        try:
+            self.queue.put_nowait((job, no_cache))
+            return True
+        except queue.Full:
+            self.store.fail(job['id'], "Server busy")
+            return False
+
+    def _work(self):
+        """Worker thread loop"""
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            job, no_cache = item
+            self.store.mark_running(job['id'])
+            result = self.run(job['city'], job['num_opportunities'], no_cache)
+            if result['ok'] and self.shards_dir:
+                self._export_shards()
+
+            # Record the outcome and collect waiters together, so a request
+            # arriving now either joins before this point or starts a new job
+            with self._jobs_lock:
+                self.store.finish(job['id'], result['ok'], result['output'], result.get('error'))
+                waiters = self._waiters.pop(job['id'], [])
+            for request_id in waiters:
+                self.respond({"id": request_id, "job_id": job['id'], **result})
+            self._flush_metrics()
+
+    def _reader(self):
+        """Database to export from: the published snapshot if there is one"""
+        if not self.finder.db.snapshot_path:
+            return self.finder.db
+        if self._snapshot_db is None:
+            try:
+                self._snapshot_db = self.finder.db.open_snapshot()
+            except FileNotFoundError:
+                return self.finder.db
+        return self._snapshot_db
+
+    def _flush_metrics(self):
+        """Store the database timings collected so far in $SNAPMAP_METRICS_DB, if set"""
+        try:
+            self.finder.db.flush_metrics()
+        except Exception as e:
+            print(f"❌ Error saving metrics: {e}")
+
+    def metrics(self, fmt: str = None):
+        """
+        Database operation metrics of this process plus those stored by others
+
+        Args:
+            fmt: "prometheus" for the text exposition format, otherwise JSON
+
+        Returns:
+            Prometheus text, or the summary as a dictionary
+        """
+        snapshot = self.finder.db.metrics_snapshot()
+        if fmt == 'prometheus':
+            return db_metrics.to_prometheus(snapshot)
+        return db_metrics.summarize(snapshot)
+
+    def _export_shards(self):
+        """Rewrite the shards of cities that changed (one export at a time)"""
+        try:
+            with self._export_lock:
+                export_city_shards(self._reader(), self.shards_dir, CLIENT_FORMATS)
+        except Exception as e:
+            print(f"❌ Error exporting shards: {e}")
+
+    def run(self, city: str, count: int = 10, no_cache: bool = False) -> Dict:
+        """
+        Handle one lookup
+
+        Args:
+            city: City to look up
+            count: Number of opportunities to request
+            no_cache: Skip the cached Claude response
+
+        Returns:
+            Result with ok, output, elapsed_ms and (on failure) error
+        """
+        use_cache = False if no_cache else None
+        capture = sys.stdout if isinstance(sys.stdout, ThreadOutput) else None
+
+        start = time.perf_counter()
+        if capture:
+            capture.start_capture()
+        try:
+            ok = self.finder.find_and_save_food_opportunities(city, count, use_cache, stream=True)
+            error = None
+        except Exception as e:
+            ok, error = False, str(e)
+        finally:
+            output = capture.stop_capture() if capture else ""
+
+        result = {
+            "ok": ok,
+            "output": output,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+        }
+        if not ok:
+            result["error"] = error or f"No opportunities found for {city}"
+        return result
+
+
+def _public_job(job: Dict) -> Dict:
+    """Job fields reported to clients"""
+    return {key: value for key, value in job.items() if key != 'city_key'}
+
+
+def main():
+    """Read requests from stdin until it closes"""
+    args = sys.argv[1:]
+    try:
+        workers = int(args[args.index("--workers") + 1]) if "--workers" in args else 2
+        max_queue = int(args[args.index("--queue") + 1]) if "--queue" in args else 32
+        db_path = args[args.index("--db") + 1] if "--db" in args else DEFAULT_DB_PATH
+        shards_dir = args[args.index("--shards") + 1] if "--shards" in args else None
+        snapshot_path = args[args.index("--snapshot") + 1] if "--snapshot" in args else None
+        jobs_path = args[args.index("--jobs") + 1] if "--jobs" in args else jobs_path_for(db_path)
+    except (IndexError, ValueError):
+        print(__doc__, file=sys.stderr)
+        sys.exit(1)
+
+    # stdout carries the protocol only; everything printed goes to the job's
+    # captured output, or to stderr outside of a job
+    protocol_out = sys.stdout
+    sys.stdout = ThreadOutput(sys.stderr)
+
+    finder = FoodOpportunitiesFinder(db_path=db_path, snapshot_path=snapshot_path)
+    service = WorkerService(finder, protocol_out, workers, max_queue, jobs=JobStore(jobs_path),
+                            shards_dir=shards_dir)
+    service.store.prune()
+    service.start()
+    service.respond({"id": None, "ok": True, "ready": True, "workers": workers})
+
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError as e:
+            service.respond({"id": None, "ok": False, "error": f"Invalid JSON: {e}"})
+            continue
+        service.handle(request)
+
+    service.stop()
+
+
+if __name__ == "__main__":
+    main()
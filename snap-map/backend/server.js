@@ -1,29 +1,171 @@
 import express from "express";
 import cors from "cors";
-import { exec } from "child_process";
+import { spawn } from "child_process";
+import readline from "readline";
 import path from "path";
 
 const app = express();
 app.use(cors());
 app.use(express.json());
 
-// Proper route to run Python script
-app.post("/run-script", (req, res) => {
-    const { city } = req.body; // <-- Get city from request
-    const scriptPath = path.join("Database", "Auto_Opportunity.py");
-
-    console.log(`Running script for city: ${city}`);
-    // Pass city as an argument to Python
-    exec(`python "${scriptPath}" "${city}"`, (error, stdout, stderr) => {
-        if (error) {
-            console.error("Error running script:", error.message);
-            return res.status(500).json({ error: error.message });
+// One long-lived Python process handles every lookup, so requests don't pay
+// interpreter startup, imports and DB setup, and at most WORKERS run at once
+const WORKERS = Number(process.env.WORKERS || 2);
+const REQUEST_TIMEOUT_MS = 5 * 60 * 1000;
+const workerPath = path.join("Database", "worker_service.py");
+// Per-city shards the frontend loads (refreshed after every lookup)
+const shardsDir = path.join("..", "public", "shards");
+// Read-only copy of the database republished after every lookup; readers
+// such as the chatbot's dbQueries.js open it instead of the live file
+const snapshotPath = process.env.DB_SNAPSHOT_PATH || path.join("Database", "my_records.snapshot.db");
+
+const RESTART_DELAY_MS = 1000;
+
+let worker = null; // the live worker process, null while it is down or restarting
+let nextId = 1;
+const pending = new Map(); // request id -> { resolve, reject, timer }
+
+function unavailable(message) {
+    const error = new Error(message);
+    error.status = 503;
+    return error;
+}
+
+// Fail every request still waiting on the worker
+function rejectPending(reason) {
+    for (const request of pending.values()) {
+        clearTimeout(request.timer);
+        request.reject(unavailable(reason));
+    }
+    pending.clear();
+}
+
+function startWorker() {
+    const args = [workerPath, "--workers", String(WORKERS), "--shards", shardsDir, "--snapshot", snapshotPath];
+    const child = spawn("python", args, {
+        stdio: ["pipe", "pipe", "inherit"],
+    });
+    worker = child;
+
+    // A failed spawn emits "error" (maybe without "exit") and a dying worker
+    // emits "exit" (maybe after "error"), so only the first one restarts it
+    const workerGone = (reason) => {
+        if (worker !== child) return;
+        worker = null;
+        console.error(`${reason}, restarting`);
+        rejectPending("Python worker exited");
+        setTimeout(startWorker, RESTART_DELAY_MS);
+    };
+
+    child.on("error", (error) => workerGone(`Python worker failed: ${error.message}`));
+    child.on("exit", (code) => workerGone(`Python worker exited (code ${code})`));
+    // EPIPE while the worker dies; its requests are rejected by workerGone
+    child.stdin.on("error", (error) => console.error("Python worker stdin:", error.message));
+
+    readline.createInterface({ input: child.stdout }).on("line", (line) => {
+        let message;
+        try {
+            message = JSON.parse(line);
+        } catch {
+            console.error("Unexpected worker output:", line);
+            return;
         }
-        if (stderr) console.error("Script stderr:", stderr);
+        if (message.ready) {
+            console.log(`Python worker ready (${message.workers} workers)`);
+            return;
+        }
+        const request = pending.get(message.id);
+        if (!request) return;
+        pending.delete(message.id);
+        clearTimeout(request.timer);
+        request.resolve(message);
+    });
+}
 
-        console.log("Python stdout:", stdout);
-        res.json({ output: stdout });
+// Send a request to the worker and resolve with its response
+function sendToWorker(message) {
+    return new Promise((resolve, reject) => {
+        if (!worker || !worker.stdin.writable) {
+            reject(unavailable("Python worker is not running, try again shortly"));
+            return;
+        }
+        const id = String(nextId++);
+        const timer = setTimeout(() => {
+            pending.delete(id);
+            reject(new Error("Lookup timed out"));
+        }, REQUEST_TIMEOUT_MS);
+        pending.set(id, { resolve, reject, timer });
+        worker.stdin.write(JSON.stringify({ ...message, id }) + "\n", (error) => {
+            if (error && pending.delete(id)) {
+                clearTimeout(timer);
+                reject(unavailable(`Could not reach Python worker: ${error.message}`));
+            }
+        });
     });
+}
+
+// City named in a lookup request, or null when it is missing or blank
+function requestedCity(req) {
+    const city = req.body?.city;
+    return typeof city === "string" && city.trim() ? city.trim() : null;
+}
+
+function errorStatus(result) {
+    return result.error?.startsWith("Server busy") ? 503 : 500;
+}
+
+// Proper route to run Python script
+app.post("/run-script", async (req, res) => {
+    const city = requestedCity(req); // <-- Get city from request
+    if (!city) return res.status(400).json({ error: "Request needs a city" });
+
+    console.log(`Running lookup for city: ${city}`);
+    try {
+        // Requests for a city that is already being looked up share that lookup
+        const result = await sendToWorker({ op: "run", city });
+        console.log("Python stdout:", result.output);
+        if (!result.ok) {
+            return res.status(errorStatus(result)).json({ error: result.error, output: result.output });
+        }
+        res.json({ output: result.output });
+    } catch (error) {
+        console.error("Error running lookup:", error.message);
+        res.status(error.status || 500).json({ error: error.message });
+    }
+});
+
+// Queue a lookup without waiting for it; poll GET /jobs/:id for the result
+app.post("/jobs", async (req, res) => {
+    const city = requestedCity(req);
+    if (!city) return res.status(400).json({ error: "Request needs a city" });
+    try {
+        const result = await sendToWorker({ op: "submit", city });
+        if (!result.ok) return res.status(errorStatus(result)).json({ error: result.error });
+        res.status(202).json({ jobId: result.job_id, status: result.status, coalesced: result.coalesced });
+    } catch (error) {
+        res.status(error.status || 500).json({ error: error.message });
+    }
+});
+
+app.get("/jobs/:id", async (req, res) => {
+    try {
+        const result = await sendToWorker({ op: "status", job_id: req.params.id });
+        if (!result.ok) return res.status(404).json({ error: result.error });
+        res.json(result.job);
+    } catch (error) {
+        res.status(error.status || 500).json({ error: error.message });
+    }
+});
+
+// Database operation timings and counters, for Prometheus to scrape
+app.get("/metrics", async (req, res) => {
+    try {
+        const result = await sendToWorker({ op: "metrics", format: "prometheus" });
+        res.type("text/plain; version=0.0.4").send(result.metrics);
+    } catch (error) {
+        res.status(error.status || 500).json({ error: error.message });
+    }
 });
 
+startWorker();
 app.listen(3002, () => console.log("Backend running on http://localhost:3002"));
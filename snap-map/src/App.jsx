@@ -2,6 +2,7 @@ import React, { useState, useEffect, useRef } from 'react';
 import Papa from 'papaparse'; // Import papaparse
 import axios from "axios";
 import ReactMarkdown from 'react-markdown';
+import { decodeRecords } from './snapBinary';
 import './App.css';
 
 // --- Data (Constants) ---
@@ -28,8 +29,24 @@ const runPythonScript = (city) => {
         });
 };
 
+// --- Normalized city name, matching city_key in the Python backend ---
+const cityKey = (city) => (city || '')
+    .normalize('NFKD')
+    .replace(/[\u0300-\u036f]/g, '')
+    .toLowerCase()
+    .replace(/[^\p{L}\p{N}\s]|_/gu, ' ')
+    .trim()
+    .split(/\s+/)
+    .join(' ');
+
 // --- Helper function to infer tags from CSV data ---
 const getTagsFromData = (item) => {
+    // Exports from the backend carry precomputed tags
+    if (item.Tags) {
+        return item.Tags.split(' ').filter(tag => tagStyles[tag]);
+    }
+
+    // Older exports: infer them from the text
     const tags = [];
     // Ensure item.Description and item.Name are treated as strings even if null/undefined
     const description = (item.Description || '').toLowerCase();
@@ -1082,61 +1099,79 @@ const MainContent = ({ city, state }) => {
     const [isModalOpen, setIsModalOpen] = useState(false);
 
     useEffect(() => {
-        fetch('/food_opportunities_export.csv')
+        // Rows from CSV and binary files share the CSV headers
+        const toOpportunity = (item) => {
+            // Try to extract the city from the row
+            let itemCity = '';
+            if (item.City) {
+                itemCity = item.City.trim().toLowerCase();
+            } else if (item.Location) {
+                // Fallback: try to parse city name from address string
+                const parts = item.Location.split(',');
+                if (parts.length > 1) itemCity = parts[parts.length - 2].trim().toLowerCase();
+            }
+
+            return {
+                id: item.ID,
+                title: item.Name,
+                address: item.Location ? item.Location.replace(/"/g, '') : 'N/A',
+                details: item.Description ? item.Description.replace(/"/g, '') : 'No details provided.',
+                link: item.Link,
+                tags: getTagsFromData(item),
+                city: itemCity
+            };
+        };
+
+        const toOpportunities = (csvText) => {
+            const results = Papa.parse(csvText, { header: true, skipEmptyLines: true });
+            return (results.data || []).map(toOpportunity);
+        };
+
+        const fetchText = (url) => fetch(url).then(response => {
+            if (!response.ok) throw new Error("Network response was not ok");
+            return response.text();
+        });
+
+        // Binary shards are smaller and need no CSV parsing; CSV is the fallback
+        const loadShard = (shard) => shard.files.bin
+            ? fetch(`/shards/${shard.files.bin.path}`)
+                .then(response => {
+                    if (!response.ok) throw new Error("Network response was not ok");
+                    return response.arrayBuffer();
+                })
+                .then(buffer => decodeRecords(buffer).map(toOpportunity))
+            : fetchText(`/shards/${shard.files.csv.path}`).then(toOpportunities);
+
+        // Preferred: only this city's shard, found through the shard manifest
+        const loadCityShards = () => fetch('/shards/manifest.json')
             .then(response => {
-                if (!response.ok) throw new Error("Network response was not ok");
-                return response.text();
+                if (!response.ok) throw new Error("No shard manifest");
+                return response.json();
             })
-            .then(csvText => {
-                Papa.parse(csvText, {
-                    header: true,
-                    skipEmptyLines: true,
-                    complete: (results) => {
-                        if (results.data) {
-                            const formattedData = results.data.map(item => {
-                                // Try to extract the city from the CSV row
-                                let itemCity = '';
-                                if (item.City) {
-                                    itemCity = item.City.trim().toLowerCase();
-                                } else if (item.Location) {
-                                    // Fallback: try to parse city name from address string
-                                    const parts = item.Location.split(',');
-                                    if (parts.length > 1) itemCity = parts[parts.length - 2].trim().toLowerCase();
-                                }
-
-                                return {
-                                    id: item.ID,
-                                    title: item.Name,
-                                    address: item.Location ? item.Location.replace(/"/g, '') : 'N/A',
-                                    details: item.Description ? item.Description.replace(/"/g, '') : 'No details provided.',
-                                    link: item.Link,
-                                    tags: getTagsFromData(item),
-                                    city: itemCity
-                                };
-                            });
-
-                            // Filter by user’s city (case-insensitive)
-                            const filteredData = formattedData.filter(op =>
-                                op.city && op.city === city.toLowerCase()
-                            );
-
-                            setOpportunities(filteredData);
-                        } else {
-                            setOpportunities([]);
-                        }
-                        setIsLoading(false);
-                    },
-                    error: (error) => {
-                        console.error("Error parsing CSV:", error);
-                        setIsLoading(false);
-                    }
-                });
+            .then(manifest => {
+                const key = cityKey(city);
+                const shards = Object.values(manifest.shards).filter(shard =>
+                    shard.city_key === key && (!state || !shard.state || shard.state === state.toUpperCase())
+                );
+                return Promise.all(shards.map(loadShard));
             })
+            .then(results => results.flat());
+
+        // Fallback: the full export, filtered by the user's city (case-insensitive)
+        const loadFullExport = () => fetchText('/food_opportunities_export.csv')
+            .then(csvText => toOpportunities(csvText).filter(op =>
+                op.city && op.city === city.toLowerCase()
+            ));
+
+        setIsLoading(true);
+        loadCityShards()
+            .catch(loadFullExport)
+            .then(setOpportunities)
             .catch(error => {
                 console.error("Error fetching or parsing CSV:", error);
-                setIsLoading(false);
-            });
-    }, []); // The empty array [] means this effect runs once when the component mounts
+            })
+            .finally(() => setIsLoading(false));
+    }, [city, state]); // Refetch when the city changes
 
     // Function to handle the new opportunity submission from the modal
     const handleUpload = (dataFromModal) => {
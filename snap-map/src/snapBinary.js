@@ -0,0 +1,138 @@
+// --- Decoder for the backend's binary record format (backend/Database/binary_format.py) ---
+// Returns rows keyed like the CSV export headers, so they can go through the
+// same mapping as parsed CSV rows.
+
+const MAGIC = 'SNAP';
+const FORMAT_VERSION = 1;
+const FLAG_COORDINATES = 1;
+const HEADER_SIZE = 16;
+const COORDINATE_SCALE = 1e6;
+const MISSING_COORDINATE = -(2 ** 31);
+
+const TEXT_HEADERS = ['Name', 'Link', 'Location', 'Description'];
+const TIMESTAMP_HEADERS = ['Created At', 'Updated At'];
+const INTERNED_HEADERS = ['City', 'State', 'ZIP'];
+
+const utf8 = new TextDecoder('utf-8');
+
+const unzigzag = (value) => (value % 2 ? -(value + 1) / 2 : value / 2);
+
+// SQLite's "YYYY-MM-DD HH:MM:SS" (UTC) form
+const timestampText = (seconds) => new Date(seconds * 1000).toISOString().slice(0, 19).replace('T', ' ');
+
+export const decodeRecords = (buffer) => {
+    const bytes = new Uint8Array(buffer);
+    const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+    if (bytes.length < HEADER_SIZE || utf8.decode(bytes.subarray(0, 4)) !== MAGIC) {
+        throw new Error("Not a binary records file");
+    }
+    const version = view.getUint8(4);
+    if (version > FORMAT_VERSION) {
+        throw new Error(`Binary records version ${version} is newer than supported (${FORMAT_VERSION})`);
+    }
+    const flags = view.getUint8(5);
+    // Header: magic, version u8, flags u8, reserved u16, record count u32,
+    // string count u32 (number of interned strings, not their byte size)
+    const count = view.getUint32(8, true);
+    const stringCount = view.getUint32(12, true);
+
+    let position = HEADER_SIZE;
+    // Unsigned LEB128; plain arithmetic keeps values above 2^31 exact
+    const readVarint = () => {
+        let value = 0;
+        let scale = 1;
+        let byte;
+        do {
+            byte = bytes[position++];
+            value += (byte & 0x7f) * scale;
+            scale *= 128;
+        } while (byte >= 0x80);
+        return value;
+    };
+    const readText = (length) => {
+        const text = utf8.decode(bytes.subarray(position, position + length));
+        position += length;
+        return text;
+    };
+
+    const strings = [];
+    for (let i = 0; i < stringCount; i++) strings.push(readText(readVarint()));
+
+    const rows = [];
+    let id = 0;
+    for (let i = 0; i < count; i++) {
+        id += unzigzag(readVarint());
+        rows.push({ ID: String(id) });
+    }
+
+    for (const header of TEXT_HEADERS) {
+        const lengths = new Array(count);
+        let total = 0;
+        for (let i = 0; i < count; i++) {
+            lengths[i] = readVarint();
+            if (lengths[i]) total += lengths[i] - 1;
+        }
+        // One decode for the whole column; byte lengths are character
+        // offsets only when it is all ASCII, otherwise decode each value
+        const column = utf8.decode(bytes.subarray(position, position + total));
+        const ascii = column.length === total;
+        let offset = 0;
+        for (let i = 0; i < count; i++) {
+            if (!lengths[i]) {
+                rows[i][header] = null;
+                continue;
+            }
+            const length = lengths[i] - 1;
+            rows[i][header] = ascii ? column.slice(offset, offset + length) : readText(length);
+            offset += length;
+        }
+        if (ascii) position += total;
+    }
+
+    for (const header of TIMESTAMP_HEADERS) {
+        // Records imported together share timestamps, so reuse the last text
+        let seconds = 0;
+        let lastSeconds = null;
+        let lastText = null;
+        for (let i = 0; i < count; i++) {
+            const value = readVarint();
+            if (!value) {
+                rows[i][header] = null;
+                continue;
+            }
+            seconds += unzigzag(value - 1);
+            if (seconds !== lastSeconds) {
+                lastSeconds = seconds;
+                lastText = timestampText(seconds);
+            }
+            rows[i][header] = lastText;
+        }
+    }
+
+    for (const header of INTERNED_HEADERS) {
+        for (let i = 0; i < count; i++) {
+            const index = readVarint();
+            rows[i][header] = index ? strings[index - 1] : null;
+        }
+    }
+
+    for (let i = 0; i < count; i++) {
+        const tags = [];
+        for (let n = readVarint(); n > 0; n--) tags.push(strings[readVarint()]);
+        rows[i].Tags = tags.length ? tags.join(' ') : null;
+    }
+
+    for (const header of ['Latitude', 'Longitude']) {
+        for (let i = 0; i < count; i++) {
+            let value = null;
+            if (flags & FLAG_COORDINATES) {
+                const raw = view.getInt32(position, true);
+                position += 4;
+                if (raw !== MISSING_COORDINATE) value = raw / COORDINATE_SCALE;
+            }
+            rows[i][header] = value;
+        }
+    }
+
+    return rows;
+};